@@ -1,16 +1,74 @@
+import threading
+
 from RPi.viewer import viewer
 
-def input(*args,**kwargs):
-    pass
+OUT = 0
+IN = 1
+BOARD = 10
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+# scriptable input source: levels and edge callbacks of input ports
+_inputs = {}
+_callbacks = {}
+_edge = threading.Condition()
+
+
+def input(port):
+    if port in _inputs:
+        return _inputs[port]
+    return viewer.ports.get(port, 0)
 def output(port, value):
     viewer.set_port(port, int(value))
-def setup(port, state, initial=0):
-    viewer.add_port(port, initial)
+def setup(port, state, initial=0, pull_up_down=PUD_OFF):
+    if state == IN:
+        _inputs[port] = int(pull_up_down == PUD_UP)
+    else:
+        viewer.add_port(port, initial)
+def add_event_detect(port, edge, callback=None, bouncetime=None):
+    _callbacks[port] = edge, callback
+def remove_event_detect(port):
+    _callbacks.pop(port, None)
+def wait_for_edge(port, edge, timeout=None):
+    with _edge:
+        if _edge.wait(None if timeout is None else timeout / 1000):
+            return port
+    return None
+def set_input(port, value):
+    """Drive an input port, calling its edge callback if the level changes"""
+    value = int(value)
+    previous, _inputs[port] = _inputs.get(port, 0), value
+    if previous == value:
+        return
+    with _edge:
+        _edge.notify_all()
+    edge, callback = _callbacks.get(port, (None, None))
+    if callback is not None and edge in (BOTH, RISING if value else FALLING):
+        callback(port)
+def schedule_input(delay, port, value):
+    """Drive an input port after `delay` seconds
+
+    On the virtual time of the clock set with `set_clock` if it supports
+    scheduling, otherwise on a timer thread.
+    """
+    if hasattr(viewer.clock, "call_at"):
+        viewer.clock.call_at(viewer.clock.get_time() + delay, set_input, port, value)
+        return None
+    timer = threading.Timer(delay, set_input, (port, value))
+    timer.daemon = True
+    timer.start()
+    return timer
+def set_clock(clock, verbose=False):
+    """Timestamp the port timeline on `clock` instead of the wall clock"""
+    viewer.clock = clock
+    viewer.verbose = verbose
 def cleanup(*args,**kwargs):
-    pass
+    _callbacks.clear()
 def setmode(*args,**kwargs):
     pass
 def setwarnings(*args,**kwargs):
     pass
-OUT = None
-BOARD = None
\ No newline at end of file
@@ -1,15 +1,41 @@
 from datetime import datetime
 
+
 class Viewer:
+    """Records the state of simulated ports
+
+    Every port transition is appended to `timeline` as (time, port, value).
+    Times are read from `clock` if one is set (e.g. the TestClock of a test
+    run), otherwise they are wall-clock datetimes.  Transitions are printed
+    if `verbose` is set.
+    """
+
     def __init__(self):
         self.ports = {}
+        self.timeline = []
+        self.clock = None
+        self.verbose = True
+
     def add_port(self, port, initial=0):
         self.ports[port] = initial
+
     def set_port(self, port, value):
         self.ports[port] = value
-        self.print()
+        now = datetime.now() if self.clock is None else self.clock.get_time()
+        self.timeline.append((now, port, value))
+        if self.verbose:
+            self.print()
+
+    def transitions(self, port):
+        """(time, value) of each transition of a port"""
+        return [(t, value) for t, p, value in self.timeline if p == port]
+
+    def reset(self):
+        self.timeline.clear()
+
     def print(self):
         now = datetime.now()
         print(f"{now:%H:%M:%S}.{int(now.microsecond//1e3):03d}", self.ports)
 
-viewer = Viewer()
\ No newline at end of file
+
+viewer = Viewer()
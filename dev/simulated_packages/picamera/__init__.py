@@ -1,13 +1,204 @@
+import threading
+import time
+from collections import namedtuple
+
 from RPi.viewer import viewer
+
+
+class PiVideoFrameType:
+    frame = 0
+    key_frame = 1
+    sps_header = 2
+    motion_data = 3
+
+
+PiVideoFrame = namedtuple(
+    "PiVideoFrame",
+    "index frame_type frame_size video_size split_size timestamp complete position",
+)
+
+
+class PiCameraCircularIO:
+    """Simulated in-memory ring buffer of the last `seconds` of video
+
+    Keeps the frames written while it is the camera's output, with
+    positions relative to the start of the buffer, and trims whole frames
+    older than `seconds`.
+    """
+
+    def __init__(self, camera, size=None, seconds=None, bitrate=17000000, splitter_port=1):
+        self.camera = camera
+        self.seconds = seconds
+        self.lock = threading.RLock()
+        self.frames = []
+        self._data = bytearray()
+        self._pos = 0
+    def write(self, b):
+        with self.lock:
+            frame = self.camera.frame
+            self.frames.append(frame._replace(position=len(self._data)))
+            self._data += b
+            self._pos = len(self._data)
+            self._trim()
+        return len(b)
+    def _trim(self):
+        if self.seconds is None:
+            return
+        latest = max((f.timestamp for f in self.frames if f.timestamp is not None), default=None)
+        if latest is None:
+            return
+        cutoff = latest - self.seconds * 1e6
+        n = 0
+        while n < len(self.frames) and (self.frames[n].timestamp is None or self.frames[n].timestamp < cutoff):
+            n += 1
+        # keep the header of the first frame kept
+        while n > 0 and self.frames[n - 1].frame_type == PiVideoFrameType.sps_header:
+            n -= 1
+        if n == 0:
+            return
+        dropped = self.frames[n].position if n < len(self.frames) else len(self._data)
+        del self._data[:dropped]
+        self.frames = [f._replace(position=f.position - dropped) for f in self.frames[n:]]
+        self._pos = max(self._pos - dropped, 0)
+    def seek(self, offset, whence=0):
+        with self.lock:
+            if whence == 0:
+                self._pos = offset
+            elif whence == 1:
+                self._pos += offset
+            else:
+                self._pos = len(self._data) + offset
+            return self._pos
+    def tell(self):
+        return self._pos
+    def read(self, n=-1):
+        with self.lock:
+            end = len(self._data) if n < 0 else self._pos + n
+            data = bytes(self._data[self._pos:end])
+            self._pos += len(data)
+            return data
+    def flush(self):
+        pass
+    def close(self):
+        pass
+
+
 class PiCamera:
+    """Simulated camera writing synthetic h264-like frames
+
+    While recording, frames are generated at `framerate` with an SPS header
+    before every `intra_period`th frame and when a key frame is requested.
+    Like the hardware encoder, a requested key frame is inserted
+    asynchronously, `key_frame_delay` frames after the request.
+    As with picamera, `timestamp` is the camera clock in microseconds, which
+    counts from the camera's boot (`uptime` seconds before this camera is
+    created) and runs `drift` faster than real time (e.g. 1e-4 for 100 ppm),
+    and frame timestamps are relative to the start of the
+    recording unless `clock_mode` is "raw".  If the viewer has a
+    clock with virtual time (see RPi.GPIO.set_clock), frames are generated
+    on that clock as it advances, otherwise on a thread in real time.
+    """
+
+    frame_nbytes = 1000
+    uptime = 100
+    drift = 0
+    key_frame_delay = 0
+
     def __init__(self):
         self.recording = False
+        self.frame = None
+        self.resolution = (1280, 720)
+        self.framerate = 30
+        self.clock_mode = 'reset'
+        self._start = time.perf_counter()
+        self._output = None
+        self._close_output = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._key_at = None
         viewer.add_port('camera', 0)
-    def start_recording(self, *args, **kwargs): 
+    @property
+    def _virtual(self):
+        return hasattr(viewer.clock, 'call_at')
+    @property
+    def timestamp(self):
+        if self._virtual:
+            elapsed = viewer.clock.get_time()
+        else:
+            elapsed = time.perf_counter() - self._start
+        return round((elapsed * (1 + self.drift) + self.uptime) * 1e6)
+    def start_recording(self, output, format=None, intra_period=None, **kwargs):
+        if isinstance(output, str):
+            output = open(output, 'wb')
+            self._close_output = True
+        self._output = output
+        self._position = 0
+        self._index = 0
+        self._key_at = None
+        self._intra_period = intra_period or self.framerate
+        self._recording_start = 0 if self.clock_mode == 'raw' else self.timestamp
         self.recording = True
         viewer.set_port('camera', 1)
-    def stop_recording(self, *args, **kwargs): 
+        self._recording_id = getattr(self, '_recording_id', 0) + 1
+        if self._virtual:
+            viewer.clock.call_at(
+                viewer.clock.get_time(), self._next_virtual_frame, self._recording_id
+            )
+        else:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+    def _write(self, frame_type, complete, nbytes):
+        self.frame = PiVideoFrame(
+            self._index, frame_type, nbytes, self._position, 0,
+            None
+            if frame_type == PiVideoFrameType.sps_header
+            else self.timestamp - self._recording_start,
+            complete, self._position,
+        )
+        self._output.write(bytes([frame_type]) * nbytes)
+        self._position += nbytes
+    def _write_frame(self):
+        key_requested = self._key_at is not None and self._index >= self._key_at
+        if key_requested or self._index % self._intra_period == 0:
+            self._key_at = None
+            self._write(PiVideoFrameType.sps_header, False, 20)
+            self._write(PiVideoFrameType.key_frame, True, self.frame_nbytes)
+        else:
+            self._write(PiVideoFrameType.frame, True, self.frame_nbytes)
+        self._index += 1
+    def _next_virtual_frame(self, recording_id):
+        if not self.recording or recording_id != self._recording_id:
+            return
+        self._write_frame()
+        viewer.clock.call_at(
+            viewer.clock.get_time() + 1 / self.framerate,
+            self._next_virtual_frame,
+            recording_id,
+        )
+    def _run(self):
+        next_frame = time.perf_counter()
+        while not self._stop.is_set():
+            self._write_frame()
+            next_frame += 1 / self.framerate
+            self._stop.wait(max(next_frame - time.perf_counter(), 0))
+    def request_key_frame(self):
+        self._key_at = self._index + self.key_frame_delay
+    def stop_recording(self, *args, **kwargs):
         self.recording = False
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._close_output:
+            self._output.close()
+            self._close_output = False
         viewer.set_port('camera', 0)
-    def close(self, *args, **kwargs): 
-        pass
\ No newline at end of file
+    def wait_recording(self, timeout=0, *args, **kwargs):
+        # advance virtual time instead of sleeping during test runs
+        if self._virtual:
+            viewer.clock.advance_time(timeout)
+        else:
+            time.sleep(timeout)
+    def close(self, *args, **kwargs):
+        pass
@@ -3,8 +3,7 @@ import random
 import re
 import sys
 import time
-import warnings
-from collections import ChainMap, Counter
+from collections import ChainMap, Counter, deque
 from itertools import cycle
 from pathlib import Path
 
@@ -16,14 +15,21 @@ import marmtouch.util as util
 from marmtouch import __version__
 from marmtouch.experiments.mixins.artist import ArtistMixin
 from marmtouch.experiments.mixins.block import BlockManagerMixin
+from marmtouch.experiments.util.audio import AudioOutput, AudioStream
+from marmtouch.experiments.util.cache import LRUCache, stimulus_nbytes
 from marmtouch.experiments.util.clock import Clock
 from marmtouch.experiments.util.events import (
+    GPIO_EDGE,
     EventHandler,
     get_first_tap,
     was_tapped,
 )
 from marmtouch.experiments.util.generate_auditory_stimuli import generate_sine_wave_snd
+from marmtouch.experiments.util.journal import EventJournal
 from marmtouch.experiments.util.parse_items import parse_item, parse_items
+from marmtouch.experiments.util.prefetch import StimulusPrefetcher
+from marmtouch.util.barcode import barcode_pulses
+from marmtouch.util.camera import get_recorder
 from marmtouch.util.svg2img import svg2img
 
 
@@ -34,19 +40,39 @@ class Experiment(ArtistMixin, BlockManagerMixin):
     ----------
     data_dir: Path or path-like, required
         Directory where all data is written to
-        Includes: behaviour.csv, events.yaml, marmtouch.log and videos if camera=True
+        Includes: behaviour.csv, events.jsonl, marmtouch.log and videos if camera=True
+        Events are journaled to events.tmp.jsonl while the session is running
+        and sealed to events.jsonl on exit
     params: dict, required
         All parameters for the experiment.
         Must contain 'timing', 'items', 'conditions' and 'background' fields
         Optionally may include 'options', 'reward' to overwrite default settings
+        Optionally may include 'journal' to configure the event journal
+        (max_pending, flush_interval, fsync), see EventJournal
+        Optionally may include 'stimulus_cache' to set the memory budget of
+        decoded images and sounds in bytes (max_bytes, default 64 MiB)
+        Optionally may include 'prefetch' to set how many upcoming trials have
+        their stimuli loaded during the intertrial interval (n_trials, default 1)
+        Optionally may include 'sync' to send the trial number as a barcode on
+        the sync pin (mode: barcode, n_bits, unit), see `send_sync`
+        Optionally may include 'audio' to configure the mixer (frequency, size,
+        channels, buffer, n_channels) and the measured device latency
+        (output_latency), see AudioOutput
         May be further extended in subclasses
     TTLout: dict, default=None
         Dictionary of TTL output pins
         Must define 'reward' and 'sync' pins
         If None, will use default pins defined in Experiment.DEFAULT_TTL_OUT
+        TTL inputs (e.g. lick sensors, external triggers) are defined in the
+        'ttl_in' params as name: pin or name: {port, pull, bouncetime}.
+        Their edges are returned by parse_events as "gpio_edge" events.
     camera: bool, default=None
         If True, initialize camera and record videos
         If None, will be set to system_config['has_camera']
+        Recording is configured in the 'camera_config' params (mode:
+        trial, continuous or buffer, resolution, framerate, options of the
+        recorder and options passed to start_recording), see
+        marmtouch.util.camera
     camera_preview: bool, default=False
         If True, show camera preview window
         WARNING: This can overload the GPU and cause the system to crash
@@ -74,14 +100,17 @@ class Experiment(ArtistMixin, BlockManagerMixin):
     keys = ["trial", "trial_start_time", "condition"]
     sep = ","
     info_background = (0, 0, 0)
-    _image_cache_max_len = 20
-    _audio_tracks_cache_max_len = 20
+    _stimulus_cache_max_bytes = 64 * 2**20
+    _event_history_len = 1000
+    _shape_cache_max_len = 64
     default_system_config_path = "/home/pi/marmtouch_system_config.yaml"
     default_info_screen_spec = dict(
         size=(350, 800),
         loc=(0, 0),
     )
     default_screen_size = 1200, 800
+    default_refresh_rate = 60
+    sync_pulse_duration = 0.1
     start_duration = 1e4
     start_stimulus = dict(
         type="circle",
@@ -135,8 +164,8 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         self.data_dir = data_dir
         self.behdata_path = self.data_dir / "behaviour.csv"
         self.logger_path = self.data_dir / "marmtouch.log"
-        self.events_path = self.data_dir / "events.yaml"
-        self.temp_events_path = self.data_dir / "events.tmp.yaml"
+        self.events_path = self.data_dir / "events.jsonl"
+        self.temp_events_path = self.data_dir / "events.tmp.jsonl"
         self.params_path = self.data_dir / "params.yaml"
 
         with open(self.params_path.as_posix(), "w") as f:
@@ -152,15 +181,38 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         if camera is None:
             camera = params.get("has_camera", True)
         if camera:
-            self.camera = util.setup_camera()
+            camera_config = dict(params.get("camera_config", {}))
+            self.camera = util.setup_camera(
+                camera_config.pop("resolution", None),
+                camera_config.pop("framerate", None),
+            )
+            self.recorder = get_recorder(
+                self.camera,
+                self.data_dir,
+                outcome_key=self.outcome_key,
+                **camera_config,
+            )
         else:
             self.camera = None
+            self.recorder = None
         self.fullscreen = fullscreen
+        self.vsync = False
 
         # Set up TTL outputs
         if TTLout is None:
             TTLout = params.get("ttl", self.DEFAULT_TTL_OUT)
-        self.TTLout = {k: util.TTL(v) for k, v in TTLout.items()}
+        self.pulse_engine = util.PulseEngine(on_edge=self._record_ttl_edge)
+        self.TTLout = {
+            k: util.TTL(v, engine=self.pulse_engine, name=k)
+            for k, v in TTLout.items()
+        }
+
+        # Set up TTL inputs
+        self.TTLin = {}
+        for k, v in params.get("ttl_in", {}).items():
+            if not isinstance(v, dict):
+                v = dict(port=v)
+            self.TTLin[k] = util.TTLInput(name=k, **v)
 
         self.screen_config = params.get("screen_config", {})
         self.info_screen_spec = self.screen_config.get(
@@ -168,6 +220,9 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         )
         self.transform = self.screen_config.get("transform", None)
         self.screen_size = self.screen_config.get("size", self.default_screen_size)
+        self.frame_period = 1 / self.screen_config.get(
+            "refresh_rate", self.default_refresh_rate
+        )
 
         self.params = params
         self.timing = params["timing"]
@@ -180,8 +235,15 @@ class Experiment(ArtistMixin, BlockManagerMixin):
             self.options.get("start_stimulus", self.start_stimulus), self.transform
         )
         self.start_duration = self.options.get("start_duration", self.start_duration)
-        self.images = {}
-        self.audio_tracks = {}
+        self.stimulus_cache = LRUCache(
+            max_bytes=params.get("stimulus_cache", {}).get(
+                "max_bytes", self._stimulus_cache_max_bytes
+            ),
+            sizeof=stimulus_nbytes,
+        )
+        self.shape_cache = LRUCache(self._shape_cache_max_len)
+        self.prefetcher = StimulusPrefetcher(self.stimulus_cache)
+        self.audio = AudioOutput(**params.get("audio", {}))
 
         self.trial = None
         blocks = params.get("blocks")
@@ -199,7 +261,14 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         self.condition_list = []
 
         self.behdata = []
-        self.events = []
+        self.events = deque(maxlen=self._event_history_len)
+        self.journal = EventJournal(self.temp_events_path, **params.get("journal", {}))
+        self.clock = None
+        self.event_manager = None
+        self._drawn_rects = []
+        self._dirty_rects = []
+        self._info_dirty = True
+        self._full_update = True
 
         self.logger.info(
             f"experiment initialized using marmtouch version {__version__}"
@@ -210,9 +279,83 @@ class Experiment(ArtistMixin, BlockManagerMixin):
 
         Pulses on `reward` pin as defined in `TTLout`
         Pulse parameters are defined in `config.reward`
+        The pulses are sent by the pulse engine, so this returns immediately.
         """
         self.TTLout["reward"].pulse(**self.reward)
 
+    def send_sync(self, trial):
+        """Send the trial sync signal on the `sync` pin
+
+        By default a single pulse is sent.  If `sync.mode` is "barcode" in
+        the params, the trial number (modulo 2**n_bits) is sent as a barcode,
+        see `marmtouch.util.barcode`.
+
+        A `trial_start` record with the trial number and sync onset is
+        journaled, marking where the trial begins in the event journal.
+
+        Parameters
+        ----------
+        trial: int
+            Trial number
+
+        Returns
+        -------
+        onset: float
+            Scheduled time of the first rising edge on the experiment clock
+        """
+        sync = self.params.get("sync", {})
+        if sync.get("mode", "pulse") != "barcode":
+            onset = self.TTLout["sync"].pulse(self.sync_pulse_duration)
+        else:
+            n_bits = sync.get("n_bits", 16)
+            pulses = barcode_pulses(trial % 2**n_bits, n_bits, sync.get("unit", 0.005))
+            _, duration = pulses[0]
+            onset = self.TTLout["sync"].pulse(duration)
+            for offset, duration in pulses[1:]:
+                self.TTLout["sync"].pulse(duration, at=onset + offset)
+        self._record_event(
+            dict(type="trial_start", trial=trial, time=self.clock.get_time(), sync_onset=onset)
+        )
+        return onset
+
+    @staticmethod
+    def _post_gpio_edge(record):
+        """Post an input edge to the event queue, called on the GPIO thread"""
+        pygame.event.post(pygame.event.Event(GPIO_EDGE, record=record))
+
+    def start_trial_recording(self, trial):
+        """Start recording the camera for a trial, if there is a camera
+
+        The camera clock offset estimated by the recorder for the trial is
+        journaled as a `camera_clock` record.
+        """
+        if self.recorder is not None:
+            self.recorder.start_trial(trial)
+            if self.recorder.offset is not None:
+                self._record_event(
+                    dict(
+                        type="camera_clock",
+                        trial=trial,
+                        time=self.clock.get_time(),
+                        offset=self.recorder.offset,
+                    )
+                )
+
+    def end_trial_recording(self):
+        """Stop recording the camera for the current trial, if there is a camera"""
+        if self.recorder is not None:
+            self.recorder.end_trial(self.trial)
+
+    def _record_event(self, record):
+        """Record a single event outside of the event stacks of the task loop"""
+        self.events.append(record)
+        if self.journal.is_open:
+            self.journal.write([record])
+
+    def _record_ttl_edge(self, record):
+        """Record an edge sent by the pulse engine, called on its thread"""
+        self._record_event(record)
+
     def get_duration(self, name):
         """Get NAME duration
 
@@ -265,11 +408,21 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         Cleans up GPIO, stops and closes camera, saves behavioural and event data, and closes pygame window.
         """
         self.logger.info("graceful exit triggered")
+        if self.event_manager is not None:
+            self.logger.info(
+                f"Event wait lateness: {self.event_manager.lateness_summary()}"
+            )
+        for ttl_in in self.TTLin.values():
+            ttl_in.stop()
+        self.pulse_engine.close()
+        self.logger.info(
+            f"TTL edges: {self.pulse_engine.n_edges}, "
+            f"max lateness {self.pulse_engine.max_lateness:.6f} s"
+        )
         GPIO.cleanup()
         self.logger.info("GPIO cleaned up")
         if self.camera is not None:
-            if self.camera.recording:
-                self.camera.stop_recording()
+            self.recorder.close()
             if self.camera_preview:
                 self.camera.stop_preview()
             self.camera.close()
@@ -277,17 +430,21 @@ class Experiment(ArtistMixin, BlockManagerMixin):
 
         self.dump_trialdata()
         self.logger.info("Behavioural data dumped.")
-        with open(self.events_path.as_posix(), "w") as f:
-            yaml.dump(self.events, f)
-        self.logger.info(f"Event data dumped. {len(self.events)} total records.")
-        if self.events_path.stat().st_size == 0:
-            warnings.warn("Event data did not save to disk. Keeping temp file.")
-        else:
-            self.logger.info("Event data saved properly.  Removing temp file.")
-            if self.temp_events_path.exists():
-                self.temp_events_path.unlink()
-            else:
-                warnings.warn("Temp file not found.")
+        self.prefetcher.close()
+        self.logger.info(f"Stimulus prefetch: {self.prefetcher.stats}")
+        self.logger.info(f"Stimulus cache: {self.stimulus_cache.stats}")
+        self.logger.info(f"Shape cache: {self.shape_cache.stats}")
+        if self.journal.path != self.events_path:
+            if self.journal.is_open:
+                self.journal.write([self.clock.anchor()])
+            self.journal.seal(self.events_path)
+            self.logger.info(
+                f"Event data sealed. {self.journal.n_records} total records."
+            )
+            if self.journal.n_stalls:
+                self.logger.warning(
+                    f"Event journal buffer was full {self.journal.n_stalls} times."
+                )
         self.running = False
         pygame.mixer.quit()
         pygame.quit()
@@ -311,6 +468,7 @@ class Experiment(ArtistMixin, BlockManagerMixin):
 
     def initialize(self):
         """Initialize experiment"""
+        self.audio.pre_init()
         pygame.init()
         if not self.debug_mode:
             util.setup_screen()
@@ -318,10 +476,8 @@ class Experiment(ArtistMixin, BlockManagerMixin):
             pygame.mouse.set_cursor(
                 (8, 8), (0, 0), (0, 0, 0, 0, 0, 0, 0, 0), (0, 0, 0, 0, 0, 0, 0, 0)
             )
-        if self.fullscreen:
-            self.screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
-        else:
-            self.screen = pygame.display.set_mode(self.screen_size)
+        self.screen = self._set_display_mode()
+        self._full_update = True
         self.info = {}
         self.info_screen = pygame.Surface(self.info_screen_spec["size"])
         self.screen.fill(self.background)
@@ -345,11 +501,123 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         session_label_rotation = session_label.get('rotation', 90)
         self.session_txt = pygame.transform.rotate(session_txt, session_label_rotation)
         self.session_txt_rect = self.session_txt.get_rect(bottomleft=session_label_bottom_left)
-        pygame.mixer.init()
+        self.audio.init(self.get_audio_roles())
+        self.generate_tones()
 
         self.clock = Clock()
         self.clock.start()
+        self.pulse_engine.clock = self.clock
+        if self.recorder is not None:
+            self.recorder.clock = self.clock
+            self.recorder.start_session()
+        self.journal.open()
         self.event_manager = EventHandler(self, self.clock)
+        self.event_manager.restrict_event_types()
+        for ttl_in in self.TTLin.values():
+            ttl_in.start(self._post_gpio_edge, self.clock)
+
+    def _set_display_mode(self):
+        """Open the display, synced to vblank if `screen_config.vsync` is set
+
+        vsync needs a SCALED display, which is opened at the screen size and
+        scaled to the desktop in fullscreen.  Falls back to an unsynced
+        display if vsync is not supported.
+        """
+        if self.fullscreen:
+            size, flags = (0, 0), pygame.FULLSCREEN
+        else:
+            size, flags = self.screen_size, 0
+        if self.screen_config.get("vsync", False):
+            try:
+                # SCALED displays cannot be 0 sized
+                screen = pygame.display.set_mode(
+                    self.screen_size, flags | pygame.SCALED, vsync=1
+                )
+            except pygame.error as err:
+                self.logger.warning(f"vsync is not supported, running without: {err}")
+            else:
+                self.vsync = True
+                return screen
+        return pygame.display.set_mode(size, flags)
+
+    def _get_cached_stimulus(self, key, load, *args):
+        """Get a decoded stimulus from the stimulus cache, loading it on a miss
+
+        Parameters
+        ----------
+        key: tuple
+            Full render spec of the stimulus, used as the cache key
+        load: callable
+            Called with `args` to load the stimulus if it is not cached
+        """
+        stimulus = self.stimulus_cache.get(key)
+        if stimulus is None:
+            stimulus = self.prefetcher.take(key)
+            if stimulus is None:
+                stimulus = load(*args)
+            self.stimulus_cache.put(key, stimulus)
+        return stimulus
+
+    def _stimulus_loader(self, type_, path=None, colour=None, size=None, **params):
+        """Cache key and loader of a stimulus
+
+        Returns
+        -------
+        loader: tuple or None
+            (key, load, *args) as taken by `_get_cached_stimulus`, or None if
+            stimuli of this type are not loaded from file
+        """
+        if type_ == "image":
+            return self._stimulus_key(type_, path), self._load_image, path
+        elif type_ == "svg":
+            key = self._stimulus_key(type_, path, colour, size)
+            return key, self._load_svg, path, colour, size
+        elif type_ == "audio":
+            if self._streams_audio(path, params.get("stream")):
+                return None
+            return self._stimulus_key(type_, path), self._load_audio, path
+        elif type_ == "pure_tone":
+            if "freq" not in params:
+                raise ValueError("Must provide frequency for pure tone stimuli")
+            spec = (
+                params["freq"],
+                params.get("maxtime", 5),
+                params.get("sample_rate", pygame.mixer.get_init()[0]),
+                params.get("amplitude", 4096),
+                params.get("ramp", 0),
+            )
+            return (type_,) + spec, generate_sine_wave_snd, *spec
+        return None
+
+    @staticmethod
+    def _load_image(path):
+        return pygame.image.load(path).convert_alpha()
+
+    @staticmethod
+    def _load_svg(path, colour, size):
+        return svg2img(path, colour=colour, size=size)
+
+    @staticmethod
+    def _load_audio(path):
+        return pygame.mixer.Sound(path)
+
+    def _streams_audio(self, path, stream=None):
+        """Whether an audio file is streamed rather than loaded into memory
+
+        Files are streamed if `stream` is set, or if it is None and the file
+        is a WAV file larger than the `stream_threshold` of the audio params.
+        """
+        if stream is not None:
+            return stream
+        return (
+            Path(path).suffix.lower() == ".wav"
+            and os.path.getsize(path) > self.audio.stream_threshold
+        )
+
+    @staticmethod
+    def _stimulus_key(type_, path, *spec):
+        spec = tuple(tuple(v) if isinstance(v, list) else v for v in spec)
+        return (type_, str(path)) + spec
 
     def get_image_stimulus(self, path, **params):
         """Get image stimulus
@@ -367,15 +635,9 @@ class Experiment(ArtistMixin, BlockManagerMixin):
             Stimulus parameters with image data in `image` key
         """
         params["type"] = "image"
-        image = self.images.get(path)
-        if image is None:
-            self.images[path] = params["image"] = pygame.image.load(
-                path
-            ).convert_alpha()
-            if len(self.images) > self._image_cache_max_len:
-                self.images.pop(list(self.images.keys())[0])
-        else:
-            params["image"] = image
+        params["image"] = self._get_cached_stimulus(
+            *self._stimulus_loader("image", path)
+        )
         return params
 
     def get_svg_stimulus(self, path, **params):
@@ -396,21 +658,16 @@ class Experiment(ArtistMixin, BlockManagerMixin):
             Stimulus parameters with image data in `image` key
         """
         params["type"] = "svg"
-        image = self.images.get(path)
-        if image is None:
-            self.images[path] = params["image"] = svg2img(
-                path, colour=params["colour"], size=params["size"]
-            )
-            if len(self.images) > self._image_cache_max_len:
-                self.images.pop(list(self.images.keys())[0])
-        else:
-            params["image"] = image
+        params["image"] = self._get_cached_stimulus(
+            *self._stimulus_loader("svg", path, params["colour"], params["size"])
+        )
         return params
 
     def get_audio_stimulus(self, path, **params):
         """Get audio stimulus
 
-        Load an audio file
+        Load an audio file.  Long WAV files, or files with `stream` set in
+        their parameters, are streamed from disk during playback instead.
 
         Parameters
         ----------
@@ -422,57 +679,114 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         Returns
         -------
         params: dict
-            Stimulus parameters with audio data in `audio` key
+            Stimulus parameters with audio data in `sound` key
         """
         params["type"] = "audio"
-        audio = self.audio_tracks.get(path)
-        if audio is None:
-            self.audio_tracks[path] = params["sound"] = pygame.mixer.Sound(path)
-            if len(self.audio_tracks) > self._audio_tracks_cache_max_len:
-                self.audio_tracks.pop(list(self.audio_tracks.keys())[0])
+        loader = self._stimulus_loader("audio", path, **params)
+        if loader is None:
+            params["sound"] = AudioStream(path)
         else:
-            params["sound"] = audio
+            params["sound"] = self._get_cached_stimulus(*loader)
         return params
 
     def get_pure_tone_stimulus(self, **params):
         """Get pure tone stimulus
 
-        Load parameters for a pure tone stimulus and generate it
+        Load parameters for a pure tone stimulus and generate it.  Tones are
+        cached by frequency, duration, sample rate, amplitude and ramp.
 
         Parameters
         ----------
+        params: dict
+            Dictionary of parameters for the stimulus.  Must contain `freq`,
+            may contain `maxtime` (s), `sample_rate`, `amplitude` and `ramp` (s)
 
+        Returns
+        -------
+        params: dict
+            Stimulus parameters with audio data in `sound` key
         """
-        if "freq" not in params:
-            raise ValueError("Must provide frequency for pure tone stimuli")
         params["maxtime"] = params.get("maxtime", 5)
-        params["sound"] = generate_sine_wave_snd(params["freq"], params["maxtime"])
+        params["sound"] = self._get_cached_stimulus(
+            *self._stimulus_loader("pure_tone", **params)
+        )
         return params
 
-    def get_item(self, item_key=None, **params):
-        """Get item parameters
+    def get_audio_roles(self):
+        """Get the roles of the auditory items in the config
 
-        Get the item parameters using config file and parameters passed to the
-        function. If the item is an image, load the image and add it to the
-        image cache.  SVG files are rasterized using the colour and size
-        parameters.
+        The role of an item is its `channel` field if set, otherwise its name.
+        Each role gets its own reserved mixer channel.  Items that are not
+        defined in the config, e.g. a DMS itemfile, have no auditory roles.
+        """
+        if not isinstance(self.items, dict):
+            return []
+        return list(dict.fromkeys(
+            item.get("channel", name)
+            for name, item in self.items.items()
+            if isinstance(item, dict) and item.get("type") in ["audio", "pure_tone"]
+        ))
 
-        Note that item parameters in the file take priority over run-time options
+    def play_sound(self, params):
+        """Play an auditory stimulus and record its estimated onset
+
+        The sound plays on the channel reserved for its role.  The play is
+        recorded in the event journal with the estimated onset latency, so
+        auditory RTs can be corrected.
 
         Parameters
         ----------
-        item_key: str, default None
-            Item key
         params: dict
-            Dictionary of parameters for the stimulus
+            Stimulus parameters with audio data in `sound` key
 
         Returns
         -------
-        params: dict
-            Stimulus parameters
+        onset: float or None
+            Estimated time on the experiment clock the sound reaches the
+            speaker, or None if the clock has not been started
+        """
+        role = params.get("channel", params.get("name"))
+        latency = self.audio.play(
+            params["sound"],
+            role,
+            loops=params.get("loop", 1) - 1,
+            maxtime=params.get("maxtime", 0),
+        )
+        if self.clock is None:
+            return None
+        play_time = self.clock.get_time()
+        onset = play_time + latency
+        self.event_manager.dump_events(
+            [
+                dict(
+                    type="audio_play",
+                    name=params.get("name"),
+                    role=role,
+                    time=play_time,
+                    latency=latency,
+                    onset=onset,
+                )
+            ]
+        )
+        return onset
+
+    def generate_tones(self):
+        """Generate the pure tones defined in the config ahead of the first trial"""
+        if not isinstance(self.items, dict):
+            return
+        for item in self.items.values():
+            if isinstance(item, dict) and item.get("type") == "pure_tone":
+                self.get_pure_tone_stimulus(**item)
+
+    def _resolve_item(self, item_key=None, **params):
+        """Resolve item parameters from the config without loading the item
+
+        See `get_item` for parameters.  The condition definition passed as
+        `item_key` is not modified.
         """
         # If the conditions field contains a dict use that
         if isinstance(item_key, dict):
+            item_key = dict(item_key)
             params.update(item_key)
 
             # if there is a name, this is a partial description
@@ -483,6 +797,31 @@ class Experiment(ArtistMixin, BlockManagerMixin):
             # some item definition is provided in items, use this
             params.update(self.items[item_key])
             params["name"] = item_key
+        return params
+
+    def get_item(self, item_key=None, **params):
+        """Get item parameters
+
+        Get the item parameters using config file and parameters passed to the
+        function. If the item is an image, load the image and add it to the
+        image cache.  SVG files are rasterized using the colour and size
+        parameters.
+
+        Note that item parameters in the file take priority over run-time options
+
+        Parameters
+        ----------
+        item_key: str, default None
+            Item key
+        params: dict
+            Dictionary of parameters for the stimulus
+
+        Returns
+        -------
+        params: dict
+            Stimulus parameters
+        """
+        params = self._resolve_item(item_key, **params)
 
         if params["type"] == "random-choice":
             choices = params.pop('choices')
@@ -501,22 +840,139 @@ class Experiment(ArtistMixin, BlockManagerMixin):
 
         return params
 
-    def flip(self):
-        """Updates the screen"""
-        self.info_screen_rect = self.screen.blit(
-            self.info_screen, self.info_screen_spec["loc"]
+    def flip(self, at=None, label=None):
+        """Updates the screen
+
+        Only the regions marked dirty by drawing and clearing since the last
+        flip are sent to the display.  The info screen is only re-blitted when
+        `update_info` changed it or a dirty region overlaps it.
+
+        The clock is read before and after the display update and the flip is
+        recorded in the event journal.  If vsync is enabled, the update returns
+        once the frame has been presented.
+
+        Parameters
+        ----------
+        at: float, default None
+            Time on the experiment clock the update should land at.  With
+            vsync, the update lands on the frame boundary nearest to `at`.
+            If None, the screen is updated immediately.
+        label: str, default None
+            Label recorded with the flip, e.g. the name of the phase
+
+        Returns
+        -------
+        onset: float or None
+            Time on the experiment clock when the update completed, or None if
+            the clock has not been started
+        """
+        if at is not None and self.clock is not None:
+            self.clock.sleep_until(at - (self.frame_period / 2 if self.vsync else 0))
+        if (
+            self._info_dirty
+            or self._full_update
+            or self.info_screen_rect.collidelist(self._dirty_rects) != -1
+        ):
+            self.info_screen_rect = self.screen.blit(
+                self.info_screen, self.info_screen_spec["loc"]
+            )
+            self._dirty_rects.append(self.info_screen_rect)
+            self._info_dirty = False
+        rects = None if self._full_update else self._dirty_rects
+        self._dirty_rects = []
+        self._full_update = False
+        if self.clock is None:
+            pygame.display.update(rects)
+            return None
+        request = self.clock.get_time()
+        pygame.display.update(rects)
+        onset = self.clock.get_time()
+        self.event_manager.dump_events(
+            [dict(type="flip", label=label, request=request, time=onset)]
         )
-        pygame.display.update()
+        return onset
+
+    def _record_onsets(self, **results):
+        """Record phase onsets in the trial record
+
+        Parameters
+        ----------
+        results: dict
+            Phase results keyed by phase name. The `onset` of each result is
+            stored as `{phase}_onset`, relative to the trial start time.  The
+            estimated onset of a sound played in the phase, `audio_onset`, is
+            stored as `{phase}_audio_onset`.
+        """
+        for phase, result in results.items():
+            if result is None:
+                continue
+            for key in ["onset", "audio_onset"]:
+                if result.get(key) is not None:
+                    self.trial.data[f"{phase}_{key}"] = (
+                        result[key] - self.trial.data["trial_start_time"]
+                    )
+
+    def get_prefetch_items(self, condition, offset=0):
+        """Get the items of a condition that can be loaded ahead of time
+
+        Item keys and item definitions are collected from the condition
+        definition, including lists such as distractors.  Subclasses whose
+        stimuli are not fully defined by the condition may override this.
+
+        Parameters
+        ----------
+        condition: str
+            Condition name
+        offset: int, default 0
+            Number of trials between the next trial and the trial the condition
+            will be run in
+
+        Returns
+        -------
+        items: list of dict
+            Resolved item parameters
+        """
+        items = []
+
+        def collect(value):
+            if isinstance(value, list):
+                for v in value:
+                    collect(v)
+            elif isinstance(value, dict) and ("name" in value or "type" in value):
+                items.append(self._resolve_item(value))
+            elif isinstance(value, str) and value in self.items:
+                items.append(self._resolve_item(value))
+
+        for value in self.conditions[condition].values():
+            collect(value)
+        return items
+
+    def prefetch_upcoming(self):
+        """Start loading the stimuli of the upcoming trials
+
+        Stimuli of the next `prefetch.n_trials` conditions in the condition
+        list are loaded on the prefetch thread.
+        """
+        self.prefetcher.next_trial()
+        self.prefetcher.collect()
+        n_trials = self.params.get("prefetch", {}).get("n_trials", 1)
+        for offset, condition in enumerate(self.condition_list[:n_trials]):
+            for params in self.get_prefetch_items(condition, offset):
+                loader = self._stimulus_loader(params.pop("type", None), **params)
+                if loader is not None:
+                    self.prefetcher.prefetch(*loader)
 
     def _run_intertrial_interval(self, default_duration=5):
         """Run intertrial interval
 
+        Stimuli of the upcoming trials are prefetched while waiting.
+
         Parameters
         ----------
         default_duration: int, default 5
             Default duration of intertrial interval
         """
-
+        self.prefetch_upcoming()
         self.clock.wait(self.options.get("iti", default_duration))
         while self.running and self.clock.waiting():
             self.event_manager.parse_events()
@@ -532,14 +988,15 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         -------
         info : dict or None
             Dictionary of information about the trial start, or None if the
-            trial was aborted
+            trial was aborted.  `onset` and `offset` hold the clock times the
+            start stimulus appeared and was removed.
         """
-        self.screen.fill(self.background)
+        self.clear_screen()
         self.draw_stimulus(**self.start_stimulus)
-        self.flip()
+        onset = self.flip(label="start_stimulus")
 
         info = {"touch": 0, "RT": 0}
-        self.clock.wait(self.start_duration)
+        self.clock.wait(self.start_duration, start=onset)
         while self.running and self.clock.waiting():
             tap = get_first_tap(self.event_manager.parse_events())
             if tap is not None:
@@ -556,8 +1013,9 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         else:
             return None
 
-        self.screen.fill(self.background)
-        self.flip()
+        self.clear_screen()
+        info["onset"] = onset
+        info["offset"] = self.flip(label="start_stimulus_offset")
 
         info["start_stimulus_delay"] = self._compute_duration(
             self.options.get("start_stimulus_delay", 0)
@@ -604,6 +1062,7 @@ class Experiment(ArtistMixin, BlockManagerMixin):
             self.info_screen.blit(txt, (idx * info_font_size + start_height, 30))
 
         self.info_screen.blit(self.session_txt, self.session_txt_rect)
+        self._info_dirty = True
 
         self.flip()
 
@@ -633,8 +1092,10 @@ class Experiment(ArtistMixin, BlockManagerMixin):
 
     def initialize_test(self):
         # test initialisation
+        self.audio.pre_init()
         pygame.init()
         self.screen = pygame.display.set_mode(self.screen_size)
+        self._full_update = True
         self.info = {}
         self.info_screen = pygame.Surface(self.info_screen_spec["size"])
         self.screen.fill(self.background)
@@ -647,7 +1108,8 @@ class Experiment(ArtistMixin, BlockManagerMixin):
         self.session_txt = pygame.transform.rotate(session_txt, 90)
         self.session_txt_rect = self.session_txt.get_rect(bottomleft=(0, 800 - 30))
         self.debug_mode = True
-        pygame.mixer.init()
+        self.audio.init(self.get_audio_roles())
+        self.generate_tones()
 
     def capture_screen(self):
         return pygame.image.tobytes(self.screen, "RGB")
@@ -679,4 +1141,13 @@ class Experiment(ArtistMixin, BlockManagerMixin):
 
         self.clock = TestClock()
         self.clock.start()
+        # pulses are sent on virtual time, so test runs never sleep
+        self.pulse_engine.close()
+        self.pulse_engine = util.VirtualPulseEngine(
+            self.clock, on_edge=self._record_ttl_edge
+        )
+        for ttl in self.TTLout.values():
+            ttl.engine = self.pulse_engine
+        if hasattr(GPIO, "set_clock"):  # simulated GPIO records a timeline
+            GPIO.set_clock(self.clock)
         self.event_manager = TestEventHandler(self, self.clock, test["event_queue"])
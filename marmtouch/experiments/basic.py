@@ -18,6 +18,7 @@ class Basic(Experiment):
         "sync_onset",
         "start_stimulus_onset",
         "start_stimulus_offset",
+        "target_onset",
     )
     name = "Basic"
     info_background = (0, 0, 0)
@@ -27,16 +28,16 @@ class Basic(Experiment):
     outcome_key = "target_touch"
 
     def _show_target(self, stimuli, timing):
-        self.screen.fill(self.background)
+        self.clear_screen()
         self.draw_stimulus(**stimuli["target"])
 
         distractors = stimuli.get("distractors", [])
         for distractor in distractors:
             self.draw_stimulus(**distractor)
-        self.flip()
+        onset = self.flip(label="target")
 
-        info = {"touch": 0, "RT": 0}
-        self.clock.wait(timing["target_duration"])
+        info = {"touch": 0, "RT": 0, "onset": onset}
+        self.clock.wait(timing["target_duration"], start=onset)
         while self.clock.waiting():
             tap = get_first_tap(self.event_manager.parse_events())
             if not self.running:
@@ -52,21 +53,22 @@ class Basic(Experiment):
                         "RT": self.clock.elapsed_time,
                         "x": tap[0],
                         "y": tap[1],
+                        "onset": onset,
                     }
                     if timing["correct_duration"]:
-                        self.screen.fill(self.background)
+                        self.clear_screen()
                         if stimuli["correct"] is not None:
                             self.draw_stimulus(**stimuli["correct"])
-                        self.flip()
+                        correct_onset = self.flip(label="correct")
                         self.good_monkey()
-                        self.clock.wait(timing["correct_duration"])
+                        self.clock.wait(timing["correct_duration"], start=correct_onset)
                         while self.clock.waiting():
                             self.event_manager.parse_events()
                             if not self.running:
                                 return
                     else:
                         self.good_monkey()
-                    self.screen.fill(self.background)
+                    self.clear_screen()
                     self.flip()
                     break
                 else:
@@ -85,22 +87,25 @@ class Basic(Experiment):
                         "RT": self.clock.elapsed_time,
                         "x": tap[0],
                         "y": tap[1],
+                        "onset": onset,
                     }
                     if self.options.get("ignore_incorrect", False):
                         continue
                     elif self.options.get("reward_incorrect", False):
                         self.good_monkey()
                     elif timing["incorrect_duration"]:
-                        self.screen.fill(self.background)
+                        self.clear_screen()
                         if stimuli["incorrect"] is not None:
                             self.draw_stimulus(**stimuli["incorrect"])
-                        self.flip()
-                        self.clock.wait(timing["incorrect_duration"])
+                        incorrect_onset = self.flip(label="incorrect")
+                        self.clock.wait(
+                            timing["incorrect_duration"], start=incorrect_onset
+                        )
                         while self.clock.waiting():
                             self.event_manager.parse_events()
                             if not self.running:
                                 return
-                    self.screen.fill(self.background)
+                    self.clear_screen()
                     self.flip()
                     break
         if not self.running:
@@ -164,12 +169,8 @@ class Basic(Experiment):
                     continue
                 if not self.running:
                     return
-            SYNC_PULSE_DURATION = 0.1
-            self.TTLout["sync"].pulse(SYNC_PULSE_DURATION)
-            if self.camera is not None:
-                self.camera.start_recording(
-                    (self.data_dir / f"{trial}.h264").as_posix()
-                )
+            sync_onset = self.send_sync(trial)
+            self.start_trial_recording(trial)
 
             # initialize trial parameters
             trial_start_time = self.clock.get_time()
@@ -180,17 +181,14 @@ class Basic(Experiment):
                 condition=condition,
                 target_touch=0,
                 target_RT=0,
-                sync_onset=-SYNC_PULSE_DURATION,
+                sync_onset=sync_onset - trial_start_time,
                 **timing,
             )
             if self.options.get("push_to_start", False):
-                start_stimulus_offset = -(
-                    SYNC_PULSE_DURATION + start_result["start_stimulus_delay"]
-                )
                 self.trial.data.update(
                     dict(
-                        start_stimulus_offset=start_stimulus_offset,
-                        start_stimulus_onset=start_stimulus_offset - start_result["RT"],
+                        start_stimulus_offset=start_result["offset"] - trial_start_time,
+                        start_stimulus_onset=start_result["onset"] - trial_start_time,
                     )
                 )
 
@@ -205,15 +203,15 @@ class Basic(Experiment):
                     "target_RT": target_result.get("RT", 0),
                 }
             )
+            self._record_onsets(target=target_result)
             outcome = self.trial.data["target_touch"]
 
             # wipe screen
-            self.screen.fill(self.background)
+            self.clear_screen()
             self.flip()
 
             # end of trial cleanup
-            if self.camera is not None:
-                self.camera.stop_recording()
+            self.end_trial_recording()
             self.dump_trialdata()
             if self.reached_max_responses():
                 break
@@ -232,5 +230,5 @@ class Basic(Experiment):
         if target_result is None:
             return
         # wipe screen
-        self.screen.fill(self.background)
+        self.clear_screen()
         self.flip()
@@ -31,6 +31,9 @@ class DMS(Experiment, DelayMixin):
         "sync_onset",
         "start_stimulus_onset",
         "start_stimulus_offset",
+        "sample_onset",
+        "delay_onset",
+        "test_onset",
     )
     name = "DMS"
     info_background = (0, 0, 0)
@@ -43,12 +46,12 @@ class DMS(Experiment, DelayMixin):
     def _show_sample(self, stimuli, timing):
         sample = stimuli["sample"]
 
-        self.screen.fill(self.background)
+        self.clear_screen()
         self.draw_stimulus(**sample)
-        self.flip()
+        onset = self.flip(label="sample")
 
-        info = {"touch": 0, "RT": 0}
-        self.clock.wait(timing["sample_duration"])
+        info = {"touch": 0, "RT": 0, "onset": onset}
+        self.clock.wait(timing["sample_duration"], start=onset)
         while self.clock.waiting():
             tap = get_first_tap(self.event_manager.parse_events())
             if not self.running:
@@ -60,6 +63,7 @@ class DMS(Experiment, DelayMixin):
                         "RT": self.clock.elapsed_time,
                         "x": tap[0],
                         "y": tap[1],
+                        "onset": onset,
                     }
         return info
 
@@ -69,16 +73,16 @@ class DMS(Experiment, DelayMixin):
             stimuli["target"],
             stimuli["distractor"],
         )
-        self.screen.fill(self.background)
+        self.clear_screen()
         self.draw_stimulus(**target)
         if show_distractor:
             self.draw_stimulus(**distractor)
         if show_sample:
             self.draw_stimulus(**sample)
-        self.flip()
+        onset = self.flip(label="test")
 
-        info = {"touch": 0, "RT": 0}
-        self.clock.wait(timing["test_duration"])
+        info = {"touch": 0, "RT": 0, "onset": onset}
+        self.clock.wait(timing["test_duration"], start=onset)
         while self.clock.waiting():
             tap = get_first_tap(self.event_manager.parse_events())
             if not self.running:
@@ -92,17 +96,18 @@ class DMS(Experiment, DelayMixin):
                         "RT": self.clock.elapsed_time,
                         "x": tap[0],
                         "y": tap[1],
+                        "onset": onset,
                     }
                     # reward and show correct for correct duration
-                    self.screen.fill(self.background)
+                    self.clear_screen()
                     self.draw_stimulus(**target)
-                    self.flip()
+                    correct_onset = self.flip(label="correct")
                     self.good_monkey()
-                    self.clock.wait(timing["correct_duration"])
+                    self.clock.wait(timing["correct_duration"], start=correct_onset)
                     while self.clock.waiting():
                         self.event_manager.parse_events()
                     # clear screen and exit
-                    self.screen.fill(self.background)
+                    self.clear_screen()
                     self.flip()
                     break
                 elif was_tapped(distractor["loc"], tap, distractor["window"]):
@@ -111,15 +116,18 @@ class DMS(Experiment, DelayMixin):
                         "RT": self.clock.elapsed_time,
                         "x": tap[0],
                         "y": tap[1],
+                        "onset": onset,
                     }
                     # show incorrect for incorrect duration
-                    self.screen.fill(self.background)
-                    self.flip()
-                    self.clock.wait(timing["incorrect_duration"])
+                    self.clear_screen()
+                    incorrect_onset = self.flip(label="incorrect")
+                    self.clock.wait(
+                        timing["incorrect_duration"], start=incorrect_onset
+                    )
                     while self.clock.waiting():
                         self.event_manager.parse_events()
                     # clear screen and exit
-                    self.screen.fill(self.background)
+                    self.clear_screen()
                     self.flip()
                     break
                 else:  # if tapped outside of the two items
@@ -156,6 +164,15 @@ class DMS(Experiment, DelayMixin):
             stimuli = {"sample": sample, "target": nonmatch, "distractor": match}
         return stimuli, match_name, nonmatch_name
 
+    def get_prefetch_items(self, condition, offset=0):
+        if self.options.get("method", "itemfile") != "itemfile":
+            # item pairs are drawn at random when the trial starts
+            return []
+        idx = (self.itemid + offset) % len(self.items)
+        return [
+            dict(type="image", path=self.items[idx][stim]) for stim in ["A", "B"]
+        ]
+
     def get_timing(self, condition):
         timing = {
             f"{event}_duration": self.get_duration(event)
@@ -163,11 +180,19 @@ class DMS(Experiment, DelayMixin):
         }
         return timing
 
-    def run(self):
-        self.initialize()
+    def _parse_itemfile(self):
+        """Replace the itemfile path with its rows once the experiment is initialized"""
         if self.options.get("method", "itemfile") == "itemfile":
             self.items = parse_csv(self.items)
 
+    def initialize_test(self):
+        super().initialize_test()
+        self._parse_itemfile()
+
+    def run(self):
+        self.initialize()
+        self._parse_itemfile()
+
         self.itemid = trial = 0
         self.running = True
         while self.running:
@@ -188,12 +213,8 @@ class DMS(Experiment, DelayMixin):
                 start_result = self._start_trial()
                 if start_result is None:
                     continue
-            SYNC_PULSE_DURATION = 0.1
-            self.TTLout["sync"].pulse(SYNC_PULSE_DURATION)
-            if self.camera is not None:
-                self.camera.start_recording(
-                    (self.data_dir / f"{trial}.h264").as_posix()
-                )
+            sync_onset = self.send_sync(trial)
+            self.start_trial_recording(trial)
 
             # initialize trial parameters
             trial_start_time = self.clock.get_time()
@@ -208,17 +229,14 @@ class DMS(Experiment, DelayMixin):
                 test_RT=0,
                 match_img=match_img,
                 nonmatch_img=nonmatch_img,
-                sync_onset=-SYNC_PULSE_DURATION,
+                sync_onset=sync_onset - trial_start_time,
                 **timing,
             )
             if self.options.get("push_to_start", False):
-                start_stimulus_offset = -(
-                    SYNC_PULSE_DURATION + start_result["start_stimulus_delay"]
-                )
                 self.trial.data.update(
                     dict(
-                        start_stimulus_offset=start_stimulus_offset,
-                        start_stimulus_onset=start_stimulus_offset - start_result["RT"],
+                        start_stimulus_offset=start_result["offset"] - trial_start_time,
+                        start_stimulus_onset=start_result["onset"] - trial_start_time,
                     )
                 )
 
@@ -252,15 +270,17 @@ class DMS(Experiment, DelayMixin):
                             "test_RT": test_result.get("RT", 0),
                         }
                     )
+                    self._record_onsets(
+                        sample=sample_result, delay=delay_result, test=test_result
+                    )
             outcome = self.trial.data["test_touch"]
 
             # wipe screen
-            self.screen.fill(self.background)
+            self.clear_screen()
             self.flip()
 
             # end of trial cleanup
-            if self.camera is not None:
-                self.camera.stop_recording()
+            self.end_trial_recording()
             self.dump_trialdata()
             if self.reached_max_responses():
                 break
@@ -279,7 +299,7 @@ class DMS(Experiment, DelayMixin):
         # run trial
         sample_result = self._show_sample(stimuli, timing)
         if sample_result is None:
-            break
+            return
         if sample_result["touch"] >= 0:  # no matter what
             if (timing["delay_duration"] < 0):  
                 # if delay duration is negative, skip delay and
@@ -288,7 +308,7 @@ class DMS(Experiment, DelayMixin):
             else:
                 delay_result = self._run_delay(stimuli, timing)
             if delay_result is None:
-                break
+                return
             if delay_result.get("touch", 0) >= 0:  # no matter what
                 test_result = self._show_test(
                     stimuli,
@@ -297,7 +317,7 @@ class DMS(Experiment, DelayMixin):
                     show_sample=timing["delay_duration"] < 0,
                 )
                 if test_result is None:
-                    break
+                    return
         # wipe screen
-        self.screen.fill(self.background)
+        self.clear_screen()
         self.flip()
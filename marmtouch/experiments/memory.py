@@ -87,6 +87,11 @@ class Memory(Experiment, DelayMixin):
         "sync_onset",
         "start_stimulus_onset",
         "start_stimulus_offset",
+        "cue_onset",
+        "delay_onset",
+        "sample_onset",
+        "cue_audio_onset",
+        "sample_audio_onset",
     )
     name = "Memory"
     info_background = (0, 0, 0)
@@ -97,12 +102,13 @@ class Memory(Experiment, DelayMixin):
     outcome_key = "sample_touch"
 
     def _show_cue(self, stimuli, timing):
-        self.screen.fill(self.background)
-        self.draw_stimulus(**stimuli["cue"])
-        self.flip()
+        self.clear_screen()
+        cue = self.draw_stimulus(**stimuli["cue"])
+        onset = self.flip(label="cue")
+        audio_onset = cue.get("audio_onset")
 
-        info = {"touch": 0, "RT": 0}
-        self.clock.wait(timing["cue_duration"])
+        info = {"touch": 0, "RT": 0, "onset": onset, "audio_onset": audio_onset}
+        self.clock.wait(timing["cue_duration"], start=onset)
         while self.clock.waiting():
             tap = get_first_tap(self.event_manager.parse_events())
             if not self.running:
@@ -116,22 +122,25 @@ class Memory(Experiment, DelayMixin):
                         "RT": self.clock.elapsed_time,
                         "x": tap[0],
                         "y": tap[1],
+                        "onset": onset,
+                        "audio_onset": audio_onset,
                     }
                     if self.options.get("cue_touch_enabled", False):
                         break
         return info
 
     def _show_sample(self, stimuli, timing, show_cue=False):
-        self.screen.fill(self.background)
+        self.clear_screen()
         if show_cue:
             self.draw_stimulus(**stimuli["cue"])
-        self.draw_stimulus(**stimuli["target"])
+        target = self.draw_stimulus(**stimuli["target"])
         for distractor in stimuli["distractors"]:
             self.draw_stimulus(**distractor)
-        self.flip()
+        onset = self.flip(label="sample")
+        audio_onset = target.get("audio_onset")
 
-        info = {"touch": 0, "RT": 0}
-        self.clock.wait(timing["sample_duration"])
+        info = {"touch": 0, "RT": 0, "onset": onset, "audio_onset": audio_onset}
+        self.clock.wait(timing["sample_duration"], start=onset)
         while self.clock.waiting():
             tap = get_first_tap(self.event_manager.parse_events())
             if not self.running:
@@ -152,11 +161,11 @@ class Memory(Experiment, DelayMixin):
                         info["touch"] = 3
 
                     if timing["correct_duration"]:
-                        self.screen.fill(self.background)
+                        self.clear_screen()
                         self.draw_stimulus(**stimuli["correct"])
-                        self.flip()
+                        correct_onset = self.flip(label="correct")
                         self.good_monkey()
-                        self.clock.wait(timing["correct_duration"])
+                        self.clock.wait(timing["correct_duration"], start=correct_onset)
                         while self.clock.waiting():
                             self.event_manager.parse_events()
                     else:
@@ -168,6 +177,8 @@ class Memory(Experiment, DelayMixin):
                         "RT": self.clock.elapsed_time,
                         "x": tap[0],
                         "y": tap[1],
+                        "onset": onset,
+                        "audio_onset": audio_onset,
                     }
 
                     for distractor in stimuli["distractors"]:
@@ -185,17 +196,19 @@ class Memory(Experiment, DelayMixin):
                     elif self.options.get("reward_incorrect", False):
                         self.good_monkey()
                     elif timing["incorrect_duration"]:
-                        self.screen.fill(self.background)
+                        self.clear_screen()
                         self.draw_stimulus(**stimuli["incorrect"])
-                        self.flip()
-                        self.clock.wait(timing["incorrect_duration"])
+                        incorrect_onset = self.flip(label="incorrect")
+                        self.clock.wait(
+                            timing["incorrect_duration"], start=incorrect_onset
+                        )
                         while self.clock.waiting():
                             self.event_manager.parse_events()
                     break
         if not self.running:
             return
         # else: #no response?
-        self.screen.fill(self.background)
+        self.clear_screen()
         self.flip()
         return info
 
@@ -255,12 +268,8 @@ class Memory(Experiment, DelayMixin):
                 start_result = self._start_trial()
                 if start_result is None:
                     continue
-            SYNC_PULSE_DURATION = 0.1
-            self.TTLout["sync"].pulse(SYNC_PULSE_DURATION)
-            if self.camera is not None:
-                self.camera.start_recording(
-                    (self.data_dir / f"{trial}.h264").as_posix()
-                )
+            sync_onset = self.send_sync(trial)
+            self.start_trial_recording(trial)
 
             # initialize trial parameters
             trial_start_time = self.clock.get_time()
@@ -274,17 +283,14 @@ class Memory(Experiment, DelayMixin):
                 cue_RT=0,
                 sample_RT=0,
                 tapped="none",
-                sync_onset=-SYNC_PULSE_DURATION,
+                sync_onset=sync_onset - trial_start_time,
                 **timing,
             )
             if self.options.get("push_to_start", False):
-                start_stimulus_offset = -(
-                    SYNC_PULSE_DURATION + start_result["start_stimulus_delay"]
-                )
                 self.trial.data.update(
                     dict(
-                        start_stimulus_offset=start_stimulus_offset,
-                        start_stimulus_onset=start_stimulus_offset - start_result["RT"],
+                        start_stimulus_offset=start_result["offset"] - trial_start_time,
+                        start_stimulus_onset=start_result["onset"] - trial_start_time,
                     )
                 )
 
@@ -305,6 +311,7 @@ class Memory(Experiment, DelayMixin):
                         "tapped": "none",
                     }
                 )
+                self._record_onsets(cue=cue_result)
             else:
                 if timing["delay_duration"] > 0:
                     delay_result = self._run_delay(stimuli, timing)
@@ -328,16 +335,18 @@ class Memory(Experiment, DelayMixin):
                             "tapped": sample_result.get("tapped", "none"),
                         }
                     )
+                    self._record_onsets(
+                        cue=cue_result, delay=delay_result, sample=sample_result
+                    )
             outcome = self.trial.data["sample_touch"]
 
             # wipe screen
-            self.screen.fill(self.background)
+            self.clear_screen()
             self.flip()
             pygame.mixer.stop()
 
             # end of trial cleanup
-            if self.camera is not None:
-                self.camera.stop_recording()
+            self.end_trial_recording()
             self.dump_trialdata()
             if self.reached_max_responses():
                 break
@@ -370,6 +379,6 @@ class Memory(Experiment, DelayMixin):
                 if sample_result is None:
                     return
         # wipe screen
-        self.screen.fill(self.background)
+        self.clear_screen()
         self.flip()
         
\ No newline at end of file
@@ -3,79 +3,182 @@ import pygame
 
 
 class ArtistMixin:
-    def draw_ngon(self, n, radius, color, loc, start_angle=0):
-        x, y = loc
-        start_angle = math.radians(start_angle)
-        angle_delta = 2 * math.pi / n
-        angles = [start_angle + i * angle_delta for i in range(n)]
-        points = [(x + radius * math.cos(a), y + radius * math.sin(a)) for a in angles]
-        pygame.draw.polygon(self.screen, color, points)
+    """Draws stimuli on the experiment screen
 
-    def draw_star(self, n, radius, color, loc, start_angle=0, inner_outer_ratio=0.5):
-        x, y = loc
-        n *= 2
-        start_angle = math.radians(start_angle)
-        angle_delta = 2 * math.pi / n
-        points = []
-        for i in range(n):
-            a = start_angle + i * angle_delta
-            radius_ = radius if i % 2 else radius * inner_outer_ratio
-            points.append((x + radius_ * math.cos(a), y + radius_ * math.sin(a)))
-        pygame.draw.polygon(self.screen, color, points)
-
-    def draw_cross(self, radius, color, loc, width=1):
+    Every region drawn is tracked so `flip` can update only the parts of the
+    display that changed.  Rects drawn since the last `clear_screen` are kept
+    in `_drawn_rects`; rects that must be sent to the display on the next
+    flip are kept in `_dirty_rects`.
+
+    Polygons and crosses are rasterized once per (type, radius, colour, angle,
+    points, ratio, width, antialias) into `shape_cache` and blitted on later
+    draws.  Set `antialias` on an item, or in options for all items, to draw
+    anti-aliased edges.
+    """
+
+    def _mark_dirty(self, rect):
+        self._drawn_rects.append(rect)
+        self._dirty_rects.append(rect)
+        return rect
+
+    def clear_screen(self):
+        """Fill the screen with the background colour
+
+        Only the regions drawn since the last clear are filled and marked for
+        update.
+        """
+        for rect in self._drawn_rects:
+            self.screen.fill(self.background, rect)
+        self._dirty_rects.extend(self._drawn_rects)
+        self._drawn_rects = []
+
+    def _blit_shape(self, key, render, loc):
+        """Blit a cached rasterized shape centred at `loc`
+
+        Shapes are rasterized by `render` on a cache miss and stored in
+        `shape_cache` under `key`.
+        """
+        surface = self.shape_cache.get(key)
+        if surface is None:
+            surface = render().convert_alpha()
+            self.shape_cache.put(key, surface)
         x, y = loc
-        pygame.draw.line(self.screen, color, (x - radius, y), (x + radius, y), width)
-        pygame.draw.line(self.screen, color, (x, y - radius), (x, y + radius), width)
+        rect = surface.get_rect(center=(round(x), round(y)))
+        return self.screen.blit(surface, rect)
+
+    @staticmethod
+    def _render_polygon(extent, color, points, antialias):
+        side = 2 * math.ceil(extent) + 3
+        surface = pygame.Surface((side, side), pygame.SRCALPHA)
+        c = side // 2
+        points = [(c + px, c + py) for px, py in points]
+        pygame.draw.polygon(surface, color, points)
+        if antialias:
+            pygame.draw.aalines(surface, color, True, points)
+        return surface
+
+    def draw_ngon(self, n, radius, color, loc, start_angle=0, antialias=False):
+        color = tuple(color)
+        key = ("ngon", n, radius, color, start_angle, antialias)
+
+        def render():
+            angle_delta = 2 * math.pi / n
+            angles = [math.radians(start_angle) + i * angle_delta for i in range(n)]
+            points = [(radius * math.cos(a), radius * math.sin(a)) for a in angles]
+            return self._render_polygon(radius, color, points, antialias)
+
+        return self._blit_shape(key, render, loc)
+
+    def draw_star(
+        self,
+        n,
+        radius,
+        color,
+        loc,
+        start_angle=0,
+        inner_outer_ratio=0.5,
+        antialias=False,
+    ):
+        color = tuple(color)
+        key = ("star", n, radius, color, start_angle, inner_outer_ratio, antialias)
+
+        def render():
+            angle_delta = 2 * math.pi / (2 * n)
+            points = []
+            for i in range(2 * n):
+                a = math.radians(start_angle) + i * angle_delta
+                radius_ = radius if i % 2 else radius * inner_outer_ratio
+                points.append((radius_ * math.cos(a), radius_ * math.sin(a)))
+            extent = radius * max(1, inner_outer_ratio)
+            return self._render_polygon(extent, color, points, antialias)
+
+        return self._blit_shape(key, render, loc)
+
+    def draw_cross(self, radius, color, loc, width=1, antialias=False):
+        color = tuple(color)
+        key = ("cross", radius, color, width, antialias)
+
+        def render():
+            side = 2 * math.ceil(radius) + width + 2
+            surface = pygame.Surface((side, side), pygame.SRCALPHA)
+            c = side // 2
+            lines = [
+                ((c - radius, c), (c + radius, c)),
+                ((c, c - radius), (c, c + radius)),
+            ]
+            for start, end in lines:
+                if antialias and width == 1:
+                    pygame.draw.aaline(surface, color, start, end)
+                else:
+                    pygame.draw.line(surface, color, start, end, width)
+            return surface
+
+        return self._blit_shape(key, render, loc)
 
     def draw_stimulus(self, **params):
         """Draws stimuli on screen
 
         Draws stimuli on screen using pygame using parameters provided.
-        Must manually call pygame.display.update() after drawing all stimuli.
-        Use self.screen.fill(self.background) to clear the screen
+        Must manually call flip after drawing all stimuli.
+        Use self.clear_screen() to clear the screen
+
+        Returns
+        -------
+        params: dict
+            Parameters of the stimulus.  For sounds, `audio_onset` is set to
+            the estimated onset returned by `play_sound`.
         """
         self.logger.debug("Drawing stimulus: {}".format(params))
+        antialias = params.get("antialias", self.options.get("antialias", False))
+        rect = None
         if params["type"] == "circle":
-            pygame.draw.circle(
+            rect = pygame.draw.circle(
                 self.screen, params["color"], params["loc"], params["radius"]
             )
         elif params["type"] == "triangle":
-            self.draw_ngon(
+            rect = self.draw_ngon(
                 3,
                 params["radius"],
                 params["color"],
                 params["loc"],
                 params.get("start_angle", 30),
+                antialias,
             )
         elif params["type"] == "square":
-            self.draw_ngon(
+            rect = self.draw_ngon(
                 4,
                 params["radius"],
                 params["color"],
                 params["loc"],
                 params.get("start_angle", 45),
+                antialias,
             )
         elif params["type"] == "hexagon":
-            self.draw_ngon(
+            rect = self.draw_ngon(
                 6,
                 params["radius"],
                 params["color"],
                 params["loc"],
                 params.get("start_angle", 0),
+                antialias,
             )
         elif params["type"] == "star":
-            self.draw_star(
+            rect = self.draw_star(
                 params["points"],
                 params["radius"],
                 params["color"],
                 params["loc"],
                 params.get("start_angle", 270),
                 params.get("inner_outer_ratio", 0.5),
+                antialias,
             )
         elif params["type"] == "cross":
-            self.draw_cross(
-                params["radius"], params["color"], params["loc"], params.get("width", 1)
+            rect = self.draw_cross(
+                params["radius"],
+                params["color"],
+                params["loc"],
+                params.get("width", 1),
+                antialias,
             )
         elif params["type"] in ["image", "svg"]:
             img = params["image"]
@@ -83,14 +186,16 @@ class ArtistMixin:
             rotation = params.get("rotation", 0)
             if rotation:
                 img = pygame.transform.rotate(img, rotation)
-            self.screen.blit(img, img_rect)
+            rect = self.screen.blit(img, img_rect)
         elif params["type"] in ["audio", "pure_tone"]:
-            params["sound"].play(
-                loops=params.get("loop", 1)-1,
-                maxtime=params.get("maxtime", 0),
-            )
+            params["audio_onset"] = self.play_sound(params)
         if self.debug_mode and "window" in params:
             w, h = params["window"]
             window = pygame.Rect(0, 0, w, h) #.rotate(math.radians(self.rotation))
             window.center = params["loc"]
-            pygame.draw.rect(self.screen, pygame.Color("RED"), window, 4)
+            self._mark_dirty(
+                pygame.draw.rect(self.screen, pygame.Color("RED"), window, 4)
+            )
+        if rect is not None:
+            self._mark_dirty(rect)
+        return params
@@ -7,6 +7,7 @@ class DelayMixin:
         Delay duration is timing['delay_duration']
         If delay_distractor stimulus and delay
         Returns last touch during delay period if there was one
+        Distractor onset and offset flips are scheduled relative to delay onset
         """
 
         # Validate distractor information
@@ -25,24 +26,38 @@ class DelayMixin:
                 distractor_offset = distractor_onset + distractor_duration
 
         # Start running delay
-        self.screen.fill(self.background)
-        self.flip()
-        info = {"touch": 0, "RT": 0}
-        self.clock.wait(timing["delay_duration"])
+        self.clear_screen()
+        onset = self.flip(label="delay")
+        info = {"touch": 0, "RT": 0, "onset": onset}
+        self.clock.wait(timing["delay_duration"], start=onset)
+        if distractor is not None:
+            # distractor flips are scheduled, wake up early enough to hit them
+            lead = self.frame_period / 2 if self.vsync else 0
+            distractor_onset_time = self.clock.wait_start_time + distractor_onset
+            distractor_offset_time = self.clock.wait_start_time + distractor_offset
         while self.clock.waiting():
             # distractor rendering
+            next_transition = None
             if distractor is not None:
-                if not distractor_drawn and self.clock.elapsed_time > distractor_onset:
-                    self.draw_stimulus(**distractor)
-                    self.flip()
-                    distractor_drawn = True
-                elif not screen_wiped and self.clock.elapsed_time > distractor_offset:
-                    self.screen.fill(self.background)
-                    self.flip()
-                    screen_wiped = True
+                if not distractor_drawn:
+                    if self.clock.get_time() >= distractor_onset_time - lead:
+                        self.draw_stimulus(**distractor)
+                        self.flip(at=distractor_onset_time, label="delay_distractor")
+                        distractor_drawn = True
+                    else:
+                        next_transition = distractor_onset_time - lead
+                if distractor_drawn and not screen_wiped:
+                    if self.clock.get_time() >= distractor_offset_time - lead:
+                        self.clear_screen()
+                        self.flip(
+                            at=distractor_offset_time, label="delay_distractor_offset"
+                        )
+                        screen_wiped = True
+                    else:
+                        next_transition = distractor_offset_time - lead
 
             # processing input events
-            tap = get_first_tap(self.event_manager.parse_events())
+            tap = get_first_tap(self.event_manager.parse_events(until=next_transition))
             if not self.running:
                 return
             if tap is not None:
@@ -51,6 +66,7 @@ class DelayMixin:
                     "RT": self.clock.elapsed_time,
                     "x": tap[0],
                     "y": tap[1],
+                    "onset": onset,
                 }
 
         return info
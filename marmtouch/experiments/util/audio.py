@@ -0,0 +1,260 @@
+import threading
+from collections import deque
+import time
+import wave
+
+import numpy as np
+import pygame
+
+
+class AudioOutput:
+    """Mixer with reserved channels per stimulus role and latency estimates
+
+    The mixer is configured before pygame is initialized so the small buffer
+    takes effect.  Each auditory stimulus role (e.g. cue, feedback) plays on
+    its own reserved channel, so a sound is never delayed or cut off by the
+    mixer looking for a free channel, and a new sound in a role replaces the
+    previous one.
+
+    The onset latency of a play is estimated as the mixer buffer duration
+    plus `output_latency`, the additional device latency measured with
+    `marmtouch calibrate-audio`.
+
+    Parameters
+    ----------
+    frequency: int, default 44100
+        Sample rate in Hz
+    size: int, default -16
+        Sample size in bits, negative for signed samples
+    channels: int, default 2
+        Number of output channels
+    buffer: int, default 512
+        Mixer buffer size in samples
+    output_latency: float, default 0
+        Measured latency of the audio device beyond the mixer buffer, in seconds
+    n_channels: int, default 8
+        Number of mixer channels
+    stream_threshold: int, default 5 MiB
+        WAV files larger than this many bytes are streamed with AudioStream
+        instead of being loaded into memory
+    """
+
+    def __init__(
+        self,
+        frequency=44100,
+        size=-16,
+        channels=2,
+        buffer=512,
+        output_latency=0,
+        n_channels=8,
+        stream_threshold=5 * 2**20,
+    ):
+        self.frequency = frequency
+        self.size = size
+        self.channels = channels
+        self.buffer = buffer
+        self.output_latency = output_latency
+        self.n_channels = n_channels
+        self.stream_threshold = stream_threshold
+        self._roles = {}
+
+    def pre_init(self):
+        """Configure the mixer, must be called before pygame.init"""
+        pygame.mixer.pre_init(self.frequency, self.size, self.channels, self.buffer)
+
+    def init(self, roles=()):
+        """Initialize the mixer and reserve a channel for each role"""
+        pygame.mixer.init(self.frequency, self.size, self.channels, self.buffer)
+        self.frequency, self.size, self.channels = pygame.mixer.get_init()
+        pygame.mixer.set_num_channels(max(self.n_channels, len(roles) + 1))
+        self._roles = {}
+        for role in roles:
+            self.channel(role)
+
+    @property
+    def latency(self):
+        """Estimated time from a play call to the sound reaching the speaker"""
+        return self.buffer / self.frequency + self.output_latency
+
+    def channel(self, role):
+        """Get the channel reserved for a role, reserving one if needed"""
+        channel = self._roles.get(role)
+        if channel is None:
+            index = len(self._roles)
+            if index + 1 >= pygame.mixer.get_num_channels():
+                pygame.mixer.set_num_channels(index + 2)
+            pygame.mixer.set_reserved(index + 1)
+            channel = self._roles[role] = pygame.mixer.Channel(index)
+        return channel
+
+    def play(self, sound, role=None, loops=0, maxtime=0):
+        """Play a sound on the channel of its role
+
+        Parameters
+        ----------
+        sound: pygame.mixer.Sound or AudioStream
+            Sound to play
+        role: str, default None
+            Stimulus role.  If None, the sound plays on any free unreserved
+            channel.
+        loops: int, default 0
+            Number of times to repeat the sound after the first play
+        maxtime: int, default 0
+            Stop playback after `maxtime` milliseconds.  If 0, plays to the end.
+
+        Returns
+        -------
+        latency: float
+            Estimated onset latency of the sound
+        """
+        if isinstance(sound, AudioStream):
+            if role is None:
+                channel = pygame.mixer.find_channel(True)
+            else:
+                channel = self.channel(role)
+            sound.play(channel, loops=loops, maxtime=maxtime)
+        elif role is None:
+            sound.play(loops=loops, maxtime=maxtime)
+        else:
+            self.channel(role).play(sound, loops=loops, maxtime=maxtime)
+        return self.latency
+
+
+class AudioStream:
+    """WAV file played in chunks decoded on a background thread
+
+    Only the file header is read when the stream is created.  On play, the
+    first chunk is decoded on the calling thread so the onset is not delayed,
+    and a background thread keeps a ring of up to `n_chunks` decoded chunks
+    and queues them on the channel as it plays.  Playback ends when the file
+    (and its loops) is exhausted, the stream is stopped, or the channel is
+    stopped or taken over, e.g. by pygame.mixer.stop or another sound.
+
+    Parameters
+    ----------
+    path: str or Path
+        Path to a 16 bit WAV file with the mixer's sample rate
+    chunk_duration: float, default 0.25
+        Duration of each decoded chunk in seconds
+    n_chunks: int, default 4
+        Maximum number of chunks decoded ahead of playback
+    """
+
+    def __init__(self, path, chunk_duration=0.25, n_chunks=4):
+        self.path = path
+        self.chunk_duration = chunk_duration
+        self.n_chunks = n_chunks
+        frequency, size, self.channels = pygame.mixer.get_init()
+        with wave.open(str(path), "rb") as wav:
+            self.frequency = wav.getframerate()
+            self.file_channels = wav.getnchannels()
+            self.n_frames = wav.getnframes()
+            sampwidth = wav.getsampwidth()
+        if sampwidth != 2 or size != -16:
+            raise ValueError(f"{path}: only 16 bit audio can be streamed")
+        if self.frequency != frequency:
+            raise ValueError(
+                f"{path}: sample rate {self.frequency} Hz does not match the mixer ({frequency} Hz)"
+            )
+        if self.file_channels not in (1, self.channels):
+            raise ValueError(
+                f"{path}: {self.file_channels} channels cannot be played on {self.channels} mixer channels"
+            )
+        self.chunk_frames = max(int(self.frequency * chunk_duration), 1)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def get_length(self):
+        """Duration of the file in seconds"""
+        return self.n_frames / self.frequency
+
+    def _decode(self, wav, n_frames):
+        frames = wav.readframes(n_frames)
+        if self.file_channels != self.channels:
+            samples = np.frombuffer(frames, dtype=np.int16)
+            frames = np.repeat(samples, self.channels).tobytes()
+        return pygame.mixer.Sound(buffer=frames)
+
+    def _chunks(self, loops, maxtime):
+        """Yield decoded chunks until the file, loops or maxtime are exhausted"""
+        if not self.n_frames:
+            return
+        remaining = None if not maxtime else int(maxtime * self.frequency / 1000)
+        with wave.open(str(self.path), "rb") as wav:
+            while remaining is None or remaining > 0:
+                n_frames = self.chunk_frames
+                if remaining is not None:
+                    n_frames = min(n_frames, remaining)
+                if wav.tell() >= self.n_frames:
+                    if loops == 0:
+                        return
+                    loops -= 1
+                    wav.rewind()
+                n_frames = min(n_frames, self.n_frames - wav.tell())
+                if remaining is not None:
+                    remaining -= n_frames
+                yield self._decode(wav, n_frames)
+
+    def play(self, channel, loops=0, maxtime=0):
+        """Start playback on a channel
+
+        Parameters
+        ----------
+        channel: pygame.mixer.Channel
+            Channel to play on
+        loops: int, default 0
+            Number of times to repeat the file after the first play, -1 to
+            repeat until stopped
+        maxtime: int, default 0
+            Stop playback after `maxtime` milliseconds.  If 0, plays to the end.
+        """
+        self.stop()
+        self._stop.clear()
+        chunks = self._chunks(loops, maxtime)
+        first = next(chunks, None)
+        if first is None:
+            return
+        channel.play(first)
+        self._thread = threading.Thread(
+            target=self._feed,
+            args=(channel, first, chunks),
+            name="marmtouch-audio-stream",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _feed(self, channel, first, chunks):
+        ring = deque()
+        # the playing and queued chunks
+        ours = deque([first], maxlen=2)
+        poll_interval = self.chunk_duration / 4
+        exhausted = False
+        try:
+            while not self._stop.is_set():
+                while not exhausted and len(ring) < self.n_chunks:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                    else:
+                        ring.append(chunk)
+                if not channel.get_busy() or channel.get_sound() not in ours:
+                    # stopped, taken over by another sound, or finished
+                    return
+                if ring and channel.get_queue() is None:
+                    ours.append(ring.popleft())
+                    channel.queue(ours[-1])
+                elif exhausted and not ring:
+                    return
+                time.sleep(poll_interval)
+            if channel.get_sound() in ours:
+                channel.stop()
+        except pygame.error:
+            # the mixer was shut down during playback
+            return
+
+    def stop(self):
+        """Stop playback and wait for the feeding thread to exit"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
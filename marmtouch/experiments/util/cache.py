@@ -0,0 +1,104 @@
+from collections import OrderedDict
+
+import pygame
+
+
+class LRUCache:
+    """Least-recently-used cache with hit, miss and eviction counters
+
+    Parameters
+    ----------
+    max_items: int, default None
+        Maximum number of entries.  If None, the number of entries is not
+        limited.
+    max_bytes: int, default None
+        Maximum total size of the entries in bytes, as measured by `sizeof`.
+        If None, the size is not limited.  The most recently added entry is
+        always kept, even if it alone exceeds the budget.
+    sizeof: callable, default None
+        Returns the size in bytes of a value.  Required if `max_bytes` is set.
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, sizeof=None):
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("sizeof must be provided to limit the cache by bytes")
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Get an entry and mark it as most recently used
+
+        Counts a hit if `key` is cached and a miss otherwise.
+        """
+        try:
+            value, _ = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Add an entry, evicting least recently used entries if full"""
+        if key in self._data:
+            self.nbytes -= self._data.pop(key)[1]
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        self._data[key] = value, size
+        self.nbytes += size
+        while len(self._data) > 1 and self._full():
+            _, (_, evicted_size) = self._data.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+
+    def _full(self):
+        if self.max_items is not None and len(self._data) > self.max_items:
+            return True
+        return self.max_bytes is not None and self.nbytes > self.max_bytes
+
+    def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
+    @property
+    def stats(self):
+        return dict(
+            entries=len(self._data),
+            nbytes=self.nbytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+def stimulus_nbytes(stimulus):
+    """Approximate memory held by a decoded stimulus
+
+    Parameters
+    ----------
+    stimulus: pygame.Surface or pygame.mixer.Sound
+
+    Returns
+    -------
+    nbytes: int
+        width x height x bytes per pixel for surfaces, and
+        duration x sample rate x channels x bytes per sample for sounds
+    """
+    if isinstance(stimulus, pygame.Surface):
+        return stimulus.get_width() * stimulus.get_height() * stimulus.get_bytesize()
+    if isinstance(stimulus, pygame.mixer.Sound):
+        frequency, size, channels = pygame.mixer.get_init()
+        return int(stimulus.get_length() * frequency) * channels * abs(size) // 8
+    return 0
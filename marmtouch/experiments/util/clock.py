@@ -1,42 +1,178 @@
-import time 
+import heapq
+import itertools
+import time
+
 
 class Clock:
+    """Experiment clock backed by a monotonic high-resolution counter
+
+    Time is kept internally in integer nanoseconds read from
+    `time.perf_counter_ns`, which does not jump when the wall clock is
+    adjusted (e.g. by NTP).  Public times are float seconds since `start`.
+
+    Call `anchor` to pair the clock with the wall clock so data can be
+    aligned to absolute time.  `anchor_due` becomes True every
+    `anchor_interval` seconds.
+    """
+
+    anchor_interval = 60
+    jump_threshold = 0.1
+    spin_threshold = 0.002
+
     def __init__(self):
         self.wait_start_time = None
         self.wait_for = None
         self.elapsed_time = None
+        self._wait_start_ns = None
+        self._wait_for_ns = None
+        self._last_anchor = None
+
+    def _now_ns(self):
+        return time.perf_counter_ns()
+
+    def _wall_ns(self):
+        return time.time_ns()
+
     def start(self):
+        self._start_ns = self._now_ns()
         self.start_time = time.time()
+
+    def get_time_ns(self):
+        return self._now_ns() - self._start_ns
+
     def get_time(self):
-        return time.time() - self.start_time
-    def wait(self, t):
-        self.wait_start_time = self.get_time()
+        return self.get_time_ns() / 1e9
+
+    def wait(self, t, start=None):
+        """Start waiting for `t` seconds
+
+        Parameters
+        ----------
+        t: float
+            Duration of the wait in seconds
+        start: float, default None
+            Time the wait is measured from, e.g. a stimulus onset returned by
+            a flip.  If None, the wait starts now.
+        """
+        if start is None:
+            self._wait_start_ns = self.get_time_ns()
+        else:
+            self._wait_start_ns = round(start * 1e9)
+        self._wait_for_ns = round(t * 1e9)
+        self.wait_start_time = self._wait_start_ns / 1e9
         self.wait_for = t
+
     @property
     def wait_until(self):
         if self.wait_for is None:
             return None
         else:
-            return self.wait_start_time + self.wait_for
+            return (self._wait_start_ns + self._wait_for_ns) / 1e9
+
     def waiting(self):
         if self.wait_for is None:
             return False
         else:
-            self.elapsed_time = self.get_time() - self.wait_start_time
-            return self.elapsed_time < self.wait_for
+            elapsed_ns = self.get_time_ns() - self._wait_start_ns
+            self.elapsed_time = elapsed_ns / 1e9
+            return elapsed_ns < self._wait_for_ns
+
+    def sleep_until(self, t):
+        """Block until time `t`
+
+        Sleeps until `spin_threshold` seconds before `t`, then spins.
+        """
+        remaining = t - self.get_time()
+        if remaining > self.spin_threshold:
+            time.sleep(remaining - self.spin_threshold)
+        while self.get_time() < t:
+            pass
+
     def reset(self):
         self.wait_start_time = None
         self.wait_for = None
         self.elapsed_time = None
+        self._wait_start_ns = None
+        self._wait_for_ns = None
+
+    def anchor_due(self):
+        if self._last_anchor is None:
+            return True
+        return self.get_time_ns() - self._last_anchor[0] >= self.anchor_interval * 1e9
+
+    def anchor(self):
+        """Pair the current clock time with the wall clock
+
+        The wall clock is read between two reads of the clock and paired with
+        their midpoint.  Drift is the difference between the wall-clock and
+        clock intervals since the previous anchor. A drift larger than
+        `jump_threshold` seconds is flagged as a wall-clock jump.
+
+        Returns
+        -------
+        anchor: dict
+            Anchor record, ready to be written to the event journal
+        """
+        before = self.get_time_ns()
+        wall_ns = self._wall_ns()
+        after = self.get_time_ns()
+        clock_ns = (before + after) // 2
+        record = dict(
+            type="clock_anchor",
+            time=clock_ns / 1e9,
+            wall_time=wall_ns / 1e9,
+            uncertainty=(after - before) / 1e9,
+        )
+        if self._last_anchor is not None:
+            last_clock_ns, last_wall_ns = self._last_anchor
+            drift = ((wall_ns - last_wall_ns) - (clock_ns - last_clock_ns)) / 1e9
+            record["drift"] = drift
+            record["jump"] = abs(drift) > self.jump_threshold
+        self._last_anchor = clock_ns, wall_ns
+        return record
+
 
 class TestClock(Clock):
+    """Clock running on virtual time for headless test runs
+
+    Time only moves when `advance_time` or `sleep_until` is called.
+    Callbacks registered with `call_at` are run in time order as virtual time
+    passes their scheduled time, with the clock reading that time.  The wall
+    clock read by `anchor` also runs on virtual time, from the real wall
+    time at `start`, so anchors do not report the virtual time as drift.
+    """
+
     def __init__(self):
         super().__init__()
         self._time = 0
+        self._scheduled = []
+        self._seq = itertools.count()
+
+    def _now_ns(self):
+        return round(self._time * 1e9)
+
+    def _wall_ns(self):
+        return self._wall_start_ns + self.get_time_ns()
+
     def start(self, start=0):
         self.start_time = start
         self._time = start
+        self._start_ns = self._now_ns()
+        self._wall_start_ns = time.time_ns()
+
+    def call_at(self, t, callback, *args):
+        """Call `callback(*args)` when virtual time reaches `t`"""
+        heapq.heappush(self._scheduled, (t, next(self._seq), callback, args))
+
     def advance_time(self, delta):
-        self._time += delta
-    def get_time(self):
-        return self._time - self.start_time
\ No newline at end of file
+        target = self.get_time() + delta
+        while self._scheduled and self._scheduled[0][0] <= target:
+            t, _, callback, args = heapq.heappop(self._scheduled)
+            if t > self.get_time():
+                self._time += t - self.get_time()
+            callback(*args)
+        self._time += target - self.get_time()
+
+    def sleep_until(self, t):
+        if t > self.get_time():
+            self.advance_time(t - self.get_time())
@@ -1,22 +1,96 @@
 import time
 
 import pygame
-import yaml
 
 from marmtouch.experiments.util.parse_items import transform_location
 
+# posted from the GPIO callback thread for edges on TTL inputs
+GPIO_EDGE = pygame.USEREVENT + 1
+
 
 class EventHandler:
+    """Collects input events for the running experiment
+
+    `parse_events` blocks until an input event arrives or the current
+    deadline is reached, rather than returning immediately.  Waiting is
+    hybrid: the thread sleeps in `pygame.event.wait` until `spin_threshold`
+    seconds before the deadline, then spins on the event queue so it wakes
+    at the deadline with sub-millisecond accuracy.  How late each deadline
+    wake-up was is accumulated and can be reported with `lateness_summary`.
+
+    Edges on TTL inputs are posted to the queue as `GPIO_EDGE` events by the
+    GPIO callback thread, so they wake the wait like touches do and are
+    returned as "gpio_edge" events timestamped when the edge was captured.
+    """
+
+    event_types = (pygame.MOUSEBUTTONDOWN, pygame.QUIT, pygame.KEYDOWN, GPIO_EDGE)
+    spin_threshold = 0.002
+
     def __init__(self, experiment, clock):
         self.experiment = experiment
         self.clock = clock
+        self._pending = []
+        self.n_wakeups = 0
+        self.total_lateness = 0
+        self.max_lateness = 0
+
+    def restrict_event_types(self):
+        """Only queue the SDL event types handled by `get_events`"""
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(list(self.event_types))
+
+    def wait_for_events(self, until=None):
+        """Block until an event is queued or a deadline is reached
+
+        Parameters
+        ----------
+        until: float, default None
+            Time on `clock` to wake up at. The earlier of `until` and the
+            deadline of the active `clock.wait` is used.  If neither is set,
+            returns immediately.
+        """
+        deadline = self.clock.wait_until
+        if until is not None:
+            deadline = until if deadline is None else min(deadline, until)
+        if deadline is None or self._pending:
+            return
+        timeout_ms = int((deadline - self.clock.get_time() - self.spin_threshold) * 1000)
+        # a timeout of 0 makes pygame wait without a timeout, so spin instead
+        if timeout_ms >= 1:
+            event = pygame.event.wait(timeout_ms)
+            if event.type != pygame.NOEVENT:
+                self._pending.append(event)
+                return
+        while not pygame.event.peek():
+            now = self.clock.get_time()
+            if now >= deadline:
+                lateness = now - deadline
+                self.n_wakeups += 1
+                self.total_lateness += lateness
+                self.max_lateness = max(self.max_lateness, lateness)
+                return
+
+    def lateness_summary(self):
+        """Summarize how late deadline wake-ups were
+
+        Returns
+        -------
+        summary: dict
+            Number of deadline wake-ups with mean and max lateness in seconds
+        """
+        return dict(
+            n_wakeups=self.n_wakeups,
+            mean_lateness=self.total_lateness / max(self.n_wakeups, 1),
+            max_lateness=self.max_lateness,
+        )
 
     def get_events(self, default_event_data):
         if not self.experiment.running:
-            return []
+            return [], False
         exit_ = False
         event_stack = []
-        for event in pygame.event.get():
+        events, self._pending = self._pending + pygame.event.get(), []
+        for event in events:
             if event.type == pygame.MOUSEBUTTONDOWN:
                 mouseX, mouseY = pygame.mouse.get_pos()
                 touch_event = dict(mouseX=mouseX, mouseY=mouseY, **default_event_data)
@@ -40,9 +114,24 @@ class EventHandler:
                         dict(type="key_down", key="escape", **default_event_data)
                     )
                     exit_ = True
+            elif event.type == GPIO_EDGE:
+                event_stack.append(dict(default_event_data, **event.record))
         return event_stack, exit_
 
-    def parse_events(self):
+    def parse_events(self, until=None):
+        """Wait for and process input events
+
+        Parameters
+        ----------
+        until: float, default None
+            Wake up no later than this time on `clock`, see `wait_for_events`
+
+        Returns
+        -------
+        event_stack: list of dict
+            Events that occurred since the last call
+        """
+        self.wait_for_events(until)
         default_event_data = {}
         if self.experiment.trial is None:
             default_event_data["trial"] = len(self.experiment.behdata)
@@ -53,13 +142,14 @@ class EventHandler:
         default_event_data["time"] = self.clock.get_time()
         event_stack, exit_ = self.get_events(default_event_data)
         self.dump_events(event_stack)
+        if self.clock.anchor_due():
+            self.dump_events([self.clock.anchor()])
         self.handle_exit(exit_)
         return event_stack
 
     def dump_events(self, event_stack):
         self.experiment.events.extend(event_stack)
-        with open(self.experiment.temp_events_path, "a") as file:
-            yaml.safe_dump(event_stack, file)
+        self.experiment.journal.write(event_stack)
 
     def handle_exit(self, exit_):
         if exit_:
@@ -77,6 +167,31 @@ def get_first_tap(event_stack):
         return None
 
 
+def get_edges(event_stack, name=None, value=None):
+    """Get the TTL input edges in an event stack
+
+    Parameters
+    ----------
+    event_stack : list of dict
+        Events returned by `parse_events`
+    name : str, default None
+        Only return edges of the input with this name
+    value : int, default None
+        Only return rising (1) or falling (0) edges
+
+    Returns
+    -------
+    edges : list of dict
+    """
+    return [
+        event
+        for event in event_stack
+        if event["type"] == "gpio_edge"
+        and (name is None or event["name"] == name)
+        and (value is None or event["value"] == value)
+    ]
+
+
 def was_tapped(target, tap, window):
     """Check if tap was in a window around target location
 
@@ -105,6 +220,9 @@ class TestEventHandler(EventHandler):
 
     # def update_event_queue(self, event_queue):
     #     self.event_queue.extend(event_queue)
+    def wait_for_events(self, until=None):  # time is advanced by get_events
+        pass
+
     def get_events(self, default_event_data):
         if not self.experiment.running:
             return [], False
@@ -1,24 +1,70 @@
-import math
-
+import numpy as np
 import pygame
 
-def generate_sine_wave_snd(freq, maxtime=5, sample_rate=44100):
-    """Generate a pure tone sine wave
+
+def generate_sine_wave(
+    freq, maxtime=5, sample_rate=44100, amplitude=4096, channels=2, ramp=0
+):
+    """Generate the samples of a pure tone sine wave
 
     Parameters
     ----------
-    freq: int
+    freq: float
         Frequency of tone in Hz
-    maxtime: float
+    maxtime: float, default 5
         Duration of sound in seconds
     sample_rate: int, default 44100Hz
         Sampling rate of sound
-    
+    amplitude: int, default 4096
+        Peak amplitude of the int16 samples
+    channels: int, default 2
+        Number of output channels
+    ramp: float, default 0
+        Duration in seconds of the raised-cosine onset and offset ramps
+
+    Returns
+    -------
+    samples: np.ndarray of int16
+        Samples of shape (n_samples, channels), or (n_samples,) if mono
+    """
+    n_samples = int(round(sample_rate * maxtime))
+    t = np.arange(n_samples) / sample_rate
+    wave = amplitude * np.sin(2 * np.pi * freq * t)
+    n_ramp = min(int(round(sample_rate * ramp)), n_samples // 2)
+    if n_ramp:
+        envelope = 0.5 - 0.5 * np.cos(np.pi * np.arange(n_ramp) / n_ramp)
+        wave[:n_ramp] *= envelope
+        wave[n_samples - n_ramp :] *= envelope[::-1]
+    samples = wave.astype(np.int16)
+    if channels > 1:
+        samples = np.ascontiguousarray(np.repeat(samples[:, None], channels, axis=1))
+    return samples
+
+
+def generate_sine_wave_snd(freq, maxtime=5, sample_rate=None, amplitude=4096, ramp=0):
+    """Generate a pure tone sine wave
+
+    Parameters
+    ----------
+    freq: float
+        Frequency of tone in Hz
+    maxtime: float, default 5
+        Duration of sound in seconds
+    sample_rate: int, default None
+        Sampling rate of sound.  If None, uses the mixer's sample rate.
+    amplitude: int, default 4096
+        Peak amplitude of the int16 samples
+    ramp: float, default 0
+        Duration in seconds of the onset and offset ramps
+
     Returns
     -------
-    snd: pygame.sndarray objects
+    snd: pygame.mixer.Sound
     """
-    snd = [4096 * math.sin(2. * math.pi * freq * x / sample_rate) for x in range(sample_rate*maxtime)]
-    snd = [snd, snd]
-    snd = pygame.sndarray.make_sound(snd)
-    return snd
\ No newline at end of file
+    frequency, _, channels = pygame.mixer.get_init()
+    if sample_rate is None:
+        sample_rate = frequency
+    samples = generate_sine_wave(
+        freq, maxtime, sample_rate, amplitude, channels=channels, ramp=ramp
+    )
+    return pygame.sndarray.make_sound(samples)
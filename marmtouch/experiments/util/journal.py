@@ -0,0 +1,210 @@
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+_CLOSE = object()
+TRAILER_TYPE = "journal_trailer"
+
+
+class EventJournal:
+    """Append-only event journal written from a background thread
+
+    Batches of event records are queued by the task loop and serialized by a
+    writer thread as JSON lines (one compact record per line), so the task
+    loop never opens, serializes or flushes files itself.  The file is opened
+    once and kept open for the whole session.
+
+    When the session ends, `seal` appends a trailer record holding the
+    record count and a byte-offset index of the first record of each trial,
+    i.e. of the first record carrying a "trial" key such as the `trial_start`
+    record journaled with each trial's sync signal, and atomically renames the journal to its final path.  Sealing costs the
+    same regardless of session length.
+
+    Parameters
+    ----------
+    path: Path or path-like
+        File the journal is appended to
+    max_pending: int, default 1024
+        Maximum number of batches buffered between the task loop and the
+        writer thread.  If the buffer is full, `write` blocks until there is
+        room rather than dropping events.
+    flush_interval: float, default 1
+        Maximum time in seconds written records may sit in the file buffer
+        before being flushed.  If 0, every batch is flushed as it is written.
+    fsync: bool, default False
+        If True, `os.fsync` is called after each flush
+    """
+
+    def __init__(self, path, max_pending=1024, flush_interval=1.0, fsync=False):
+        self.path = Path(path)
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.n_records = 0
+        self.n_stalls = 0
+        self.index = {}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._file = None
+        self._thread = None
+
+    @property
+    def is_open(self):
+        return self._thread is not None
+
+    def open(self):
+        """Open the journal file and start the writer thread"""
+        if self.is_open:
+            return
+        self._file = open(self.path, "ab")
+        self._thread = threading.Thread(
+            target=self._run, name="marmtouch-journal", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, records):
+        """Queue a batch of records to be written
+
+        Empty batches are skipped.
+
+        Parameters
+        ----------
+        records: list of dict
+            Records to write. Must be JSON serializable.
+        """
+        if not records:
+            return
+        if not self.is_open:
+            raise RuntimeError("Journal must be opened before writing")
+        try:
+            self._queue.put_nowait(list(records))
+        except queue.Full:
+            self.n_stalls += 1
+            self._queue.put(list(records))
+
+    def close(self):
+        """Write all pending records, flush and close the journal file"""
+        if not self.is_open:
+            return
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        self._thread = None
+
+    def seal(self, final_path):
+        """Close the journal, append the trailer and move it to `final_path`
+
+        Parameters
+        ----------
+        final_path: Path or path-like
+            Path of the sealed journal.  Replaced atomically if it exists.
+
+        Returns
+        -------
+        final_path: Path
+        """
+        self.close()
+        trailer = dict(type=TRAILER_TYPE, n_records=self.n_records, index=self.index)
+        with open(self.path, "ab") as f:
+            f.write(_encode(trailer))
+            f.flush()
+            os.fsync(f.fileno())
+        final_path = Path(final_path)
+        os.replace(self.path, final_path)
+        self.path = final_path
+        return final_path
+
+    def _flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _run(self):
+        dirty = False
+        last_flush = time.monotonic()
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.flush_interval if dirty else None)
+            except queue.Empty:
+                self._flush()
+                dirty, last_flush = False, time.monotonic()
+                continue
+            if batch is _CLOSE:
+                break
+            for record in batch:
+                trial = record.get("trial")
+                if trial is not None and trial not in self.index:
+                    self.index[trial] = self._file.tell()
+                self._file.write(_encode(record))
+            self.n_records += len(batch)
+            dirty = True
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._flush()
+                dirty, last_flush = False, time.monotonic()
+        self._flush()
+        self._file.close()
+        self._file = None
+
+
+def _encode(record):
+    return (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode()
+
+
+def read_journal(path):
+    """Read all records from an event journal
+
+    Works on sealed and unsealed journals.  The trailer is not returned and a
+    truncated final line, as left by a crash, is ignored.
+
+    Parameters
+    ----------
+    path: Path or path-like
+        Path to the journal file
+
+    Returns
+    -------
+    records: list of dict
+    """
+    records = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                if line.endswith(b"\n"):
+                    raise
+                break
+            if record.get("type") != TRAILER_TYPE:
+                records.append(record)
+    return records
+
+
+def read_trailer(path):
+    """Read the trailer of a sealed journal without reading the records
+
+    Parameters
+    ----------
+    path: Path or path-like
+        Path to the journal file
+
+    Returns
+    -------
+    trailer: dict or None
+        Trailer record, or None if the journal was not sealed
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        chunk = b""
+        while position > 0 and chunk.count(b"\n") < 2:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            chunk = f.read(step) + chunk
+    lines = chunk.rstrip(b"\n").rsplit(b"\n", 1)
+    try:
+        record = json.loads(lines[-1])
+    except json.JSONDecodeError:
+        return None
+    return record if record.get("type") == TRAILER_TYPE else None
@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StimulusPrefetcher:
+    """Loads upcoming stimuli on a worker thread
+
+    Loads are submitted with `prefetch` while the task is idle (e.g. during
+    the intertrial interval).  The main thread picks the results up with
+    `take` when the stimulus is requested, or moves finished loads into the
+    cache with `collect`.  Only the main thread touches the cache.
+
+    Parameters
+    ----------
+    cache: LRUCache
+        Cache the prefetched stimuli are added to
+    max_workers: int, default 1
+        Number of worker threads
+    """
+
+    def __init__(self, cache, max_workers=1):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="marmtouch-prefetch"
+        )
+        self._pending = {}
+        self._trial_waited = False
+        self.n_submitted = 0
+        self.n_ready = 0
+        self.n_waited = 0
+        self.n_trials = 0
+        self.n_trials_waited = 0
+
+    def prefetch(self, key, load, *args):
+        """Start loading a stimulus unless it is cached or already loading
+
+        Parameters
+        ----------
+        key: tuple
+            Cache key of the stimulus
+        load: callable
+            Called with `args` on the worker thread to load the stimulus
+        """
+        if key in self.cache or key in self._pending:
+            return
+        self._pending[key] = self._executor.submit(load, *args)
+        self.n_submitted += 1
+
+    def take(self, key):
+        """Get a prefetched stimulus, waiting for its load to finish if needed
+
+        Returns
+        -------
+        stimulus: object or None
+            The loaded stimulus, or None if `key` was not prefetched
+        """
+        future = self._pending.pop(key, None)
+        if future is None:
+            return None
+        if future.done():
+            self.n_ready += 1
+        else:
+            self.n_waited += 1
+            self._trial_waited = True
+        return future.result()
+
+    def collect(self):
+        """Move finished loads into the cache
+
+        Failed loads are dropped, so the error is raised by the regular load
+        when the stimulus is requested.
+        """
+        for key, future in list(self._pending.items()):
+            if future.done():
+                del self._pending[key]
+                if future.exception() is None:
+                    self.cache.put(key, future.result())
+
+    def next_trial(self):
+        """Close the accounting of the current trial"""
+        if self._trial_waited:
+            self.n_trials_waited += 1
+        self._trial_waited = False
+        self.n_trials += 1
+
+    def close(self):
+        # cancel_futures needs Python 3.9, so queued loads are cancelled here
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
+
+    @property
+    def stats(self):
+        return dict(
+            submitted=self.n_submitted,
+            ready=self.n_ready,
+            waited=self.n_waited,
+            trials=self.n_trials,
+            trials_waited=self.n_trials_waited,
+        )
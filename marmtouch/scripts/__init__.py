@@ -1,12 +1,17 @@
 import click
 
 from marmtouch import __version__
+from marmtouch.scripts.calibrate_audio import calibrate_audio
+from marmtouch.scripts.extract_clips import extract_clips
 from marmtouch.scripts.launcher import launch
 from marmtouch.scripts.make_shortcut import make_shortcut
 from marmtouch.scripts.preview_items import preview_items
 from marmtouch.scripts.run import run
 from marmtouch.scripts.transfer_files import transfer_files
 from marmtouch.scripts.test import test
+from marmtouch.scripts.transcode import transcode
+from marmtouch.scripts.unpack_archive import unpack_archive
+from marmtouch.scripts.warm_cache import warm_cache
 
 
 @click.group()
@@ -27,6 +32,11 @@ marmtouch.add_command(transfer_files)
 marmtouch.add_command(launch)
 marmtouch.add_command(preview_items)
 marmtouch.add_command(test)
+marmtouch.add_command(warm_cache)
+marmtouch.add_command(calibrate_audio)
+marmtouch.add_command(extract_clips)
+marmtouch.add_command(transcode)
+marmtouch.add_command(unpack_archive)
 
 if __name__ == "__main__":
     marmtouch(ctx={})
@@ -0,0 +1,90 @@
+import os
+import statistics
+import time
+
+import click
+import pygame
+import RPi.GPIO as GPIO
+
+import marmtouch.util as util
+from marmtouch.experiments.util.audio import AudioOutput
+from marmtouch.experiments.util.generate_auditory_stimuli import generate_sine_wave_snd
+
+default_system_config_path = "/home/pi/marmtouch_system_config.yaml"
+
+
+@click.command()
+@click.option(
+    "--pin",
+    type=int,
+    default=None,
+    help="GPIO input pin of a microphone threshold detector. If not set, only the sync pin marks each click.",
+)
+@click.option(
+    "--n-clicks", default=20, help="Number of clicks to play. Default, 20"
+)
+@click.option(
+    "--interval", default=0.5, help="Seconds between clicks. Default, 0.5"
+)
+@click.option(
+    "--timeout", default=0.5, help="Seconds to wait for the detector. Default, 0.5"
+)
+def calibrate_audio(pin, n_clicks, interval, timeout):
+    """Measures the onset latency of the audio output.
+
+    Plays clicks using the mixer settings in the `audio` section of the system
+    config and raises the sync pin at each play call.  If a microphone
+    threshold detector is connected to PIN, the time from each play call to
+    the detector edge is measured and the `output_latency` to add to the
+    system config is reported.  Otherwise, measure the lag between the sync
+    pulses and the clicks with an external recording.
+    """
+    system_config_path = os.environ.get(
+        "MARMTOUCH_SYSTEM_CONFIG", default_system_config_path
+    )
+    system_config = util.read_yaml(system_config_path)
+    sync_pin = system_config.get("ttl", {}).get("sync", 16)
+
+    audio = AudioOutput(**system_config.get("audio", {}))
+    audio.pre_init()
+    pygame.init()
+    audio.init(["calibration"])
+    click_snd = generate_sine_wave_snd(1000, 0.01, amplitude=16384)
+    sync = util.TTL(sync_pin)
+    if pin is not None:
+        GPIO.setup(pin, GPIO.IN)
+
+    latencies = []
+    try:
+        for _ in range(n_clicks):
+            sync.on()
+            play_time = time.perf_counter()
+            audio.play(click_snd, "calibration")
+            if pin is not None:
+                edge = GPIO.wait_for_edge(pin, GPIO.RISING, timeout=int(timeout * 1000))
+                if edge is not None:
+                    latencies.append(time.perf_counter() - play_time)
+            sync.off()
+            time.sleep(interval)
+    finally:
+        GPIO.cleanup()
+        pygame.quit()
+
+    buffer_latency = audio.buffer / audio.frequency
+    print(
+        f"Mixer: {audio.frequency} Hz, {audio.channels} channels, "
+        f"{audio.buffer} sample buffer ({buffer_latency * 1000:.1f} ms)"
+    )
+    if pin is None:
+        print(f"Played {n_clicks} clicks with sync pulses on pin {sync_pin}")
+        return
+    if not latencies:
+        print(f"No clicks detected on pin {pin}")
+        return
+    median = statistics.median(latencies)
+    print(
+        f"Detected {len(latencies)}/{n_clicks} clicks. Latency: "
+        f"median {median * 1000:.1f} ms, min {min(latencies) * 1000:.1f} ms, "
+        f"max {max(latencies) * 1000:.1f} ms"
+    )
+    print(f"Set audio: output_latency: {max(median - buffer_latency, 0):.4f}")
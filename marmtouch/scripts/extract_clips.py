@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import click
+
+from marmtouch.util.camera import ContinuousRecorder, extract_clip, read_index
+
+
+@click.command()
+@click.argument("SESSION", type=click.Path(exists=True, file_okay=False))
+@click.argument("TRIALS", type=int, nargs=-1)
+@click.option(
+    "--output",
+    default=None,
+    help="Directory to write clips to. Default, SESSION/clips",
+)
+def extract_clips(session, trials, output):
+    """Extracts the video of TRIALS from the continuous recording of SESSION.
+
+    If no TRIALS are given, the clips of all trials are extracted.  Clips
+    start at the key frame at or before the trial start, and their frame
+    times are written next to them.
+    """
+    session = Path(session)
+    index = read_index(session / ContinuousRecorder.index_name)
+    output = session / "clips" if output is None else Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    if not trials:
+        trials = sorted(index)
+    for trial in trials:
+        if trial not in index:
+            print(f"Trial {trial} is not in the video index")
+            continue
+        extract_clip(
+            session / ContinuousRecorder.video_name,
+            index[trial],
+            output / f"{trial}.h264",
+        )
+    print(f"Clips written to {output}")
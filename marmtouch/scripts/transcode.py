@@ -0,0 +1,192 @@
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import click
+import numpy as np
+from tqdm import tqdm
+
+from marmtouch.util.camera import (
+    ContinuousRecorder,
+    frame_times_path,
+    read_frame_times,
+    read_index,
+)
+
+DEFAULT_FRAMERATE = 30
+
+
+def _framerate(frame_times):
+    """Nominal frame rate of a video from its frame times"""
+    intervals = np.diff(frame_times[~np.isnan(frame_times)])
+    intervals = intervals[intervals > 0]
+    if not intervals.size:
+        return DEFAULT_FRAMERATE
+    return 1 / np.median(intervals)
+
+
+def _escape(value):
+    """Escape a value for an ffmetadata file"""
+    for char in "\\=;#\n":
+        value = value.replace(char, "\\" + char)
+    return value
+
+
+def _ffmetadata(video, frame_times, framerate):
+    """ffmetadata with the trial index of a video as tags and chapters
+
+    A per-trial video is tagged with its trial number.  A continuous session
+    video gets one chapter per trial of its video index.  The MP4 is muxed
+    at the constant `framerate`, so its timestamps are nominal.  The exact
+    per-frame times stay in the .frames sidecar shipped next to the MP4.
+    The comment tag names that sidecar and gives the frame count and the
+    first and last frame times on the experiment clock, for a coarse
+    alignment without it.
+    """
+    tags = dict(title=video.stem)
+    if video.stem.isdigit():
+        tags["trial"] = video.stem
+    valid = frame_times[~np.isnan(frame_times)]
+    if valid.size:
+        tags["comment"] = json.dumps(
+            dict(
+                frame_times=frame_times_path(video).name,
+                n_frames=int(frame_times.size),
+                first_frame_time=float(valid[0]),
+                last_frame_time=float(valid[-1]),
+            )
+        )
+    lines = [";FFMETADATA1"]
+    lines += [f"{key}={_escape(value)}" for key, value in tags.items()]
+    index_path = video.parent / ContinuousRecorder.index_name
+    if video.name == ContinuousRecorder.video_name and index_path.is_file():
+        for trial, entry in sorted(read_index(index_path).items()):
+            lines += [
+                "[CHAPTER]",
+                "TIMEBASE=1/1000",
+                f"START={round(entry['start_frame'] / framerate * 1000)}",
+                f"END={round(entry['end_frame'] / framerate * 1000)}",
+                f"title=Trial {trial}",
+            ]
+    return "\n".join(lines) + "\n"
+
+
+def _up_to_date(video, output):
+    """Whether the MP4 and frame times of a video were written after the video"""
+    if not output.is_file():
+        return False
+    if frame_times_path(video).is_file() and not frame_times_path(output).is_file():
+        return False
+    sources = [video, frame_times_path(video)]
+    newest = max(source.stat().st_mtime for source in sources if source.is_file())
+    return output.stat().st_mtime >= newest
+
+
+def _transcode(video, output, codec="copy", ffmpeg="ffmpeg", threads=1):
+    """Wrap or transcode a raw .h264 video into an MP4
+
+    Written to a temporary file first and moved into place when ffmpeg
+    succeeds, so an interrupted run never leaves a partial MP4.  The MP4 has
+    a constant frame rate.  Per-frame times on the experiment clock are not
+    written into the container.  Instead, the .frames sidecar of the video
+    is shipped next to the MP4, where `read_frame_times` finds it.
+    """
+    video, output = Path(video), Path(output)
+    if frame_times_path(video).is_file():
+        frame_times = read_frame_times(video)
+    else:
+        frame_times = np.array([])
+    framerate = _framerate(frame_times)
+    tmp = output.with_name(f".{output.name}.tmp")
+    metadata = output.with_name(f".{output.stem}.ffmetadata")
+    metadata.write_text(_ffmetadata(video, frame_times, framerate))
+    command = [
+        ffmpeg, "-y", "-loglevel", "error",
+        "-fflags", "+genpts", "-f", "h264", "-framerate", f"{framerate:.6f}", "-i", video,
+        "-i", metadata,
+        "-map", "0:v", "-map_metadata", "1", "-map_chapters", "1",
+        "-c:v", codec, "-threads", str(threads),
+        "-movflags", "+faststart", "-f", "mp4", tmp,
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True)
+        if frame_times.size and frame_times_path(output) != frame_times_path(video):
+            shutil.copy2(frame_times_path(video), frame_times_path(output))
+        os.replace(tmp, output)
+    finally:
+        metadata.unlink(missing_ok=True)
+        tmp.unlink(missing_ok=True)
+    return output
+
+
+@click.command()
+@click.argument("SESSIONS", type=click.Path(exists=True, file_okay=False), nargs=-1)
+@click.option(
+    "--codec",
+    default="copy",
+    help='Video codec passed to ffmpeg. Default, "copy" to wrap the stream without re-encoding',
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="Number of videos processed in parallel. Default, the number of cores",
+)
+@click.option(
+    "--output",
+    default=None,
+    help="Directory the MP4s are written to, in a folder per session. Default, next to the videos",
+)
+@click.option("--force", is_flag=True, help="Process videos that are already up to date")
+@click.option("--ffmpeg", default="ffmpeg", help="ffmpeg executable")
+def transcode(sessions, codec, jobs, output, force, ffmpeg):
+    """Converts the .h264 videos of SESSIONS into indexed MP4s.
+
+    Each MP4 gets a seek index at the start of the file, the trial number or
+    the per-trial chapters of a continuous recording, and the experiment
+    clock times of its first and last frames.  MP4s play at a constant frame
+    rate.  The exact time of every frame is not stored in the MP4.  It is
+    in the .frames sidecar written next to each MP4.
+
+    Videos whose MP4 is newer than the video are skipped, so the command can
+    be rerun on the same sessions after an interruption.
+    """
+    if shutil.which(ffmpeg) is None:
+        raise click.ClickException(f"{ffmpeg} was not found")
+    jobs = jobs or os.cpu_count() or 1
+    todo = []
+    for session in map(Path, sessions):
+        out_dir = session if output is None else Path(output) / session.name
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for video in sorted(session.glob("*.h264")):
+            out = out_dir / f"{video.stem}.mp4"
+            if force or not _up_to_date(video, out):
+                todo.append((video, out))
+    if not todo:
+        print("All videos are up to date")
+        return
+
+    # one ffmpeg thread per job when several videos are encoded at once
+    threads = 1 if jobs > 1 else 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(_transcode, video, out, codec, ffmpeg, threads): video
+            for video, out in todo
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), unit="video"):
+            try:
+                future.result()
+            except subprocess.CalledProcessError as e:
+                failed.append(futures[future])
+                print(f"Failed to process {futures[future]}: {e.stderr.strip()}")
+            except Exception as e:
+                failed.append(futures[future])
+                print(f"Failed to process {futures[future]}: {e}")
+    print(f"{len(todo) - len(failed)} of {len(todo)} videos processed")
+    if failed:
+        raise click.ClickException(f"{len(failed)} videos failed, rerun to retry them")
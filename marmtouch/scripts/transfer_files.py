@@ -1,21 +1,227 @@
+import hashlib
+import json
+import logging
 import shutil
 import subprocess
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import click
 import yaml
 from tqdm import tqdm
 
-import marmtouch.util as util
+from marmtouch.util.archive import COMPRESSIONS, archive_name, hash_file, write_archive
 
+CHUNK_SIZE = 2**20
+RETRIES = 3
+RETRY_DELAY = 1
+MANIFEST_NAME = "transfer_manifest.json"
 
-def _transfer_files(videos_directory, server_path, verbose=True):
+
+class TransferProgress:
+    """Progress bar of the bytes copied by all transfers
+
+    Shows the aggregate throughput.  Sessions add the size of their files to
+    the total as they are queued.
+    """
+
+    def __init__(self):
+        self.bar = tqdm(total=0, unit="B", unit_scale=True, unit_divisor=1024, desc="transfer")
+        self._lock = threading.Lock()
+
+    def add_total(self, nbytes):
+        with self._lock:
+            self.bar.total += nbytes
+            self.bar.refresh()
+
+    def update(self, nbytes):
+        with self._lock:
+            self.bar.update(nbytes)
+
+    def close(self):
+        self.bar.close()
+
+
+def _copy_file(source, target, progress=None, retries=RETRIES, logger=None, verbose=True):
+    """Copy a file in chunks, retrying it on failure
+
+    The source is hashed as it is copied, so it is read once.  The copy is
+    then read back and must have the same hash.  A failed attempt is
+    retried after RETRY_DELAY seconds, up to `retries` times, and its bytes
+    are removed from the progress.
+
+    Returns
+    -------
+    entry: dict or None
+        Manifest entry of the file (size, sha256 and mtime of the source),
+        or None if the file could not be copied
+    """
+    for attempt in range(retries + 1):
+        copied = 0
+        try:
+            stat = Path(source).stat()
+            hasher = hashlib.sha256()
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    dst.write(chunk)
+                    copied += len(chunk)
+                    if progress is not None:
+                        progress.update(len(chunk))
+            shutil.copystat(source, target)
+            if copied != stat.st_size:
+                raise OSError(f"{source} changed size while it was copied")
+            digest = hasher.hexdigest()
+            if hash_file(target) != digest:
+                raise OSError(f"Hash of {target} does not match {source}")
+            return dict(size=copied, sha256=digest, mtime=stat.st_mtime)
+        except Exception:
+            if progress is not None:
+                progress.update(-copied)
+            if logger is not None:
+                logger.warning(
+                    f"Failed to copy {source} (attempt {attempt + 1} of {retries + 1})",
+                    exc_info=verbose and attempt == retries,
+                )
+            if attempt < retries:
+                time.sleep(RETRY_DELAY)
+    return None
+
+
+def _read_manifest(directory):
+    """Transfer manifest of a session directory, or None if there is none"""
+    path = Path(directory) / MANIFEST_NAME
+    if not path.is_file():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST_NAME
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _matches(path, entry):
+    """Whether a file is the one described by a manifest entry"""
+    stat = path.stat()
+    return stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]
+
+
+def _remove_transferred(videos_directory, manifest):
+    """Remove the files of a session listed in its manifest
+
+    The session directory is removed if nothing else is left in it.
+    """
+    for name, entry in manifest["files"].items():
+        path = videos_directory / name
+        if path.is_file() and _matches(path, entry):
+            path.unlink()
+    remaining = [f for f in videos_directory.iterdir() if f.name != MANIFEST_NAME]
+    if manifest["complete"] and not remaining:
+        (videos_directory / MANIFEST_NAME).unlink()
+        videos_directory.rmdir()
+
+
+def _session_logger(path):
+    """Logger of the transfer of one session, written to the session's log
+
+    Separate from the marmtouch logger singleton so sessions transferred
+    concurrently each log to their own file.
+    """
+    logger = logging.getLogger(f"marmtouch.transfer.{Path(path).stem}")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    file_handler = logging.FileHandler(path)
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(logging.WARN)
+    logger.handlers[:] = [file_handler, stream_handler]
+    return logger
+
+
+def _close_logger(logger):
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers[:] = []
+
+
+def _transfer_files(
+    videos_directory,
+    server_path,
+    verbose=True,
+    file_pool=None,
+    progress=None,
+    archive=False,
+    compression=None,
+):
+    """Copy a session to the server and remove the copied files
+
+    A manifest with the name, size, sha256 and mtime of every copied file
+    is written to both the server and the session directory before any
+    original is removed.  Only originals whose copy has the same hash are
+    removed.  If a session directory still has a manifest, an earlier
+    transfer of it was interrupted: a complete one only has its originals
+    removed, and an incomplete one is resumed in the same server directory,
+    skipping the files already in the manifest.
+
+    Parameters
+    ----------
+    videos_directory: Path
+        Session directory
+    server_path: Path
+        Directory the session is copied into
+    verbose: bool, default True
+        Whether tracebacks of failed copies are logged
+    file_pool: ThreadPoolExecutor, default None
+        Pool the files are copied on.  If None, they are copied one at a time.
+    progress: TransferProgress, default None
+        Progress the copied bytes are reported to
+    archive: bool, default False
+        Whether the session is streamed into a single tar archive instead
+        of being copied file by file, see `_archive_session`
+    compression: {None, "gz", "bz2", "xz"}, default None
+        Compression of the archive
+    """
     session = videos_directory.name
     videos_directory = Path(videos_directory)
     server_path = Path(server_path)
 
+    manifest = _read_manifest(videos_directory)
+    if manifest is not None and manifest["complete"]:
+        print(f"{session} was already transferred to {manifest['destination']}")
+        _remove_transferred(videos_directory, manifest)
+        return
+    if manifest is not None and not archive:
+        server_session_path = Path(manifest["destination"])
+        if server_session_path.is_dir():
+            logger = _session_logger((server_session_path / f"{session}.log").as_posix())
+            try:
+                logger.info(f"Resuming transfer of {videos_directory.as_posix()}")
+                _transfer_session(
+                    videos_directory,
+                    server_session_path,
+                    logger,
+                    verbose,
+                    file_pool,
+                    progress,
+                    manifest["files"],
+                )
+            finally:
+                _close_logger(logger)
+            return
+        print(f"Destination of the earlier transfer of {session} is missing. Starting over.")
+
     if (videos_directory / "params.yaml").is_file():
         params = yaml.safe_load(open(videos_directory / "params.yaml"))
         transfer_path = params.get("transfer_path")
@@ -23,8 +229,9 @@ def _transfer_files(videos_directory, server_path, verbose=True):
             server_path = server_path / transfer_path
             server_path.mkdir(parents=True, exist_ok=True)
 
-    failed = []
-    success = []
+    if archive:
+        _archive_session(videos_directory, server_path, compression, verbose, progress)
+        return
 
     server_session_path = server_path / session
     logger_path = server_session_path / f"{session}.log"
@@ -39,15 +246,41 @@ def _transfer_files(videos_directory, server_path, verbose=True):
         print(f"Failed to create directory {server_session_path}.")
         print(e)
         return
-    logger = util.getLogger(logger_path.as_posix(), capture_errors=False)
-    videos = set(video for video in videos_directory.iterdir() if video.is_file())
+    logger = _session_logger(logger_path.as_posix())
+    try:
+        _transfer_session(
+            videos_directory, server_session_path, logger, verbose, file_pool, progress
+        )
+    finally:
+        _close_logger(logger)
+
+
+def _transfer_session(
+    videos_directory,
+    server_session_path,
+    logger,
+    verbose,
+    file_pool,
+    progress,
+    transferred=None,
+):
+    videos = set(
+        video
+        for video in videos_directory.iterdir()
+        if video.is_file() and video.name != MANIFEST_NAME
+    )
+    transferred = dict(transferred or {})
 
     if not videos:
         logger.warn(f"No files to copy in {videos_directory.as_posix()}")
         return
 
     videos_already_copied = set(
-        video for video in videos if (server_session_path / video.name).is_file()
+        video
+        for video in videos
+        if video.name in transferred
+        and (server_session_path / video.name).is_file()
+        and _matches(video, transferred[video.name])
     )
     videos_to_copy = videos - videos_already_copied
 
@@ -56,53 +289,177 @@ def _transfer_files(videos_directory, server_path, verbose=True):
         logger.info(f"{nvids} videos have already been copied. Skipping.")
 
     if videos_to_copy:
-        logger.info(f"{nvids} videos to copy.")
-    else:
-        logger.info(f"No files to copy in {videos_directory.as_posix()}")
-        return
+        logger.info(f"{len(videos_to_copy)} videos to copy.")
 
-    for video_file in tqdm(videos_to_copy, desc="video"):
+    if progress is not None:
+        progress.add_total(sum(video.stat().st_size for video in videos_to_copy))
+    copies = {}
+    for video_file in videos_to_copy:
         target = server_session_path / video_file.name
-        try:
-            shutil.copy(video_file.as_posix(), target.as_posix(), follow_symlinks=False)
-        except:
-            logger.warn(f"Failed to copy {video_file}", exc_info=verbose)
+        copy_args = video_file, target, progress, RETRIES, logger, verbose
+        if file_pool is None:
+            copies[video_file, target] = _copy_file(*copy_args)
+        else:
+            copies[video_file, target] = file_pool.submit(_copy_file, *copy_args)
+
+    failed = []
+    for (video_file, target), entry in copies.items():
+        if file_pool is not None:
+            entry = entry.result()
+        if entry is None:
             failed.append((video_file, target))
         else:
-            success.append((video_file, target))
+            transferred[video_file.name] = entry
 
     logger.info("Completed file transfers")
 
-    corrupt = []
-    for orig, copy in tqdm(success, desc="verify"):
-        if orig.stat().st_size == copy.stat().st_size:
-            orig.unlink()
-        else:
-            corrupt.append((orig, copy))
+    manifest = dict(
+        session=videos_directory.name,
+        destination=server_session_path.as_posix(),
+        complete=not failed,
+        files=transferred,
+    )
+    _write_manifest(server_session_path, manifest)
+    _write_manifest(videos_directory, manifest)
 
     if failed:
         logger.warn(
-            f"{len(failed)} files did not transfer at all. Failed to copy: {', '.join(map(str, failed))}"
-        )
-
-    if corrupt:
-        logger.warn(
-            f"{len(corrupt)} files did not transfer properly. Corrupt files: {', '.join(map(str,corrupt))}"
+            f"{len(failed)} files did not transfer. Failed to copy: {', '.join(map(str, failed))}"
         )
     else:
         logger.info("Verification complete. No corrupt files.")
+    _remove_transferred(videos_directory, manifest)
 
-    if failed or corrupt:
-        pass
-    else:
-        videos_directory.rmdir()
+
+def _archive_session(videos_directory, server_path, compression=None, verbose=True, progress=None):
+    """Stream a session into a single tar archive on the server
+
+    Writing one archive avoids creating every file of the session on the
+    share.  The archive index, with the size, sha256, mtime and offset of
+    every file, is written next to the archive and can be used to extract
+    or verify files with `marmtouch unpack-archive`.  The archive is
+    written again from the start if it fails, up to RETRIES times.  The
+    originals are removed once the archive has been read back and matches.
+    """
+    session = videos_directory.name
+    archive = server_path / archive_name(session, compression)
+    copy_no = 1
+    while archive.exists():
+        print(f"Archive already exists at loc: {archive.as_posix()}")
+        archive = server_path / archive_name(f"{session} ({copy_no})", compression)
+        copy_no += 1
+    logger = _session_logger(archive.with_name(f"{archive.name}.log").as_posix())
+    try:
+        files = sorted(
+            f
+            for f in videos_directory.iterdir()
+            if f.is_file() and f.name != MANIFEST_NAME
+        )
+        if not files:
+            logger.warn(f"No files to copy in {videos_directory.as_posix()}")
+            return
+        logger.info(f"{len(files)} files to archive to {archive.as_posix()}.")
+        if progress is not None:
+            progress.add_total(sum(f.stat().st_size for f in files))
+
+        index = None
+        for attempt in range(RETRIES + 1):
+            copied = [0]
+
+            def on_bytes(nbytes):
+                copied[0] += nbytes
+                if progress is not None:
+                    progress.update(nbytes)
+
+            try:
+                index = write_archive(files, archive, compression, on_bytes)
+                break
+            except Exception:
+                if progress is not None:
+                    progress.update(-copied[0])
+                logger.warning(
+                    f"Failed to archive {videos_directory} (attempt {attempt + 1} of {RETRIES + 1})",
+                    exc_info=verbose and attempt == RETRIES,
+                )
+                if attempt < RETRIES:
+                    time.sleep(RETRY_DELAY)
+        if index is None:
+            logger.warn(f"{videos_directory} did not transfer.")
+            return
+
+        logger.info("Verification complete. No corrupt files.")
+        files = {
+            name: dict(size=entry["size"], sha256=entry["sha256"], mtime=entry["mtime"])
+            for name, entry in index["files"].items()
+        }
+        manifest = dict(
+            session=session,
+            destination=archive.as_posix(),
+            complete=True,
+            files=files,
+        )
+        _write_manifest(videos_directory, manifest)
+        _remove_transferred(videos_directory, manifest)
+    finally:
+        _close_logger(logger)
 
 
 default_source = Path(os.environ.get("MARMTOUCH_DATA_DIRECTORY", "/home/pi/Touchscreen"))
 default_destination = "/mnt/Data/Touchscreen/Data"
+default_sessions = 2
+default_files = 4
+
 
+def _transfer_sessions(
+    sessions,
+    server_path,
+    n_sessions=default_sessions,
+    n_files=default_files,
+    archive=False,
+    compression=None,
+):
+    """Transfer sessions concurrently
+
+    Up to `n_sessions` sessions are transferred at once, and their files are
+    copied on a shared pool of `n_files` threads, so the latency of each file
+    on a network mount overlaps with the others.  A file that fails is
+    retried on its own without holding up the rest.  With `archive`, each
+    session is streamed into one archive on its session thread instead.
+    """
+    progress = TransferProgress()
+    try:
+        with ThreadPoolExecutor(n_files, thread_name_prefix="marmtouch-file") as file_pool:
+            with ThreadPoolExecutor(n_sessions, thread_name_prefix="marmtouch-session") as session_pool:
+                futures = [
+                    session_pool.submit(
+                        _transfer_files,
+                        session_directory,
+                        server_path,
+                        file_pool=file_pool,
+                        progress=progress,
+                        archive=archive,
+                        compression=compression,
+                    )
+                    for session_directory in sessions
+                ]
+                for session_directory, future in zip(sessions, futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Failed to transfer {session_directory}: {e}")
+    finally:
+        progress.close()
 
-def bulk_transfer_files(source=default_source, dest=default_destination, mount=True):
+
+def bulk_transfer_files(
+    source=default_source,
+    dest=default_destination,
+    mount=True,
+    n_sessions=default_sessions,
+    n_files=default_files,
+    archive=False,
+    compression=None,
+):
     if mount:
         subprocess.Popen("sudo mount -a", shell=True)
     videos_directory = Path(source)
@@ -117,8 +474,7 @@ def bulk_transfer_files(source=default_source, dest=default_destination, mount=T
         print("Waiting for server mount...")
         time.sleep(T_INTERVAL)
     sessions = [f for f in videos_directory.iterdir() if f.is_dir()]
-    for session_directory in tqdm(sessions, desc="sessions"):
-        _transfer_files(session_directory, server_path)
+    _transfer_sessions(sessions, server_path, n_sessions, n_files, archive, compression)
 
 
 @click.command()
@@ -134,9 +490,33 @@ def bulk_transfer_files(source=default_source, dest=default_destination, mount=T
     default=default_destination,
     help="Destination where data will be saved",
 )
-def transfer_files(source, dest):
+@click.option(
+    "--sessions",
+    "n_sessions",
+    type=int,
+    default=default_sessions,
+    help="Number of sessions transferred concurrently",
+)
+@click.option(
+    "--files",
+    "n_files",
+    type=int,
+    default=default_files,
+    help="Number of files copied concurrently",
+)
+@click.option(
+    "--archive",
+    is_flag=True,
+    help="Stream each session into a single tar archive with an index",
+)
+@click.option(
+    "--compression",
+    type=click.Choice([c for c in COMPRESSIONS if c is not None]),
+    default=None,
+    help="Compression of the archives. Default, uncompressed",
+)
+def transfer_files(source, dest, n_sessions, n_files, archive, compression):
     videos_directory = Path(source)
     server_path = Path(dest)
     sessions = [f for f in videos_directory.iterdir() if f.is_dir()]
-    for session_directory in tqdm(sessions, desc="sessions"):
-        _transfer_files(session_directory, server_path)
+    _transfer_sessions(sessions, server_path, n_sessions, n_files, archive, compression)
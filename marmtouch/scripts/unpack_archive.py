@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import click
+
+from marmtouch.util.archive import unpack_archive as _unpack_archive
+
+
+@click.command()
+@click.argument("ARCHIVE", type=click.Path(exists=True, dir_okay=False))
+@click.argument("FILES", nargs=-1)
+@click.option(
+    "--output",
+    default=None,
+    help="Directory to extract to. Default, a folder named after the session next to ARCHIVE",
+)
+@click.option("--verify", is_flag=True, help="Only verify the files, without extracting them")
+def unpack_archive(archive, files, output, verify):
+    """Extracts FILES from a session ARCHIVE written by transfer-files.
+
+    If no FILES are given, all files are extracted.  Every file is checked
+    against the hash in the archive index.
+    """
+    archive = Path(archive)
+    if output is None:
+        output = archive.with_name(archive.name.split(".tar")[0])
+    output = Path(output)
+    if not verify:
+        output.mkdir(parents=True, exist_ok=True)
+    bad = _unpack_archive(archive, output, files or None, verify)
+    if bad:
+        raise click.ClickException(
+            f"{len(bad)} files are missing or corrupt: {', '.join(bad)}"
+        )
+    if verify:
+        print(f"All files in {archive} match the index")
+    else:
+        print(f"Files extracted to {output}")
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import click
+
+from marmtouch.util.raster_cache import get_default_cache
+from marmtouch.util.read_yaml import read_yaml
+from marmtouch.util.svg2img import get_template
+
+
+def _svg_specs(config):
+    """Yield the (path, colour, size) of every svg stimulus in a config"""
+    items = config.get("items", {})
+    for item in items.values():
+        if isinstance(item, dict) and item.get("type") == "svg":
+            yield item["path"], item.get("colour"), item["size"]
+    # conditions may override the parameters of named items
+    for condition in config.get("conditions", {}).values():
+        if not isinstance(condition, dict):
+            continue
+        for value in condition.values():
+            if not isinstance(value, dict) or value.get("name") not in items:
+                continue
+            item = dict(items[value["name"]], **value)
+            if item.get("type") == "svg":
+                yield item["path"], item.get("colour"), item["size"]
+
+
+@click.command()
+@click.argument("CONFIG_DIRECTORY", type=click.Path(exists=True))
+def warm_cache(config_directory):
+    """Rasterize the svg stimuli of all configs in a directory
+
+    Renders are stored in the raster cache, so sessions using these configs
+    skip rasterizing at startup.
+    """
+    cache = get_default_cache()
+    config_directory = Path(config_directory)
+    configs = [config_directory] if config_directory.is_file() else sorted(
+        config_directory.rglob("*.yaml")
+    )
+    # group colours by svg and size so each svg is parsed once
+    colour_sets = {}
+    for config_path in configs:
+        config = read_yaml(config_path)
+        if not isinstance(config, dict):
+            continue
+        for path, colour, size in _svg_specs(config):
+            colours = colour_sets.setdefault((path, tuple(size)), {})
+            colours.setdefault(str(colour), colour)
+    n_rendered = 0
+    for (path, size), colours in colour_sets.items():
+        try:
+            template = get_template(path)
+        except FileNotFoundError:
+            print(f"{path} not found")
+            continue
+        template.render_many(colours.values(), size, cache=cache)
+        n_rendered += len(colours)
+    print(f"Warmed {n_rendered} svg renders in {cache.directory} ({cache.nbytes} bytes)")
@@ -1,5 +1,5 @@
 from .logging import getLogger
 from .read_yaml import read_yaml
 from .setup import setup_camera, setup_screen
-from .ttl import TTL
+from .ttl import TTL, PulseEngine, TTLInput, VirtualPulseEngine
 from .get_data_directory import get_data_directory
\ No newline at end of file
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import tarfile
+from pathlib import Path
+
+CHUNK_SIZE = 2**20
+COMPRESSIONS = {None: "", "gz": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+
+class _HashingReader:
+    """File wrapper that hashes and counts the bytes read through it"""
+
+    def __init__(self, file, on_bytes=None):
+        self.file = file
+        self.on_bytes = on_bytes
+        self.hasher = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.hasher.update(data)
+        if self.on_bytes is not None:
+            self.on_bytes(len(data))
+        return data
+
+
+class _HashingWriter:
+    """File wrapper that hashes the bytes written through it"""
+
+    def __init__(self, file):
+        self.file = file
+        self.hasher = hashlib.sha256()
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self.file.write(data)
+
+
+def archive_name(session, compression=None):
+    """File name of the archive of a session"""
+    return f"{session}.tar{COMPRESSIONS[compression]}"
+
+
+def index_path(archive):
+    """Path of the index written next to an archive"""
+    archive = Path(archive)
+    return archive.with_name(f"{archive.name}.index.json")
+
+
+def hash_file(path):
+    """sha256 of a file, read in chunks"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def write_archive(files, path, compression=None, on_bytes=None):
+    """Stream files into a tar archive with an index
+
+    The archive is written in one pass to a temporary file next to `path`,
+    read back to check its hash, and moved into place.  Each file is hashed
+    as it is read into the archive.  The index is written next to the
+    archive, see `index_path`.  For uncompressed archives, it has the
+    offset of each file's data, so single files can be read without going
+    through the archive.
+
+    Parameters
+    ----------
+    files: list of Path
+        Files to archive, stored under their name
+    path: Path
+        Archive file
+    compression: {None, "gz", "bz2", "xz"}, default None
+        Compression of the archive
+    on_bytes: callable, default None
+        Called with the number of bytes read after each read of a file
+
+    Returns
+    -------
+    index: dict
+        Index of the archive, with the size, sha256, mtime and data offset
+        of each file, keyed by name
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    entries = {}
+    try:
+        with open(tmp, "wb") as f:
+            writer = _HashingWriter(f)
+            with tarfile.open(fileobj=writer, mode=f"w|{compression or ''}") as tar:
+                for file in files:
+                    file = Path(file)
+                    stat = file.stat()
+                    info = tar.gettarinfo(file, arcname=file.name)
+                    with open(file, "rb") as src:
+                        reader = _HashingReader(src, on_bytes)
+                        tar.addfile(info, reader)
+                    # data ends at the last full block before the current offset
+                    n_blocks = -(-info.size // tarfile.BLOCKSIZE)
+                    entries[file.name] = dict(
+                        size=info.size,
+                        sha256=reader.hasher.hexdigest(),
+                        mtime=stat.st_mtime,
+                        offset=tar.offset - n_blocks * tarfile.BLOCKSIZE,
+                    )
+        digest = writer.hasher.hexdigest()
+        if hash_file(tmp) != digest:
+            raise OSError(f"Hash of {path} does not match the data written")
+        index = dict(
+            archive=path.name,
+            compression=compression,
+            sha256=digest,
+            files=entries,
+        )
+        with open(index_path(path), "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return index
+
+
+def read_index(archive):
+    """Read the index of an archive written by `write_archive`"""
+    with open(index_path(archive)) as f:
+        return json.load(f)
+
+
+def read_file(archive, name, index=None):
+    """Read one file from an archive, checking its hash
+
+    Uncompressed archives are read at the file's offset.  Compressed
+    archives are decompressed up to the file.
+    """
+    if index is None:
+        index = read_index(archive)
+    entry = index["files"][name]
+    if index["compression"] is None:
+        with open(archive, "rb") as f:
+            f.seek(entry["offset"])
+            data = f.read(entry["size"])
+    else:
+        with tarfile.open(archive, f"r|{index['compression']}") as tar:
+            for member in tar:
+                if member.name == name:
+                    data = tar.extractfile(member).read()
+                    break
+            else:
+                raise KeyError(f"{name} is not in {archive}")
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise ValueError(f"Hash of {name} in {archive} does not match the index")
+    return data
+
+
+def unpack_archive(archive, output=None, names=None, verify_only=False):
+    """Extract and verify the files of an archive against its index
+
+    Parameters
+    ----------
+    archive: Path
+        Archive file
+    output: Path, default None
+        Directory the files are extracted to.  Default, the archive's
+        directory.
+    names: list of str, default None
+        Files to extract.  If None, all files.
+    verify_only: bool, default False
+        Only check the hashes, without writing files
+
+    Returns
+    -------
+    bad: list of str
+        Names of the files missing from the archive or whose hash does not
+        match the index
+    """
+    archive = Path(archive)
+    index = read_index(archive)
+    output = archive.parent if output is None else Path(output)
+    names = set(index["files"] if names is None else names)
+    bad = []
+    found = set()
+    with tarfile.open(archive, f"r|{index['compression'] or ''}") as tar:
+        for member in tar:
+            if member.name not in names or not member.isfile():
+                continue
+            found.add(member.name)
+            entry = index["files"].get(member.name)
+            src = tar.extractfile(member)
+            hasher = hashlib.sha256()
+            target = output / member.name
+            tmp = target.with_name(f".{target.name}.tmp")
+            dst = None if verify_only else open(tmp, "wb")
+            try:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+                    if dst is not None:
+                        dst.write(chunk)
+            finally:
+                if dst is not None:
+                    dst.close()
+            if entry is None or hasher.hexdigest() != entry["sha256"]:
+                bad.append(member.name)
+                if dst is not None:
+                    tmp.unlink()
+            elif dst is not None:
+                os.replace(tmp, target)
+                os.utime(target, (entry["mtime"], entry["mtime"]))
+    bad += sorted(names - found)
+    return bad
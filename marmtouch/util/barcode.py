@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def barcode_pulses(value, n_bits=16, unit=0.005):
+    """Pulse train encoding a value, e.g. the trial number
+
+    The barcode starts with a start pulse of 4 `unit`s, whose rising edge
+    marks the onset.  Each bit follows as a pulse of 1 (bit 0) or 2 (bit 1)
+    `unit`s, most significant bit first.  Pulses start every 5 `unit`s.
+
+    Parameters
+    ----------
+    value: int
+        Value to encode, must fit in `n_bits` bits
+    n_bits: int, default 16
+        Number of bits
+    unit: float, default 0.005
+        Duration of a 0 bit in seconds
+
+    Returns
+    -------
+    pulses: list of tuple
+        (offset, duration) of each pulse in seconds, relative to the onset
+    """
+    if not 0 <= value < 2**n_bits:
+        raise ValueError(f"{value} cannot be encoded in {n_bits} bits")
+    period = 5 * unit
+    pulses = [(0, 4 * unit)]
+    for k in range(n_bits):
+        bit = (value >> (n_bits - 1 - k)) & 1
+        pulses.append(((k + 1) * period, (1 + bit) * unit))
+    return pulses
+
+
+def barcode_duration(n_bits=16, unit=0.005):
+    """Duration of a barcode in seconds"""
+    offset, duration = barcode_pulses(0, n_bits, unit)[-1]
+    return offset + duration
+
+
+def decode_barcodes(trace, sample_rate, n_bits=16, unit=0.005, threshold=None):
+    """Decode the barcodes in a digitized TTL trace
+
+    Pulses are found from the edges of the thresholded trace and classified
+    by width.  Each start pulse followed by `n_bits` bit pulses at the
+    expected times is decoded, so dropped or corrupted barcodes only lose
+    their own trial.
+
+    Parameters
+    ----------
+    trace: array-like
+        Digitized sync line
+    sample_rate: float
+        Sample rate of `trace` in Hz
+    n_bits: int, default 16
+        Number of bits per barcode
+    unit: float, default 0.005
+        Duration of a 0 bit in seconds
+    threshold: float, default None
+        Level separating high from low.  If None, uses the midpoint of the
+        trace range.
+
+    Returns
+    -------
+    onsets: np.ndarray of float
+        Time of the start of each barcode in seconds from the first sample
+    values: np.ndarray of int
+        Decoded value of each barcode
+    """
+    trace = np.asarray(trace)
+    if not trace.size:
+        return np.array([]), np.array([], dtype=np.int64)
+    if threshold is None:
+        threshold = (trace.min() + trace.max()) / 2
+    high = trace > threshold
+    edges = np.diff(high.astype(np.int8))
+    rises = np.flatnonzero(edges == 1) + 1
+    falls = np.flatnonzero(edges == -1) + 1
+    if high[0]:
+        # the first fall ends a pulse that started before the trace
+        falls = falls[1:]
+    n_pulses = min(len(rises), len(falls))
+    rises, falls = rises[:n_pulses], falls[:n_pulses]
+
+    widths = (falls - rises) / (unit * sample_rate)
+    is_start = widths > 3
+    bits = (widths > 1.5).astype(np.int64)
+
+    starts = np.flatnonzero(is_start)
+    starts = starts[starts + n_bits < n_pulses]
+    idx = starts[:, None] + 1 + np.arange(n_bits)
+
+    # bit pulses must start at multiples of 5 units after the start pulse
+    offsets = (rises[idx] - rises[starts][:, None]) / (5 * unit * sample_rate)
+    on_time = np.abs(offsets - np.arange(1, n_bits + 1)) < 0.5
+    valid = on_time.all(axis=1) & ~is_start[idx].any(axis=1)
+
+    weights = 1 << np.arange(n_bits - 1, -1, -1, dtype=np.int64)
+    values = bits[idx[valid]] @ weights
+    onsets = rises[starts[valid]] / sample_rate
+    return onsets, values
@@ -0,0 +1,512 @@
+import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from picamera import PiCameraCircularIO
+
+try:
+    from picamera import PiVideoFrameType
+except ImportError:  # simulated picamera
+    PiVideoFrameType = None
+
+SPS_HEADER = getattr(PiVideoFrameType, "sps_header", 2)
+
+# frame times sidecar: one little-endian float64 per frame, NaN if unknown
+FRAME_TIME_FORMAT = "<d"
+
+
+class RecordingOutput:
+    """File output for the camera encoder that tracks frames as they are written
+
+    picamera calls `write` from its encoder thread.  After each write, the
+    metadata of the camera's current frame is read to count frames and
+    remember the byte position of every SPS header, where a decodable clip
+    can start.
+
+    The presentation timestamp of every frame is converted to the experiment
+    clock and written to a sidecar next to the video (`path` with a .frames
+    suffix), one float64 per frame.  The camera clock is paired with the
+    experiment clock when the output is created and again at each call to
+    `sync_clock`, so the drift between the clocks does not accumulate over
+    long recordings.
+
+    Parameters
+    ----------
+    camera: picamera.PiCamera
+        Camera that writes to this output
+    path: Path or path-like
+        Video file
+    clock: Clock, default None
+        Experiment clock.  If None, frame times are not recorded.
+    """
+
+    def __init__(self, camera, path, clock=None):
+        self.camera = camera
+        self.path = Path(path)
+        self.file = open(self.path, "wb")
+        self.nbytes = 0
+        self.n_frames = 0
+        self.keyframes = []  # (frame index, byte position) of SPS headers
+        self.clock = clock
+        self.offset = None
+        self.frame_times = None
+        if clock is not None:
+            self.sync_clock()
+            self.frame_times = open(frame_times_path(self.path), "wb")
+
+    def write(self, buf):
+        n = self.file.write(buf)
+        self.nbytes += n
+        frame = self.camera.frame
+        if frame is not None:
+            if frame.frame_type == SPS_HEADER:
+                self.keyframes.append((self.n_frames, frame.position))
+            elif frame.complete:
+                self.n_frames += 1
+                if self.frame_times is not None:
+                    self._write_frame_time(frame.timestamp)
+        return n
+
+    def sync_clock(self):
+        """Pair the camera clock with the experiment clock again
+
+        Frames written from now on are converted with the new offset.
+
+        Returns
+        -------
+        offset: float or None
+            Offset in seconds from the camera clock to the experiment clock,
+            None if frame times are not recorded
+        """
+        if self.clock is not None:
+            self.offset = clock_offset(self.camera, self.clock)
+        return self.offset
+
+    def _write_frame_time(self, timestamp):
+        t = float("nan") if timestamp is None else timestamp / 1e6 + self.offset
+        self.frame_times.write(struct.pack(FRAME_TIME_FORMAT, t))
+
+    def keyframe_before(self, frame_index):
+        """Last SPS header at or before a frame
+
+        Returns
+        -------
+        keyframe: tuple of int
+            Index of the first frame after the header and byte position of
+            the header, or (0, 0) if there is none
+        """
+        keyframe = 0, 0
+        for index, position in self.keyframes:
+            if index > frame_index:
+                break
+            keyframe = index, position
+        return keyframe
+
+    def flush(self):
+        self.file.flush()
+        if self.frame_times is not None:
+            self.frame_times.flush()
+
+    def close(self):
+        self.file.close()
+        if self.frame_times is not None:
+            self.frame_times.close()
+
+
+def clock_offset(camera, clock):
+    """Offset in seconds from the camera clock to the experiment clock"""
+    before = clock.get_time()
+    camera_time = camera.timestamp / 1e6
+    after = clock.get_time()
+    return (before + after) / 2 - camera_time
+
+
+class TrialRecorder:
+    """Records one .h264 file per trial
+
+    Frame times on the experiment clock are written next to each video,
+    see RecordingOutput.  `offset` holds the offset from the camera clock to
+    the experiment clock estimated at the start of the current trial.  The
+    camera is put in the "raw" clock mode so frame
+    timestamps are on the camera clock, like `camera.timestamp`, instead of
+    relative to the start of each recording.
+
+    Parameters
+    ----------
+    camera: picamera.PiCamera
+        Camera to record with
+    data_dir: Path
+        Directory the videos are written to
+    clock: Clock, default None
+        Experiment clock
+    outcome_key: str, default None
+        Key of the trial outcome in the trial record
+    """
+
+    def __init__(self, camera, data_dir, clock=None, outcome_key=None, **kwargs):
+        self.camera = camera
+        self.camera.clock_mode = "raw"
+        self.data_dir = Path(data_dir)
+        self.clock = clock
+        self.outcome_key = outcome_key
+        self.recording_kwargs = kwargs
+        self.output = None
+        self.offset = None
+
+    def start_session(self):
+        pass
+
+    def start_trial(self, trial):
+        self.output = RecordingOutput(
+            self.camera, self.data_dir / f"{trial}.h264", self.clock
+        )
+        self.offset = self.output.offset
+        self.camera.start_recording(self.output, format="h264", **self.recording_kwargs)
+
+    def end_trial(self, trial_record):
+        self.camera.stop_recording()
+        self.output.close()
+        self.output = None
+
+    def close(self):
+        if self.camera.recording:
+            self.camera.stop_recording()
+        if self.output is not None:
+            self.output.close()
+
+
+class ContinuousRecorder(TrialRecorder):
+    """Records the whole session to one .h264 file with a per-trial index
+
+    The encoder runs from `start_session` to `close`, so no footage is lost
+    between trials and there is no encoder setup latency per trial.  A key
+    frame is requested at the start of each trial.  The encoder inserts it
+    asynchronously, a few frames later, so clips start at the last SPS
+    header at or before the trial start instead.  When a trial ends, a line
+    is appended to the index with the trial's frame range, the byte range of
+    the clip, the index of the clip's first frame (`clip_first_frame`, at or
+    before `start_frame`), the start and end times on the experiment clock, and the camera clock
+    offset, which is estimated again at the start of each trial.  Clips can be
+    extracted with `extract_clip` or `marmtouch extract-clips`.
+
+    Parameters
+    ----------
+    camera: picamera.PiCamera
+        Camera to record with
+    data_dir: Path
+        Directory the video and index are written to
+    clock: Clock, default None
+        Experiment clock
+    """
+
+    video_name = "session.h264"
+    index_name = "video_index.jsonl"
+
+    def __init__(self, camera, data_dir, clock=None, outcome_key=None, **kwargs):
+        super().__init__(camera, data_dir, clock, outcome_key, **kwargs)
+        self.recording_kwargs.setdefault("inline_headers", True)
+        self._trial = None
+
+    def start_session(self):
+        self.output = RecordingOutput(
+            self.camera, self.data_dir / self.video_name, self.clock
+        )
+        self.camera.start_recording(self.output, format="h264", **self.recording_kwargs)
+
+    def _now(self):
+        return None if self.clock is None else self.clock.get_time()
+
+    def start_trial(self, trial):
+        self.camera.request_key_frame()
+        self.offset = self.output.sync_clock()
+        self._trial = dict(
+            trial=trial,
+            start_frame=self.output.n_frames,
+            start_time=self._now(),
+            clock_offset=self.offset,
+        )
+
+    def end_trial(self, trial_record):
+        if self._trial is None:
+            return
+        entry = self._trial
+        self._trial = None
+        clip_first_frame, start_byte = self.output.keyframe_before(entry["start_frame"])
+        entry.update(
+            end_frame=self.output.n_frames,
+            clip_first_frame=clip_first_frame,
+            start_byte=start_byte,
+            end_byte=self.output.nbytes,
+            end_time=self._now(),
+        )
+        with open(self.data_dir / self.index_name, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        if self._trial is not None:
+            self.end_trial(None)
+        super().close()
+
+
+class BufferedRecorder(TrialRecorder):
+    """Records the session into a RAM ring buffer and saves selected trials
+
+    The encoder writes into a PiCameraCircularIO holding the last
+    `buffer_seconds` of video.  When a trial ends, the `keep` rule is
+    evaluated on its trial record.  Kept trials are saved as {trial}.h264,
+    with frame times, once `post` seconds have passed, at the start of the
+    next trial or on close.  The clip runs from `pre` seconds before the
+    trial start, rounded back to an SPS header, to `post` seconds after its
+    end.  The footage is copied from the buffer on the calling thread and
+    written to disk on a background thread.  Frame times of each clip are
+    converted with the camera clock offset estimated at its trial start.
+
+    Parameters
+    ----------
+    camera: picamera.PiCamera
+        Camera to record with
+    data_dir: Path
+        Directory the videos are written to
+    clock: Clock, default None
+        Experiment clock
+    outcome_key: str, default None
+        Key of the trial outcome in the trial record
+    buffer_seconds: float, default 30
+        Length of the ring buffer.  Must cover a trial, its margins and the
+        following intertrial interval.
+    pre: float, default 1
+        Seconds saved before the trial start
+    post: float, default 1
+        Seconds saved after the trial end
+    keep: dict, default None
+        Rule selecting the trials to save.  A trial is saved if any of the
+        given criteria matches: `outcomes` (list of outcome values),
+        `any_touch` (true to save trials with any touch) or `every` (save
+        every Nth trial).  If None, all trials are saved.
+    """
+
+    def __init__(
+        self,
+        camera,
+        data_dir,
+        clock=None,
+        outcome_key=None,
+        buffer_seconds=30,
+        pre=1,
+        post=1,
+        keep=None,
+        **kwargs,
+    ):
+        super().__init__(camera, data_dir, clock, outcome_key, **kwargs)
+        self.recording_kwargs.setdefault("inline_headers", True)
+        self.buffer_seconds = buffer_seconds
+        self.pre = pre
+        self.post = post
+        self.keep = keep or {}
+        self.stream = None
+        self.n_saved = 0
+        self.n_discarded = 0
+        self._trial = None
+        self._pending = []
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="marmtouch-video")
+
+    def start_session(self):
+        self.stream = PiCameraCircularIO(self.camera, seconds=self.buffer_seconds)
+        self.camera.start_recording(self.stream, format="h264", **self.recording_kwargs)
+
+    def keeps(self, trial_record):
+        """Whether the `keep` rule selects a trial"""
+        if not self.keep or trial_record is None:
+            return True
+        data = trial_record.data
+        if data.get(self.outcome_key) in self.keep.get("outcomes", []):
+            return True
+        if self.keep.get("any_touch", False) and any(
+            value for key, value in data.items() if key.endswith("_touch")
+        ):
+            return True
+        every = self.keep.get("every")
+        return bool(every) and data.get("trial", 0) % every == 0
+
+    def start_trial(self, trial):
+        self._save_pending()
+        self.offset = None if self.clock is None else clock_offset(self.camera, self.clock)
+        self._trial = trial, self.camera.timestamp, self.offset
+
+    def end_trial(self, trial_record):
+        if self._trial is None:
+            return
+        trial, start, offset = self._trial
+        self._trial = None
+        if self.keeps(trial_record):
+            end = self.camera.timestamp + self.post * 1e6
+            self._pending.append((trial, start - self.pre * 1e6, end, offset))
+        else:
+            self.n_discarded += 1
+
+    def _save_pending(self, force=False):
+        now = self.camera.timestamp
+        pending, self._pending = self._pending, []
+        for trial, start, end, offset in pending:
+            if force or end <= now:
+                self._save(trial, start, end, offset)
+            else:
+                self._pending.append((trial, start, end, offset))
+
+    def _save(self, trial, start, end, offset):
+        with self.stream.lock:
+            frames = list(self.stream.frames)
+            header, first, last = None, None, None
+            for frame in frames:
+                if frame.frame_type == SPS_HEADER:
+                    header = frame
+                elif frame.timestamp is None:
+                    continue
+                elif frame.timestamp > end:
+                    break
+                else:
+                    if first is None and frame.timestamp >= start:
+                        first = header
+                    last = frame
+            if first is None or last is None or last.position < first.position:
+                self.n_discarded += 1
+                return
+            self.stream.seek(first.position)
+            data = self.stream.read(last.position + last.frame_size - first.position)
+            self.stream.seek(0, 2)
+        timestamps = [
+            frame.timestamp
+            for frame in frames
+            if frame.frame_type != SPS_HEADER
+            and frame.complete
+            and first.position <= frame.position <= last.position
+        ]
+        self.n_saved += 1
+        self._writer.submit(self._write, trial, data, timestamps, offset)
+
+    def _write(self, trial, data, timestamps, offset):
+        path = self.data_dir / f"{trial}.h264"
+        with open(path, "wb") as f:
+            f.write(data)
+        if offset is not None:
+            with open(frame_times_path(path), "wb") as f:
+                for timestamp in timestamps:
+                    t = float("nan") if timestamp is None else timestamp / 1e6 + offset
+                    f.write(struct.pack(FRAME_TIME_FORMAT, t))
+
+    def close(self):
+        if self._trial is not None:
+            self.end_trial(None)
+        if self._pending and self.camera.recording:
+            remaining = max(end for _, _, end, _ in self._pending) - self.camera.timestamp
+            if remaining > 0:
+                self.camera.wait_recording(remaining / 1e6)
+        self._save_pending(force=True)
+        super().close()
+        self._writer.shutdown(wait=True)
+
+
+recorders = {
+    "trial": TrialRecorder,
+    "continuous": ContinuousRecorder,
+    "buffer": BufferedRecorder,
+}
+
+
+def get_recorder(camera, data_dir, mode="trial", **kwargs):
+    """Get the recorder for a camera recording mode
+
+    Parameters
+    ----------
+    camera: picamera.PiCamera
+        Camera to record with
+    data_dir: Path
+        Session directory
+    mode: str, default "trial"
+        "trial" for one file per trial, "continuous" for one indexed file
+        per session, or "buffer" to save selected trials from a RAM buffer
+    kwargs: dict
+        Passed to the recorder, and on to camera.start_recording
+    """
+    if mode not in recorders:
+        raise ValueError(f"Unknown camera recording mode: {mode}")
+    return recorders[mode](camera, data_dir, **kwargs)
+
+
+def read_index(path):
+    """Read a video index written by ContinuousRecorder, keyed by trial"""
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return {entry["trial"]: entry for entry in entries}
+
+
+def extract_clip(video_path, entry, out_path, chunk_size=2**20):
+    """Copy the byte range of a trial from a session video into its own file
+
+    The clip starts at frame `clip_first_frame` of the session video.  If
+    the session video has frame times, those of the clip's frames are
+    written next to the clip.
+
+    Parameters
+    ----------
+    video_path: Path or path-like
+        Session video
+    entry: dict
+        Index entry of the trial
+    out_path: Path or path-like
+        Clip file
+    """
+    remaining = entry["end_byte"] - entry["start_byte"]
+    with open(video_path, "rb") as src, open(out_path, "wb") as dst:
+        src.seek(entry["start_byte"])
+        while remaining > 0:
+            chunk = src.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+    if frame_times_path(video_path).is_file() and "clip_first_frame" in entry:
+        frame_times = read_frame_times(video_path)
+        frame_times[entry["clip_first_frame"] : entry["end_frame"]].tofile(
+            frame_times_path(out_path)
+        )
+
+
+def frame_times_path(video_path):
+    """Path of the frame times sidecar of a video"""
+    return Path(video_path).with_suffix(".frames")
+
+
+def read_frame_times(video_path):
+    """Read the frame times of a video
+
+    Returns
+    -------
+    frame_times: np.ndarray of float64
+        Time on the experiment clock of each frame, NaN if unknown
+    """
+    return np.fromfile(frame_times_path(video_path), dtype=FRAME_TIME_FORMAT)
+
+
+def frames_at(frame_times, times):
+    """Find the frame shown at each of a set of times
+
+    Parameters
+    ----------
+    frame_times: np.ndarray
+        Time of each frame, as returned by `read_frame_times`
+    times: array-like
+        Event times on the experiment clock, e.g. touch times
+
+    Returns
+    -------
+    frames: np.ndarray of int
+        Index of the last frame captured at or before each time, or -1 if
+        the time is before the first frame.  Frames with unknown times are
+        skipped.
+    """
+    valid = np.flatnonzero(~np.isnan(frame_times))
+    idx = np.searchsorted(frame_times[valid], times, side="right") - 1
+    return np.where(idx >= 0, valid[np.maximum(idx, 0)], -1)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+default_cache_directory = Path("~/.cache/marmtouch/rasters").expanduser()
+
+
+class RasterCache:
+    """Content-addressed on-disk cache of rasterized stimuli
+
+    Entries are stored as files named by the sha256 of their key.  Keys are
+    built from the sha256 of the source file's contents and the render
+    parameters, so editing a source file or changing a parameter never
+    returns a stale raster.  Reading an entry refreshes its mtime, and the
+    least recently used entries are deleted once the cache exceeds
+    `max_bytes`.  The size and use order of the entries are read from the
+    directory once and then tracked in memory.  An entry that cannot be
+    written, e.g. because the disk is full, is logged and skipped, so it is
+    a cache miss.
+
+    Parameters
+    ----------
+    directory: Path or path-like, default None
+        Cache directory.  If None, uses the MARMTOUCH_CACHE_DIRECTORY
+        environment variable or ~/.cache/marmtouch/rasters
+    max_bytes: int, default 256 MiB
+        Maximum total size of the cache
+    """
+
+    def __init__(self, directory=None, max_bytes=256 * 2**20):
+        if directory is None:
+            directory = os.environ.get(
+                "MARMTOUCH_CACHE_DIRECTORY", default_cache_directory
+            )
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._nbytes = None
+        self._sizes = None  # entry path -> size, least recently used first
+        self._file_hashes = {}
+
+    def file_hash(self, path):
+        """sha256 of a file's contents, memoized on (path, mtime, size)"""
+        stat = os.stat(path)
+        memo_key = os.fspath(path), stat.st_mtime_ns, stat.st_size
+        digest = self._file_hashes.get(memo_key)
+        if digest is None:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            self._file_hashes[memo_key] = digest
+        return digest
+
+    def key(self, path, **params):
+        """Cache key of a source file rendered with `params`"""
+        spec = dict(source=self.file_hash(path), **params)
+        return hashlib.sha256(
+            json.dumps(spec, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def _entry(self, key):
+        return self.directory / key[:2] / key
+
+    def get(self, key):
+        """Get a cached entry, or None if it is not cached"""
+        entry = self._entry(key)
+        try:
+            with open(entry, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(entry)
+        if self._sizes is not None and entry in self._sizes:
+            self._sizes.move_to_end(entry)
+        return data
+
+    def put(self, key, data):
+        """Store an entry, evicting least recently used entries if needed"""
+        entry = self._entry(key)
+        sizes = self._load_sizes()
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, entry)
+        except OSError as e:
+            logger.warning(f"Could not write {entry} to the raster cache: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+        self._nbytes -= sizes.pop(entry, 0)
+        sizes[entry] = len(data)
+        self._nbytes += len(data)
+        if self._nbytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        if not self.directory.is_dir():
+            return []
+        return [
+            entry
+            for entry in self.directory.glob("*/*")
+            if entry.is_file() and not entry.name.endswith(".tmp")
+        ]
+
+    def _load_sizes(self):
+        """Sizes of the entries in use order, read from the directory once"""
+        if self._sizes is None:
+            entries = []
+            for entry in self._entries():
+                try:
+                    entries.append((entry.stat(), entry))
+                except FileNotFoundError:  # evicted by another process
+                    continue
+            entries.sort(key=lambda e: e[0].st_mtime_ns)
+            self._sizes = OrderedDict((entry, stat.st_size) for stat, entry in entries)
+            self._nbytes = sum(self._sizes.values())
+        return self._sizes
+
+    @property
+    def nbytes(self):
+        self._load_sizes()
+        return self._nbytes
+
+    def evict(self, max_bytes=None):
+        """Delete least recently used entries until the cache fits `max_bytes`
+
+        Parameters
+        ----------
+        max_bytes: int, default None
+            Size to shrink the cache to.  If None, uses `self.max_bytes`
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        sizes = self._load_sizes()
+        while sizes and self._nbytes > max_bytes:
+            entry, size = sizes.popitem(last=False)
+            entry.unlink(missing_ok=True)
+            self._nbytes -= size
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Get the process-wide raster cache"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RasterCache()
+    return _default_cache
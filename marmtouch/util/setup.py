@@ -10,6 +10,10 @@ def setup_screen():
     os.putenv("SDL_MOUSEDEV", "/dev/input/touchscreen")
 
 
-def setup_camera():
+def setup_camera(resolution=None, framerate=None):
     camera = PiCamera()
+    if resolution is not None:
+        camera.resolution = tuple(resolution)
+    if framerate is not None:
+        camera.framerate = framerate
     return camera
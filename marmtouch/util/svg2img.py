@@ -1,66 +1,167 @@
+import os
 import re
 import xml.etree.ElementTree as ET
 from io import BytesIO
+from xml.sax.saxutils import escape
 
+import cairosvg
 import pygame
 from cairosvg import svg2png
 from PIL import Image
 
+from marmtouch.util.raster_cache import get_default_cache
+
+
 def get_namespace(element):
     m = re.match("\{.*\}", element.tag)
     return m.group(0) if m else ""
 
 
-def svg2img(svg_path, colour, size):
-    tree = ET.parse(svg_path)
+def _parse_colour(colour):
+    if isinstance(colour, (list, tuple)):
+        if len(colour) != 3: # assume RGB
+            raise ValueError("colour must be a list of 3 values")
+        colour = "rgb({}, {}, {})".format(*colour)
+    return colour
+
+
+class SVGTemplate:
+    """An svg parsed once and recoloured by substitution
 
-    if colour:
-        if isinstance(colour, list):
-            if len(colour) != 3: # assume RGB
-                raise ValueError("colour must be a list of 3 values")
-            colour = "rgb({}, {}, {})".format(*colour)
+    The fill of every path is replaced by a placeholder in the serialized
+    document, so recolouring is a string join rather than a parse and tree
+    walk per colour.
+
+    Parameters
+    ----------
+    svg_path: str or Path
+        Path to the svg
+    """
+
+    placeholder = "__marmtouch_fill__"
+
+    def __init__(self, svg_path):
+        self.path = svg_path
+        tree = ET.parse(svg_path)
+        with BytesIO() as xml_buff:
+            tree.write(xml_buff)
+            self.source = xml_buff.getvalue()
         root = tree.getroot()
         namespace = get_namespace(root)
         for path in root.findall(f".//{namespace}path"):
-            path.set("fill", colour)
-
-    with BytesIO() as xml_buff, BytesIO() as png_buff:
-        tree.write(xml_buff)
-        xml_buff.seek(0)
-        svg2png(
-            xml_buff.read(),
-            write_to=png_buff,
-            output_width=size[0],
-            output_height=size[1],
+            path.set("fill", self.placeholder)
+        with BytesIO() as xml_buff:
+            tree.write(xml_buff)
+            self._parts = xml_buff.getvalue().split(self.placeholder.encode())
+
+    def document(self, colour=None):
+        """The svg document with all paths filled with `colour`
+
+        If `colour` is falsy, the original document is returned.
+        """
+        colour = _parse_colour(colour)
+        if not colour:
+            return self.source
+        return escape(colour, {'"': "&quot;"}).encode().join(self._parts)
+
+    def render(self, colour, size):
+        """Rasterize the template in `colour` to PNG data"""
+        return svg2png(
+            self.document(colour), output_width=size[0], output_height=size[1]
         )
-        png_buff.seek(0)
+
+    def render_many(self, colours, size, cache=True):
+        """Rasterize the template in each of `colours`
+
+        Parameters
+        ----------
+        colours: iterable of str or list of int
+            Fill colours
+        size: tuple of int
+            Output (width, height) in pixels
+        cache: bool or RasterCache, default True
+            Raster cache to use, as in `render_svg`
+
+        Returns
+        -------
+        pngs: list of bytes
+            PNG data in the order of `colours`
+        """
+        return [
+            render_svg(self.path, colour, size, cache=cache, template=self)
+            for colour in colours
+        ]
+
+
+_templates = {}
+
+
+def get_template(svg_path):
+    """Get the template of an svg, parsing it only if it changed on disk"""
+    stat = os.stat(svg_path)
+    key = os.fspath(svg_path)
+    template, mtime = _templates.get(key, (None, None))
+    if template is None or mtime != stat.st_mtime_ns:
+        template = SVGTemplate(svg_path)
+        _templates[key] = template, stat.st_mtime_ns
+    return template
+
+
+def render_svg(svg_path, colour, size, cache=True, template=None):
+    """Rasterize an svg to PNG data, recoloured and resized
+
+    Renders are stored in the on-disk raster cache, keyed by the svg contents,
+    colour, size and cairosvg version.
+
+    Parameters
+    ----------
+    svg_path: str or Path
+        Path to the svg
+    colour: str, list of int or None
+        Fill colour for all paths. If falsy, the svg colours are kept.
+    size: tuple of int
+        Output (width, height) in pixels
+    cache: bool or RasterCache, default True
+        Raster cache to use.  If True, uses the default cache.  If False,
+        always renders.
+    template: SVGTemplate, default None
+        Parsed template of `svg_path`.  If None, the template is looked up
+        (and parsed if needed) on a cache miss.
+
+    Returns
+    -------
+    png: bytes
+    """
+    colour = _parse_colour(colour)
+    if cache is True:
+        cache = get_default_cache()
+    if cache:
+        key = cache.key(
+            svg_path,
+            colour=colour,
+            size=list(size),
+            cairosvg=cairosvg.__version__,
+        )
+        png = cache.get(key)
+        if png is not None:
+            return png
+
+    if template is None:
+        template = get_template(svg_path)
+    png = template.render(colour, size)
+    if cache:
+        cache.put(key, png)
+    return png
+
+
+def svg2img(svg_path, colour, size):
+    with BytesIO(render_svg(svg_path, colour, size)) as png_buff:
         image = pygame.image.load(png_buff, "image.png").convert_alpha()
     return image
 
 
 def svg2PIL(svg_path, colour, size):
-    tree = ET.parse(svg_path)
-
-    if colour:
-        if isinstance(colour, list):
-            if len(colour) != 3: # assume RGB
-                raise ValueError("colour must be a list of 3 values")
-            colour = "rgb({}, {}, {})".format(*colour)
-        root = tree.getroot()
-        namespace = get_namespace(root)
-        for path in root.findall(f".//{namespace}path"):
-            path.set("fill", colour)
-
-    with BytesIO() as xml_buff, BytesIO() as png_buff:
-        tree.write(xml_buff)
-        xml_buff.seek(0)
-        svg2png(
-            xml_buff.read(),
-            write_to=png_buff,
-            output_width=size[0],
-            output_height=size[1],
-        )
-        png_buff.seek(0)
+    with BytesIO(render_svg(svg_path, colour, size)) as png_buff:
         image = Image.open(png_buff)
         image.load()
     return image
@@ -1,3 +1,6 @@
+import heapq
+import itertools
+import threading
 import time
 
 import RPi.GPIO as GPIO
@@ -6,10 +9,202 @@ GPIO.setmode(GPIO.BOARD)
 GPIO.setwarnings(False)
 
 
+class PulseEngine:
+    """Output thread that drives TTL pulse trains at scheduled times
+
+    Pulse trains are split into edges and kept in a heap ordered by time.
+    The output thread sleeps until `spin_threshold` seconds before the next
+    edge, then spins so the edge lands on time.  The time of every edge is
+    read right after the output is set and reported to `on_edge`, so the
+    calling thread never blocks on GPIO.
+
+    Trains on the same port do not overlap: a train requested while another
+    is running on the port starts when the previous one ends.
+
+    Parameters
+    ----------
+    clock: Clock, default None
+        Clock edges are scheduled and timestamped on.  If None, uses
+        time.perf_counter until a clock is assigned.
+    on_edge: callable, default None
+        Called on the output thread with an edge record (dict with type,
+        name, port, value, request and time) after each edge
+    """
+
+    spin_threshold = 0.002
+
+    def __init__(self, clock=None, on_edge=None):
+        self.clock = clock
+        self.on_edge = on_edge
+        self.n_edges = 0
+        self.max_lateness = 0
+        self._edges = []
+        self._seq = itertools.count()
+        self._free_at = {}
+        self._high = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    def now(self):
+        if self.clock is None:
+            return time.perf_counter()
+        return self.clock.get_time()
+
+    def schedule(self, port, duration, n_pulses=1, interpulse_interval=1, at=None, name=None):
+        """Schedule a pulse train
+
+        Parameters
+        ----------
+        port: int
+            Output pin
+        duration: float
+            Duration of each pulse in seconds
+        n_pulses: int, default 1
+            Number of pulses
+        interpulse_interval: float, default 1
+            Time between the end of a pulse and the start of the next, in seconds
+        at: float, default None
+            Time of the first rising edge.  If None, as soon as possible.
+        name: str, default None
+            Name of the output recorded with each edge
+
+        Returns
+        -------
+        onset: float
+            Scheduled time of the first rising edge
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Pulse engine is closed")
+            onset = self.now() if at is None else at
+            onset = max(onset, self._free_at.get(port, onset))
+            t = onset
+            for i in range(n_pulses):
+                self._push(t, port, True, name)
+                t += duration
+                self._push(t, port, False, name)
+                if i + 1 < n_pulses:
+                    t += interpulse_interval
+            self._free_at[port] = t
+            self._cond.notify()
+        self._start()
+        return onset
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="marmtouch-pulse", daemon=True
+            )
+            self._thread.start()
+
+    def _push(self, t, port, value, name):
+        heapq.heappush(self._edges, (t, next(self._seq), port, value, name))
+
+    def busy(self, port):
+        """Whether a pulse train is scheduled or running on a port"""
+        with self._cond:
+            return self._free_at.get(port, 0) > self.now()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._edges:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                t = self._edges[0][0]
+                remaining = t - self.now()
+                if remaining > self.spin_threshold:
+                    # woken early if an earlier edge is scheduled
+                    self._cond.wait(remaining - self.spin_threshold)
+                    continue
+                _, _, port, value, name = heapq.heappop(self._edges)
+            while self.now() < t and not self._closed:
+                pass
+            self._output(t, port, value, name)
+
+    def _output(self, request, port, value, name):
+        GPIO.output(port, value)
+        edge_time = self.now()
+        if value:
+            self._high.add(port)
+        else:
+            self._high.discard(port)
+        self.n_edges += 1
+        self.max_lateness = max(self.max_lateness, edge_time - request)
+        if self.on_edge is not None:
+            self.on_edge(
+                dict(
+                    type="ttl_edge",
+                    name=name,
+                    port=port,
+                    value=int(value),
+                    request=request,
+                    time=edge_time,
+                )
+            )
+
+    def close(self):
+        """Stop the output thread, dropping pending edges and setting outputs low"""
+        with self._cond:
+            self._closed = True
+            self._edges.clear()
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        for port in list(self._high):
+            GPIO.output(port, False)
+        self._high.clear()
+
+
+class VirtualPulseEngine(PulseEngine):
+    """Pulse engine driven by the virtual time of a TestClock
+
+    Edges are registered with `clock.call_at` instead of being sent by an
+    output thread, so they are set exactly on time, on the calling thread,
+    as the test advances virtual time, and pulses never sleep.
+
+    Parameters
+    ----------
+    clock: TestClock
+        Clock edges are scheduled on
+    on_edge: callable, default None
+        Called with an edge record after each edge, see PulseEngine
+    """
+
+    def _push(self, t, port, value, name):
+        self.clock.call_at(t, self._output, t, port, value, name)
+
+    def _start(self):
+        pass
+
+    def _output(self, request, port, value, name):
+        if not self._closed:
+            super()._output(request, port, value, name)
+
+
 class TTL:
-    def __init__(self, port, initial=0):
+    """TTL output pin
+
+    Parameters
+    ----------
+    port: int
+        Output pin
+    initial: int, default 0
+        Initial output value
+    engine: PulseEngine, default None
+        Engine pulses are scheduled on.  If None, `pulse` blocks until the
+        pulse train ends.
+    name: str, default None
+        Name of the output recorded with each edge by the engine
+    """
+
+    def __init__(self, port, initial=0, engine=None, name=None):
         GPIO.setup(port, GPIO.OUT, initial=initial)
         self.port = port
+        self.engine = engine
+        self.name = name
 
     def on(self):
         GPIO.output(self.port, True)
@@ -17,7 +212,21 @@ class TTL:
     def off(self):
         GPIO.output(self.port, False)
 
-    def pulse(self, duration=0.2, n_pulses=1, interpulse_interval=1):
+    def pulse(self, duration=0.2, n_pulses=1, interpulse_interval=1, at=None):
+        """Send a pulse train
+
+        With an engine the train is scheduled and this returns immediately.
+
+        Returns
+        -------
+        onset: float or None
+            Scheduled time of the first rising edge on the engine's clock, or
+            None without an engine
+        """
+        if self.engine is not None:
+            return self.engine.schedule(
+                self.port, duration, n_pulses, interpulse_interval, at, self.name
+            )
         for i in range(n_pulses):
             self.on()
             time.sleep(duration)
@@ -28,3 +237,70 @@ class TTL:
     @property
     def value(self):
         return GPIO.input(self.port)
+
+
+class TTLInput:
+    """TTL input pin with edges captured on the GPIO callback thread
+
+    Parameters
+    ----------
+    port: int
+        Input pin
+    name: str, default None
+        Name of the input recorded with each edge
+    pull: str, default None
+        Internal resistor, "up", "down" or None
+    bouncetime: int, default None
+        Edges within `bouncetime` milliseconds of the previous edge are ignored
+    """
+
+    _pulls = {None: GPIO.PUD_OFF, "up": GPIO.PUD_UP, "down": GPIO.PUD_DOWN}
+
+    def __init__(self, port, name=None, pull=None, bouncetime=None):
+        GPIO.setup(port, GPIO.IN, pull_up_down=self._pulls[pull])
+        self.port = port
+        self.name = name
+        self.bouncetime = bouncetime
+        self._on_edge = None
+
+    def start(self, on_edge, clock=None):
+        """Start capturing edges
+
+        Parameters
+        ----------
+        on_edge: callable
+            Called on the GPIO callback thread with an edge record (dict with
+            type, name, port, value and time) for every edge
+        clock: Clock, default None
+            Clock the edges are timestamped on.  If None, uses
+            time.perf_counter.
+        """
+        now = time.perf_counter if clock is None else clock.get_time
+
+        def callback(port):
+            edge_time = now()
+            on_edge(
+                dict(
+                    type="gpio_edge",
+                    name=self.name,
+                    port=port,
+                    value=GPIO.input(port),
+                    time=edge_time,
+                )
+            )
+
+        kwargs = {}
+        if self.bouncetime is not None:
+            kwargs["bouncetime"] = self.bouncetime
+        GPIO.add_event_detect(self.port, GPIO.BOTH, callback=callback, **kwargs)
+        self._on_edge = on_edge
+
+    def stop(self):
+        """Stop capturing edges"""
+        if self._on_edge is not None:
+            GPIO.remove_event_detect(self.port)
+            self._on_edge = None
+
+    @property
+    def value(self):
+        return GPIO.input(self.port)
@@ -18,6 +18,7 @@ setup(
         "picamera",
         "tqdm",
         "cairosvg",
+        "numpy",
     ],
     entry_points="""
         [console_scripts]
@@ -0,0 +1,11 @@
+import os
+import sys
+from pathlib import Path
+
+# run headless, with the simulated GPIO and camera on non RPi devices
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+try:
+    import RPi.GPIO  # noqa: F401
+except ImportError:
+    sys.path.insert(0, str(Path(__file__).parents[1] / "dev" / "simulated_packages"))
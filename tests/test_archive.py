@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from marmtouch.util.archive import (
+    index_path,
+    read_file,
+    read_index,
+    unpack_archive,
+    write_archive,
+)
+
+
+@pytest.fixture
+def files(tmp_path):
+    source = tmp_path / "session"
+    source.mkdir()
+    contents = {
+        "params.yaml": b"timing: {}\n",
+        "1.h264": bytes(range(256)) * 5000,
+        "events.jsonl": b'{"type":"flip"}\n' * 100,
+    }
+    for name, data in contents.items():
+        (source / name).write_bytes(data)
+    return [source / name for name in contents]
+
+
+@pytest.mark.parametrize("compression", [None, "gz"])
+def test_archive_round_trip(tmp_path, files, compression):
+    archive = tmp_path / "session.tar"
+    read = []
+    index = write_archive(files, archive, compression, on_bytes=read.append)
+    assert sum(read) == sum(f.stat().st_size for f in files)
+    assert archive.is_file() and not list(tmp_path.glob(".*.tmp"))
+    assert index == read_index(archive) == json.loads(index_path(archive).read_text())
+    assert index["compression"] == compression
+    for f in files:
+        assert index["files"][f.name]["size"] == f.stat().st_size
+        assert read_file(archive, f.name) == f.read_bytes()
+
+    output = tmp_path / "unpacked"
+    output.mkdir()
+    assert unpack_archive(archive, output) == []
+    for f in files:
+        unpacked = output / f.name
+        assert unpacked.read_bytes() == f.read_bytes()
+        assert unpacked.stat().st_mtime == f.stat().st_mtime
+
+
+def test_unpack_selected_files(tmp_path, files):
+    archive = tmp_path / "session.tar"
+    write_archive(files, archive)
+    output = tmp_path / "unpacked"
+    output.mkdir()
+    assert unpack_archive(archive, output, names=["1.h264", "missing.h264"]) == [
+        "missing.h264"
+    ]
+    assert [f.name for f in output.iterdir()] == ["1.h264"]
+
+
+def test_verify_only(tmp_path, files):
+    archive = tmp_path / "session.tar"
+    write_archive(files, archive)
+    before = sorted(tmp_path.iterdir())
+    assert unpack_archive(archive, verify_only=True) == []
+    assert sorted(tmp_path.iterdir()) == before
+
+
+def test_verify_corrupted_archive(tmp_path, files):
+    archive = tmp_path / "session.tar"
+    index = write_archive(files, archive)
+    entry = index["files"]["1.h264"]
+    with open(archive, "r+b") as f:
+        f.seek(entry["offset"] + entry["size"] // 2)
+        f.write(b"corrupted")
+    assert unpack_archive(archive, verify_only=True) == ["1.h264"]
+    with pytest.raises(ValueError):
+        read_file(archive, "1.h264")
+    assert read_file(archive, "params.yaml") == files[0].read_bytes()
+
+    output = tmp_path / "unpacked"
+    output.mkdir()
+    assert unpack_archive(archive, output) == ["1.h264"]
+    assert sorted(f.name for f in output.iterdir()) == ["events.jsonl", "params.yaml"]
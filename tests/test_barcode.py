@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from marmtouch.util.barcode import barcode_duration, barcode_pulses, decode_barcodes
+
+SAMPLE_RATE = 10000
+
+
+def render(barcodes, duration, sample_rate=SAMPLE_RATE, n_bits=16, drop=None):
+    """Digitize barcodes sent at (onset, value) into a 0/5 V trace"""
+    trace = np.zeros(round(duration * sample_rate))
+    for onset, value in barcodes:
+        for k, (offset, width) in enumerate(barcode_pulses(value, n_bits)):
+            if drop == (value, k):
+                continue
+            start = round((onset + offset) * sample_rate)
+            trace[start : start + round(width * sample_rate)] = 5
+    return trace
+
+
+def test_round_trip():
+    barcodes = [(0.1, 1), (0.7, 2), (1.3, 0xBEEF), (1.9, 2**16 - 1)]
+    onsets, values = decode_barcodes(render(barcodes, 2.5), SAMPLE_RATE)
+    np.testing.assert_allclose(onsets, [onset for onset, _ in barcodes])
+    assert values.tolist() == [value for _, value in barcodes]
+
+
+def test_round_trip_short_barcodes():
+    barcodes = [(0.05, 5), (0.2, 10)]
+    trace = render(barcodes, 0.4, n_bits=4)
+    onsets, values = decode_barcodes(trace, SAMPLE_RATE, n_bits=4)
+    assert values.tolist() == [5, 10]
+
+
+def test_dropped_pulse_only_loses_its_barcode():
+    barcodes = [(0.1, 1), (0.7, 2), (1.3, 3)]
+    trace = render(barcodes, 2, drop=(2, 5))
+    onsets, values = decode_barcodes(trace, SAMPLE_RATE)
+    np.testing.assert_allclose(onsets, [0.1, 1.3])
+    assert values.tolist() == [1, 3]
+
+
+def test_trace_starting_high():
+    # the recording starts in the middle of a barcode's start pulse
+    barcodes = [(-0.01, 7), (0.6, 8)]
+    trace = render([(onset + 0.1, value) for onset, value in barcodes], 1.5)
+    trace = trace[round(0.1 * SAMPLE_RATE) :]
+    assert trace[0] > 0
+    onsets, values = decode_barcodes(trace, SAMPLE_RATE)
+    np.testing.assert_allclose(onsets, [0.6])
+    assert values.tolist() == [8]
+
+
+def test_trace_ending_in_a_barcode():
+    barcodes = [(0.1, 1), (0.7, 2)]
+    trace = render(barcodes, 0.7 + barcode_duration() / 2)
+    onsets, values = decode_barcodes(trace, SAMPLE_RATE)
+    assert values.tolist() == [1]
+
+
+@pytest.mark.parametrize("trace", [np.array([]), np.zeros(1000)])
+def test_trace_without_barcodes(trace):
+    onsets, values = decode_barcodes(trace, SAMPLE_RATE)
+    assert onsets.size == 0 and values.size == 0
+
+
+def test_value_out_of_range():
+    with pytest.raises(ValueError):
+        barcode_pulses(2**4, n_bits=4)
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+import RPi.GPIO as GPIO
+from picamera import PiCamera
+
+from marmtouch.experiments.util.clock import TestClock as VirtualClock
+from marmtouch.util.camera import (
+    extract_clip,
+    frame_times_path,
+    get_recorder,
+    read_frame_times,
+    read_index,
+)
+
+
+class Record:
+    def __init__(self, **data):
+        self.data = data
+
+
+@pytest.fixture
+def clock():
+    clock = VirtualClock()
+    clock.start()
+    GPIO.set_clock(clock)
+    # the camera starts recording after the session start
+    clock.advance_time(5)
+    return clock
+
+
+def run_trials(recorder, clock, outcomes, duration=2, iti=1.5):
+    recorder.start_session()
+    trial_times = {}
+    for trial, outcome in enumerate(outcomes, 1):
+        start = clock.get_time()
+        recorder.start_trial(trial)
+        clock.advance_time(duration)
+        recorder.end_trial(Record(trial=trial, target_touch=outcome))
+        trial_times[trial] = start, clock.get_time()
+        clock.advance_time(iti)
+    recorder.close()
+    return trial_times
+
+
+def test_continuous_frame_times_on_experiment_clock(tmp_path, clock):
+    recorder = get_recorder(PiCamera(), tmp_path, mode="continuous", clock=clock)
+    trial_times = run_trials(recorder, clock, [1, 0])
+    frame_times = read_frame_times(tmp_path / "session.h264")
+    assert frame_times[0] == pytest.approx(5, abs=1e-3)
+    assert np.diff(frame_times) == pytest.approx(1 / 30, abs=1e-3)
+    for trial, entry in read_index(tmp_path / "video_index.jsonl").items():
+        start, _ = trial_times[trial]
+        assert frame_times[entry["start_frame"]] == pytest.approx(start, abs=1 / 30)
+
+
+def test_continuous_clips_start_at_key_frame(tmp_path, clock):
+    camera = PiCamera()
+    camera.key_frame_delay = 3
+    recorder = get_recorder(camera, tmp_path, mode="continuous", clock=clock)
+    run_trials(recorder, clock, [1, 0, 1])
+    frame_times = read_frame_times(tmp_path / "session.h264")
+    index = read_index(tmp_path / "video_index.jsonl")
+    assert any(entry["clip_first_frame"] < entry["start_frame"] for entry in index.values())
+    for trial, entry in index.items():
+        # the key frame requested at the trial start comes after start_frame
+        assert entry["clip_first_frame"] <= entry["start_frame"]
+        clip = tmp_path / f"{trial}.h264"
+        extract_clip(tmp_path / "session.h264", entry, clip)
+        data = clip.read_bytes()
+        assert data[0] == 2  # SPS header
+        n_frames = sum(1 for b in data[::20] if b != 2) * 20 // camera.frame_nbytes
+        assert n_frames == entry["end_frame"] - entry["clip_first_frame"]
+        clip_times = read_frame_times(clip)
+        assert frame_times_path(clip).is_file()
+        assert clip_times.size == n_frames
+        assert clip_times[0] == frame_times[entry["clip_first_frame"]]
+
+
+@pytest.mark.parametrize("mode", ["trial", "continuous", "buffer"])
+def test_frame_times_follow_camera_clock_drift(tmp_path, clock, mode):
+    camera = PiCamera()
+    camera.drift = 1e-3
+    recorder = get_recorder(camera, tmp_path, mode=mode, clock=clock, buffer_seconds=10)
+    # one estimate at the session start would be 60 ms off by the last trial
+    trial_times = run_trials(recorder, clock, [1] * 20)
+    start, end = trial_times[20]
+    if mode == "continuous":
+        frame_times = read_frame_times(tmp_path / "session.h264")
+        entry = read_index(tmp_path / "video_index.jsonl")[20]
+        assert entry["clock_offset"] == recorder.offset
+        assert frame_times[entry["start_frame"]] == pytest.approx(start, abs=1 / 30)
+    else:
+        frame_times = read_frame_times(tmp_path / "20.h264")
+        end += recorder.post if mode == "buffer" else 0
+        assert frame_times[-1] == pytest.approx(end, abs=1 / 30)
+
+
+def test_buffer_saves_kept_trials(tmp_path, clock):
+    recorder = get_recorder(
+        PiCamera(),
+        tmp_path,
+        mode="buffer",
+        clock=clock,
+        outcome_key="target_touch",
+        buffer_seconds=10,
+        keep={"outcomes": [1]},
+    )
+    trial_times = run_trials(recorder, clock, [1, 0, 1])
+    assert sorted(p.name for p in tmp_path.glob("*.h264")) == ["1.h264", "3.h264"]
+    for trial in (1, 3):
+        frame_times = read_frame_times(tmp_path / f"{trial}.h264")
+        start, end = trial_times[trial]
+        assert frame_times.size
+        # the clip starts at the key frame before the pre margin, or the first frame
+        assert frame_times[0] <= max(start - recorder.pre, 5)
+        assert frame_times[-1] == pytest.approx(end + recorder.post, abs=1 / 30)
@@ -0,0 +1,32 @@
+import time
+
+import pytest
+
+from marmtouch.experiments.util.clock import Clock
+from marmtouch.experiments.util.clock import TestClock as VirtualClock
+
+
+def test_virtual_clock_anchors_do_not_jump():
+    clock = VirtualClock()
+    clock.start()
+    first = clock.anchor()
+    assert "jump" not in first
+    for _ in range(3):
+        clock.advance_time(60)
+        assert clock.anchor_due()
+        anchor = clock.anchor()
+        assert anchor["drift"] == 0 and not anchor["jump"]
+    assert anchor["wall_time"] - first["wall_time"] == pytest.approx(180)
+    assert anchor["time"] == pytest.approx(180)
+
+
+def test_wall_clock_jump_is_flagged(monkeypatch):
+    clock = Clock()
+    clock.start()
+    assert clock.anchor_due()
+    assert "jump" not in clock.anchor()
+    assert not clock.anchor()["jump"]
+    time_ns = time.time_ns
+    monkeypatch.setattr(time, "time_ns", lambda: time_ns() + 3600 * 10**9)
+    anchor = clock.anchor()
+    assert anchor["jump"] and anchor["drift"] == pytest.approx(3600, abs=1)
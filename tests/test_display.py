@@ -0,0 +1,42 @@
+import logging
+from types import SimpleNamespace
+
+import pygame
+import pytest
+
+try:
+    from marmtouch.experiments.base import Experiment
+except (ImportError, OSError) as e:  # e.g. the cairo library is not installed
+    pytest.skip(f"experiments cannot be imported: {e}", allow_module_level=True)
+
+
+@pytest.fixture
+def experiment():
+    pygame.display.init()
+    yield SimpleNamespace(
+        fullscreen=True,
+        screen_config={"vsync": True},
+        screen_size=(1200, 800),
+        logger=logging.getLogger("test_display"),
+        vsync=False,
+    )
+    pygame.display.quit()
+
+
+def test_fullscreen_vsync(experiment):
+    screen = Experiment._set_display_mode(experiment)
+    assert experiment.vsync
+    assert screen.get_size() == experiment.screen_size
+
+
+def test_vsync_falls_back_on_driver_error(monkeypatch, experiment):
+    set_mode = pygame.display.set_mode
+
+    def set_mode_without_vsync(size=(0, 0), flags=0, depth=0, display=0, vsync=0):
+        if vsync:
+            raise pygame.error("vsync not available")
+        return set_mode(size, flags, depth, display)
+
+    monkeypatch.setattr(pygame.display, "set_mode", set_mode_without_vsync)
+    Experiment._set_display_mode(experiment)
+    assert not experiment.vsync
@@ -0,0 +1,52 @@
+import pytest
+
+try:
+    from marmtouch.experiments.dms import DMS
+except (ImportError, OSError) as e:  # e.g. the cairo library is not installed
+    pytest.skip(f"experiments cannot be imported: {e}", allow_module_level=True)
+
+
+@pytest.fixture
+def itemfile_params(tmp_path):
+    itemfile = tmp_path / "items.csv"
+    itemfile.write_text("A,B\na.png,b.png\nc.png,d.png\n")
+    return {
+        "timing": {
+            "sample_duration": 1,
+            "delay_duration": 1,
+            "test_duration": 1,
+            "correct_duration": 1,
+            "incorrect_duration": 1,
+        },
+        "conditions": {
+            "1": {
+                "sample": {"loc": [400, 400]},
+                "match": {"loc": [200, 400]},
+                "nonmatch": {"loc": [600, 400]},
+            }
+        },
+        "background": [0, 0, 0],
+        "items": itemfile.as_posix(),
+        "options": {"method": "itemfile"},
+    }
+
+
+def test_initialize_test_with_itemfile(tmp_path, itemfile_params):
+    system_config = tmp_path / "system_config.yaml"
+    system_config.write_text("{}\n")
+    experiment = DMS(
+        tmp_path / "data",
+        itemfile_params,
+        camera=False,
+        fullscreen=False,
+        system_config_path=system_config,
+    )
+    experiment.initialize_test()
+    try:
+        assert experiment.items == [
+            {"A": "a.png", "B": "b.png"},
+            {"A": "c.png", "B": "d.png"},
+        ]
+        assert experiment.get_audio_roles() == []
+    finally:
+        experiment.graceful_exit()
@@ -0,0 +1,32 @@
+import pygame
+import pytest
+
+from marmtouch.experiments.util.clock import Clock
+from marmtouch.experiments.util.events import EventHandler
+
+
+@pytest.fixture
+def event_handler():
+    pygame.display.init()
+    clock = Clock()
+    clock.start()
+    yield EventHandler(None, clock)
+    pygame.display.quit()
+
+
+@pytest.mark.parametrize("remaining", [0.0025, 0.0029, 0.01])
+def test_wait_for_events_never_waits_without_timeout(monkeypatch, event_handler, remaining):
+    wait = pygame.event.wait
+    timeouts = []
+
+    def checked_wait(timeout=0):
+        timeouts.append(timeout)
+        assert timeout >= 1, "pygame.event.wait(0) blocks until an event arrives"
+        return wait(timeout)
+
+    monkeypatch.setattr(pygame.event, "wait", checked_wait)
+    clock = event_handler.clock
+    clock.wait(remaining)
+    event_handler.wait_for_events()
+    assert clock.get_time() >= clock.wait_until
+    assert event_handler.n_wakeups == 1
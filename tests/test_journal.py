@@ -0,0 +1,230 @@
+import json
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from marmtouch.experiments.util.clock import Clock
+from marmtouch.experiments.util.journal import EventJournal, read_journal, read_trailer
+
+try:
+    from marmtouch.experiments.base import Experiment
+except (ImportError, OSError):  # e.g. the cairo library is not installed
+    Experiment = None
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = EventJournal(tmp_path / "events.tmp.jsonl")
+    journal.open()
+    yield journal
+    journal.close()
+
+
+class BlockingFile:
+    """File wrapper whose writes wait until `release` is set"""
+
+    def __init__(self, file):
+        self.file = file
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.entered.set()
+        self.release.wait(5)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def write_trials(journal, n_trials):
+    for trial in range(1, n_trials + 1):
+        journal.write([dict(type="trial_start", trial=trial, time=float(trial))])
+        journal.write([dict(type="flip", label="stim", time=trial + 0.5)])
+
+
+def test_trailer_index_seeks_to_trials(tmp_path, journal):
+    write_trials(journal, 3)
+    path = journal.seal(tmp_path / "events.jsonl")
+    trailer = read_trailer(path)
+    assert trailer["n_records"] == 6
+    assert sorted(trailer["index"]) == ["1", "2", "3"]
+    with open(path, "rb") as f:
+        f.seek(trailer["index"]["2"])
+        assert json.loads(f.readline()) == dict(type="trial_start", trial=2, time=2.0)
+        assert json.loads(f.readline())["type"] == "flip"
+
+
+def test_full_buffer_blocks_and_counts_stalls(tmp_path):
+    journal = EventJournal(tmp_path / "events.tmp.jsonl", max_pending=1)
+    journal.open()
+    blocking = journal._file = BlockingFile(journal._file)
+    journal.write([dict(type="flip", time=1.0)])
+    assert blocking.entered.wait(2)  # the writer holds the first batch
+    journal.write([dict(type="flip", time=2.0)])  # fills the buffer
+    assert journal.n_stalls == 0
+    writer = threading.Thread(target=journal.write, args=([dict(type="flip", time=3.0)],))
+    writer.start()
+    wait_for(lambda: journal.n_stalls == 1)
+    assert writer.is_alive()  # blocked rather than dropping the batch
+    blocking.release.set()
+    writer.join(2)
+    assert not writer.is_alive()
+    journal.close()
+    assert [r["time"] for r in read_journal(journal.path)] == [1.0, 2.0, 3.0]
+
+
+def test_write_requires_open_journal(tmp_path):
+    journal = EventJournal(tmp_path / "events.tmp.jsonl")
+    journal.write([])  # empty batches are skipped
+    with pytest.raises(RuntimeError):
+        journal.write([dict(type="flip")])
+
+
+def test_records_are_flushed_within_flush_interval(tmp_path):
+    journal = EventJournal(tmp_path / "events.tmp.jsonl", flush_interval=0.05)
+    journal.open()
+    journal.write([dict(type="flip", time=1.0)])
+    wait_for(lambda: read_journal(journal.path) == [dict(type="flip", time=1.0)])
+    journal.close()
+
+
+def test_records_are_buffered_until_flush_interval(tmp_path):
+    journal = EventJournal(tmp_path / "events.tmp.jsonl", flush_interval=60)
+    journal.open()
+    journal.write([dict(type="flip", time=1.0)])
+    time.sleep(0.1)
+    assert read_journal(journal.path) == []
+    journal.close()
+    assert read_journal(journal.path) == [dict(type="flip", time=1.0)]
+
+
+def test_seal_appends_trailer_and_moves_journal(tmp_path, journal):
+    tmp = journal.path
+    write_trials(journal, 2)
+    path = journal.seal(tmp_path / "events.jsonl")
+    assert path == journal.path and path.is_file() and not tmp.exists()
+    assert not journal.is_open
+    last = json.loads(path.read_bytes().splitlines()[-1])
+    assert last == read_trailer(path)
+    assert last["type"] == "journal_trailer"
+    assert len(read_journal(path)) == last["n_records"] == 4
+
+
+def test_read_trailer_of_unsealed_journal(journal):
+    write_trials(journal, 2)
+    journal.close()
+    assert read_trailer(journal.path) is None
+    assert len(read_journal(journal.path)) == 4
+
+
+def test_read_truncated_journal(journal):
+    write_trials(journal, 2)
+    journal.close()
+    with open(journal.path, "ab") as f:  # a crash in the middle of a record
+        f.write(b'{"type":"flip","ti')
+    assert read_trailer(journal.path) is None
+    assert len(read_journal(journal.path)) == 4
+
+
+def test_read_trailer_of_empty_journal(tmp_path):
+    path = tmp_path / "events.tmp.jsonl"
+    path.touch()
+    assert read_trailer(path) is None
+
+
+class Stub:
+    """Accepts any method call"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+@pytest.mark.skipif(Experiment is None, reason="experiments cannot be imported")
+def test_graceful_exit_seals_journal(tmp_path, journal):
+    clock = Clock()
+    clock.start()
+    experiment = SimpleNamespace(
+        logger=logging.getLogger("test_journal"),
+        event_manager=None,
+        TTLin={},
+        pulse_engine=SimpleNamespace(close=lambda: None, n_edges=0, max_lateness=0),
+        camera=None,
+        dump_trialdata=lambda: None,
+        prefetcher=SimpleNamespace(close=lambda: None, stats={}),
+        stimulus_cache=Stub(),
+        shape_cache=Stub(),
+        clock=clock,
+        journal=journal,
+        events_path=tmp_path / "events.jsonl",
+        running=True,
+    )
+    write_trials(journal, 2)
+    Experiment.graceful_exit(experiment)
+    trailer = read_trailer(experiment.events_path)
+    assert trailer["n_records"] == 5
+    assert sorted(trailer["index"]) == ["1", "2"]
+    records = read_journal(experiment.events_path)
+    assert records[-1]["type"] == "clock_anchor"
+    assert not experiment.running
+    # a second exit leaves the sealed journal as it is
+    sealed = experiment.events_path.read_bytes()
+    Experiment.graceful_exit(experiment)
+    assert experiment.events_path.read_bytes() == sealed
+
+
+class SyncPin:
+    def pulse(self, duration, at=None):
+        return 1.0 if at is None else at
+
+
+@pytest.mark.skipif(Experiment is None, reason="experiments cannot be imported")
+def test_send_sync_marks_trial_start(tmp_path, journal):
+    clock = Clock()
+    clock.start()
+    experiment = SimpleNamespace(
+        params={"sync": {"mode": "barcode", "n_bits": 4}},
+        TTLout={"sync": SyncPin()},
+        clock=clock,
+        events=[],
+        journal=journal,
+    )
+    experiment._record_event = lambda record: Experiment._record_event(experiment, record)
+    for trial in [1, 2]:
+        assert Experiment.send_sync(experiment, trial) == 1.0
+        journal.write([dict(type="flip", label="stim", time=clock.get_time())])
+    path = journal.seal(tmp_path / "events.jsonl")
+    trailer = read_trailer(path)
+    assert sorted(trailer["index"]) == ["1", "2"]
+    with open(path, "rb") as f:
+        f.seek(trailer["index"]["2"])
+        record = json.loads(f.readline())
+    assert record["type"] == "trial_start" and record["sync_onset"] == 1.0
+    assert [r["type"] for r in read_journal(path)] == ["trial_start", "flip"] * 2
+
+
+@pytest.mark.skipif(Experiment is None, reason="experiments cannot be imported")
+def test_camera_clock_offset_is_journaled(tmp_path, journal):
+    clock = Clock()
+    clock.start()
+    recorder = SimpleNamespace(offset=None)
+    recorder.start_trial = lambda trial: setattr(recorder, "offset", 100.0 - trial)
+    experiment = SimpleNamespace(recorder=recorder, clock=clock, events=[], journal=journal)
+    experiment._record_event = lambda record: Experiment._record_event(experiment, record)
+    for trial in [1, 2]:
+        Experiment.start_trial_recording(experiment, trial)
+    records = read_journal(journal.seal(tmp_path / "events.jsonl"))
+    assert [(r["type"], r["trial"], r["offset"]) for r in records] == [
+        ("camera_clock", 1, 99.0),
+        ("camera_clock", 2, 98.0),
+    ]
@@ -0,0 +1,27 @@
+import threading
+
+from marmtouch.experiments.util.cache import LRUCache
+from marmtouch.experiments.util.prefetch import StimulusPrefetcher
+
+
+def test_close_cancels_queued_loads():
+    started = threading.Event()
+    release = threading.Event()
+    loaded = []
+
+    def load(key):
+        started.set()
+        release.wait(5)
+        loaded.append(key)
+        return key
+
+    prefetcher = StimulusPrefetcher(LRUCache(10))
+    for key in range(3):
+        prefetcher.prefetch(key, load, key)
+    started.wait(5)
+    queued = [prefetcher._pending[key] for key in (1, 2)]
+    prefetcher.close()
+    release.set()
+    prefetcher._executor.shutdown(wait=True)
+    assert all(future.cancelled() for future in queued)
+    assert loaded == [0]
@@ -0,0 +1,78 @@
+import errno
+import logging
+
+import pytest
+
+from marmtouch.util.raster_cache import RasterCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RasterCache(tmp_path / "cache", max_bytes=250)
+
+
+def test_round_trip(cache):
+    assert cache.get("ab12") is None
+    cache.put("ab12", b"raster")
+    assert cache.get("ab12") == b"raster"
+
+
+def test_key_changes_with_source_and_params(tmp_path, cache):
+    source = tmp_path / "stim.svg"
+    source.write_text("<svg/>")
+    key = cache.key(source, colour="red", size=(10, 10))
+    assert key == cache.key(source, colour="red", size=(10, 10))
+    assert key != cache.key(source, colour="blue", size=(10, 10))
+    source.write_text("<svg></svg>")
+    assert key != cache.key(source, colour="red", size=(10, 10))
+
+
+def test_overwrite_replaces_entry_size(tmp_path):
+    cache = RasterCache(tmp_path / "cache", max_bytes=1000)
+    cache.put("aa", b"x" * 100)
+    cache.put("aa", b"x" * 120)
+    assert cache.nbytes == 120
+    cache.put("bb", b"x" * 100)
+    assert cache.nbytes == 220
+    assert cache.get("aa") == b"x" * 120 and cache.get("bb") == b"x" * 100
+
+
+def test_evicts_least_recently_used(cache):
+    cache.put("aa", b"x" * 100)
+    cache.put("bb", b"x" * 100)
+    cache.get("aa")
+    cache.put("cc", b"x" * 100)
+    assert cache.nbytes == 200
+    assert cache.get("bb") is None
+    assert cache.get("aa") is not None and cache.get("cc") is not None
+
+
+def test_directory_is_read_once(monkeypatch, tmp_path, cache):
+    cache.put("aa", b"x" * 100)
+    reopened = RasterCache(cache.directory, max_bytes=250)
+    assert reopened.nbytes == 100
+
+    def rescan():
+        raise AssertionError("the cache directory was scanned again")
+
+    monkeypatch.setattr(reopened, "_entries", rescan)
+    for key in ["bb", "cc", "dd", "ee"]:
+        reopened.put(key, b"x" * 100)
+    assert reopened.nbytes == 200
+    assert sorted(p.name for p in cache.directory.glob("*/*")) == ["dd", "ee"]
+
+
+def test_failed_write_is_a_miss(monkeypatch, caplog, cache):
+    cache.put("aa", b"x" * 100)
+
+    def disk_full(src, dst):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr("marmtouch.util.raster_cache.os.replace", disk_full)
+    with caplog.at_level(logging.WARNING, logger="marmtouch.util.raster_cache"):
+        cache.put("bb", b"x" * 100)
+    assert "No space left on device" in caplog.text
+    monkeypatch.undo()
+    assert cache.get("bb") is None
+    assert cache.nbytes == 100
+    assert not list(cache.directory.glob("*/*.tmp"))
@@ -0,0 +1,39 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from marmtouch.util.camera import frame_times_path
+
+try:
+    from marmtouch.scripts.transcode import _ffmetadata, _framerate, _up_to_date
+except (ImportError, OSError) as e:  # e.g. the cairo library is not installed
+    pytest.skip(f"scripts cannot be imported: {e}", allow_module_level=True)
+
+
+def test_ffmetadata_points_to_frame_times(tmp_path):
+    video = tmp_path / "3.h264"
+    frame_times = 10 + np.arange(60) / 30
+    metadata = _ffmetadata(video, frame_times, _framerate(frame_times))
+    comment = next(line for line in metadata.splitlines() if line.startswith("comment="))
+    comment = json.loads(comment[len("comment="):].replace("\\", ""))
+    assert comment["frame_times"] == "3.frames"
+    assert comment["n_frames"] == 60
+    assert comment["first_frame_time"] == 10
+    assert "trial=3" in metadata
+
+
+def test_up_to_date_requires_frame_times_next_to_mp4(tmp_path):
+    video = tmp_path / "session" / "3.h264"
+    output = tmp_path / "mp4" / "3.mp4"
+    video.parent.mkdir()
+    output.parent.mkdir()
+    video.write_bytes(b"video")
+    np.arange(3, dtype=float).tofile(frame_times_path(video))
+    output.write_bytes(b"mp4")
+    assert not _up_to_date(video, output)
+    np.arange(3, dtype=float).tofile(frame_times_path(output))
+    for path in [video, frame_times_path(video)]:
+        os.utime(path, (1, 1))
+    assert _up_to_date(video, output)
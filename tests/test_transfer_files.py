@@ -0,0 +1,159 @@
+import importlib
+import threading
+
+import pytest
+
+from marmtouch.util import archive as archive_module
+from marmtouch.util.archive import read_index, unpack_archive
+
+try:
+    # marmtouch.scripts exports the command under the module's name
+    transfer_files = importlib.import_module("marmtouch.scripts.transfer_files")
+except (ImportError, OSError) as e:  # e.g. the cairo library is not installed
+    pytest.skip(f"scripts cannot be imported: {e}", allow_module_level=True)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(transfer_files, "RETRY_DELAY", 0)
+
+
+def make_session(directory, n_files=4, size=3 * 2**19):
+    directory.mkdir(parents=True)
+    contents = {}
+    for k in range(n_files):
+        data = bytes([k]) * size + f"{directory.name}-{k}".encode()
+        (directory / f"{k}.h264").write_bytes(data)
+        contents[f"{k}.h264"] = data
+    return contents
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    source, dest = tmp_path / "source", tmp_path / "dest"
+    dest.mkdir()
+    return source, dest
+
+
+def fail_copies(monkeypatch, name, n_failures):
+    """Make the copies of `name` fail verification `n_failures` times"""
+    hash_file = transfer_files.hash_file
+    failures = []
+
+    def flaky_hash_file(path):
+        if path.name == name and len(failures) < n_failures:
+            failures.append(path)
+            return "0" * 64
+        return hash_file(path)
+
+    monkeypatch.setattr(transfer_files, "hash_file", flaky_hash_file)
+    return failures
+
+
+def test_concurrent_transfer(monkeypatch, dirs):
+    source, dest = dirs
+    sessions = {f"session{k}": make_session(source / f"session{k}") for k in range(3)}
+    copy_file = transfer_files._copy_file
+    threads = set()
+
+    def recorded_copy_file(*args):
+        threads.add(threading.current_thread().name)
+        return copy_file(*args)
+
+    monkeypatch.setattr(transfer_files, "_copy_file", recorded_copy_file)
+    transfer_files._transfer_sessions(
+        sorted(source.iterdir()), dest, n_sessions=2, n_files=3
+    )
+    assert threads and all(name.startswith("marmtouch-file") for name in threads)
+    for session, contents in sessions.items():
+        assert not (source / session).exists()
+        for name, data in contents.items():
+            assert (dest / session / name).read_bytes() == data
+        manifest = transfer_files._read_manifest(dest / session)
+        assert manifest["complete"]
+        assert sorted(manifest["files"]) == sorted(contents)
+
+
+def test_failed_copy_is_retried(monkeypatch, dirs):
+    source, dest = dirs
+    contents = make_session(source / "session")
+    failures = fail_copies(monkeypatch, "2.h264", transfer_files.RETRIES)
+    transfer_files._transfer_sessions([source / "session"], dest, n_files=2)
+    assert len(failures) == transfer_files.RETRIES
+    assert not (source / "session").exists()
+    for name, data in contents.items():
+        assert (dest / "session" / name).read_bytes() == data
+
+
+def test_corrupted_copy_keeps_source(monkeypatch, dirs):
+    source, dest = dirs
+    contents = make_session(source / "session")
+    fail_copies(monkeypatch, "2.h264", transfer_files.RETRIES + 1)
+    transfer_files._transfer_sessions([source / "session"], dest)
+    remaining = sorted(f.name for f in (source / "session").iterdir())
+    assert remaining == ["2.h264", transfer_files.MANIFEST_NAME]
+    assert (source / "session" / "2.h264").read_bytes() == contents["2.h264"]
+    manifest = transfer_files._read_manifest(source / "session")
+    assert not manifest["complete"]
+    assert sorted(manifest["files"]) == ["0.h264", "1.h264", "3.h264"]
+
+
+def test_interrupted_transfer_is_resumed(monkeypatch, dirs):
+    source, dest = dirs
+    contents = make_session(source / "session")
+    fail_copies(monkeypatch, "2.h264", transfer_files.RETRIES + 1)
+    transfer_files._transfer_sessions([source / "session"], dest)
+    monkeypatch.undo()
+    copied = []
+    copy_file = transfer_files._copy_file
+
+    def recorded_copy_file(source, *args):
+        copied.append(source.name)
+        return copy_file(source, *args)
+
+    monkeypatch.setattr(transfer_files, "_copy_file", recorded_copy_file)
+    monkeypatch.setattr(transfer_files, "RETRY_DELAY", 0)
+    transfer_files._transfer_sessions([source / "session"], dest)
+    assert copied == ["2.h264"]
+    assert not (source / "session").exists()
+    assert [f.name for f in dest.iterdir()] == ["session"]
+    for name, data in contents.items():
+        assert (dest / "session" / name).read_bytes() == data
+    manifest = transfer_files._read_manifest(dest / "session")
+    assert manifest["complete"]
+    assert sorted(manifest["files"]) == sorted(contents)
+
+
+def test_completed_transfer_only_removes_matching_originals(dirs):
+    source, dest = dirs
+    contents = make_session(source / "session")
+    transfer_files._transfer_sessions([source / "session"], dest)
+    # an interrupted cleanup left the manifest and a changed original behind
+    (source / "session").mkdir()
+    transfer_files._write_manifest(
+        source / "session", transfer_files._read_manifest(dest / "session")
+    )
+    (source / "session" / "0.h264").write_bytes(b"rewritten")
+    transfer_files._transfer_sessions([source / "session"], dest)
+    assert (source / "session" / "0.h264").read_bytes() == b"rewritten"
+    assert (dest / "session" / "0.h264").read_bytes() == contents["0.h264"]
+
+
+def test_archive_transfer(dirs):
+    source, dest = dirs
+    contents = make_session(source / "session")
+    transfer_files._transfer_sessions([source / "session"], dest, archive=True, compression="gz")
+    assert not (source / "session").exists()
+    archive = dest / "session.tar.gz"
+    index = read_index(archive)
+    assert sorted(index["files"]) == sorted(contents)
+    assert unpack_archive(archive, verify_only=True) == []
+
+
+def test_corrupted_archive_keeps_source(monkeypatch, dirs):
+    source, dest = dirs
+    contents = make_session(source / "session")
+    monkeypatch.setattr(archive_module, "hash_file", lambda path: "0" * 64)
+    transfer_files._transfer_sessions([source / "session"], dest, archive=True)
+    assert sorted(f.name for f in (source / "session").iterdir()) == sorted(contents)
+    assert not (dest / "session.tar").exists()